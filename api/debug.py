@@ -0,0 +1,316 @@
+import asyncio
+import gc
+import os
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, OrderedDict
+
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from core import metrics
+from core.config import settings
+from core.log import (
+    get_logger,
+    logger_levels,
+    parse_level,
+    sync_levels,
+    update_levels_file,
+)
+from core.tasks import running_tasks
+from service.debug_profiles import (
+    PROFILE_ID_HEADER,
+    load_profile,
+    profiles_dir,
+    save_profile,
+    token_valid,
+)
+from utils.proc_utils import read_memory_status
+from utils.profiler import (
+    DEFAULT_INTERVAL,
+    SamplingProfiler,
+    to_collapsed,
+    to_speedscope,
+)
+
+logger = get_logger(__name__)
+
+router = APIRouter()
+
+PROFILE_FORMATS = ("collapsed", "speedscope", "json")
+MAX_SNAPSHOTS = 5
+SNAPSHOT_GROUPING = ("lineno", "filename", "traceback")
+# Служебные аллокации самого tracemalloc и импорта модулей неинтересны
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+# Снимки tracemalloc живут в памяти воркера, который их сделал
+_snapshots: OrderedDict[str, tuple[float, tracemalloc.Snapshot]] = OrderedDict()
+
+
+async def verify_debug_token(x_debug_token: str | None = Header(None)):
+    if not settings.debug_token:
+        raise HTTPException(status_code=404, detail="Debug API is disabled")
+    if not token_valid(x_debug_token):
+        raise HTTPException(status_code=403, detail="Invalid debug token")
+
+
+def _format_profile(result: dict, fmt: str):
+    if fmt == "collapsed":
+        return PlainTextResponse(
+            to_collapsed(result), headers={PROFILE_ID_HEADER: result["id"]}
+        )
+    if fmt == "speedscope":
+        return to_speedscope(result)
+    return result
+
+
+@router.get("/profile", dependencies=[Depends(verify_debug_token)])
+async def profile(
+    seconds: float = Query(5.0, gt=0),
+    interval: float = Query(DEFAULT_INTERVAL, ge=0.001, le=1.0),
+    format: str = Query("collapsed", enum=list(PROFILE_FORMATS)),
+):
+    """
+    Профилирует текущий воркер seconds секунд и возвращает стеки.
+
+    Запрос обслуживает один воркер gunicorn - его pid есть в результате
+    (format=json); профиль сохраняется и доступен по /profiles/{id}.
+    """
+    if seconds > settings.profile_max_seconds:
+        raise HTTPException(
+            status_code=422,
+            detail=f"seconds must be <= {settings.profile_max_seconds}",
+        )
+    try:
+        profiler = SamplingProfiler(interval)
+        await asyncio.to_thread(profiler.run_for, seconds)
+        profile_id = uuid.uuid4().hex
+        result = profiler.result(f"worker {os.getpid()}, {seconds}s")
+        await asyncio.to_thread(save_profile, profile_id, result)
+        return _format_profile(dict(result, id=profile_id, pid=os.getpid()), format)
+    except Exception as e:
+        logger.error(f"error = {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/profiles", dependencies=[Depends(verify_debug_token)])
+async def list_profiles():
+    try:
+        directory = profiles_dir()
+        if not os.path.isdir(directory):
+            return {"profiles": []}
+        entries = sorted(
+            (entry for entry in os.scandir(directory) if entry.name.endswith(".json")),
+            key=lambda entry: entry.stat().st_mtime,
+            reverse=True,
+        )
+        return {
+            "profiles": [
+                {"id": entry.name[: -len(".json")], "created_at": entry.stat().st_mtime}
+                for entry in entries
+            ]
+        }
+    except Exception as e:
+        logger.error(f"error = {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/profiles/{profile_id}", dependencies=[Depends(verify_debug_token)])
+async def get_profile(
+    profile_id: str, format: str = Query("collapsed", enum=list(PROFILE_FORMATS))
+):
+    result = load_profile(profile_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return _format_profile(result, format)
+
+
+def _thread_counts() -> dict[str, int]:
+    """Потоки по имени без номера: ThreadPoolExecutor-0_3 -> ThreadPoolExecutor."""
+    names = (re.sub(r"[-_]\d+(_\d+)?", "", t.name) for t in threading.enumerate())
+    return dict(Counter(names))
+
+
+def _workers_rss() -> dict[str, int]:
+    merged = metrics.collect_all()
+    samples = merged.get(metrics.WORKER_RSS.name, {}).get("samples", {})
+    return {pid: int(value) for (pid,), value in samples.items()}
+
+
+@router.get("/memory", dependencies=[Depends(verify_debug_token)])
+async def memory():
+    """
+    Память текущего воркера (RSS, пиковый RSS), RSS всех воркеров,
+    потоки, asyncio-задачи (в т.ч. не отслеживаемые core.tasks.spawn)
+    и состояние tracemalloc.
+    """
+    try:
+        metrics.update_process_metrics()
+        all_tasks = len(asyncio.all_tasks())
+        tracked = running_tasks()
+        ret_obj = {
+            "pid": os.getpid(),
+            "memory": read_memory_status(),
+            "workers_rss": await asyncio.to_thread(_workers_rss),
+            "threads": _thread_counts(),
+            "asyncio_tasks": {
+                "total": all_tasks,
+                "tracked": tracked,
+                # текущий запрос и прочие задачи, созданные напрямую
+                "untracked": all_tasks - sum(tracked.values()),
+            },
+            "gc": {"counts": gc.get_count(), "objects": len(gc.get_objects())},
+            "tracemalloc": {"tracing": tracemalloc.is_tracing()},
+        }
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            ret_obj["tracemalloc"].update(
+                {
+                    "frames": tracemalloc.get_traceback_limit(),
+                    "traced": current,
+                    "peak": peak,
+                    "snapshots": list(_snapshots),
+                }
+            )
+        return ret_obj
+    except Exception as e:
+        logger.error(f"error = {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/memory/tracemalloc/start", dependencies=[Depends(verify_debug_token)])
+async def tracemalloc_start(frames: int = Query(10, ge=1, le=100)):
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _snapshots.clear()
+    tracemalloc.start(frames)
+    logger.info(f"tracemalloc started in worker {os.getpid()} ({frames} frames)")
+    return {"response": "OK", "pid": os.getpid()}
+
+
+@router.post("/memory/tracemalloc/stop", dependencies=[Depends(verify_debug_token)])
+async def tracemalloc_stop():
+    tracemalloc.stop()
+    _snapshots.clear()
+    logger.info(f"tracemalloc stopped in worker {os.getpid()}")
+    return {"response": "OK", "pid": os.getpid()}
+
+
+def _take_snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+
+
+def _format_stat(stat, group_by: str) -> dict:
+    frames = stat.traceback if group_by == "traceback" else stat.traceback[:1]
+    site = {
+        "site": [f"{frame.filename}:{frame.lineno}" for frame in frames],
+        "size": stat.size,
+        "count": stat.count,
+    }
+    if isinstance(stat, tracemalloc.StatisticDiff):
+        site.update({"size_diff": stat.size_diff, "count_diff": stat.count_diff})
+    return site
+
+
+def _get_snapshot(snapshot_id: str) -> tracemalloc.Snapshot:
+    if snapshot_id not in _snapshots:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Snapshot {snapshot_id} is not held by worker {os.getpid()}; "
+            f"snapshots are per worker, retry until the request reaches it",
+        )
+    return _snapshots[snapshot_id][1]
+
+
+@router.post("/memory/snapshots", dependencies=[Depends(verify_debug_token)])
+async def take_snapshot(
+    limit: int = Query(20, ge=1, le=500),
+    group_by: str = Query("lineno", enum=list(SNAPSHOT_GROUPING)),
+):
+    """Снимок tracemalloc текущего воркера и top-N мест аллокаций."""
+    if not tracemalloc.is_tracing():
+        raise HTTPException(status_code=409, detail="tracemalloc is not tracing")
+    try:
+        snapshot = await asyncio.to_thread(_take_snapshot)
+        snapshot_id = uuid.uuid4().hex
+        _snapshots[snapshot_id] = (time.time(), snapshot)
+        while len(_snapshots) > MAX_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+        stats = snapshot.statistics(group_by)
+        return {
+            "id": snapshot_id,
+            "pid": os.getpid(),
+            "total": sum(stat.size for stat in stats),
+            "top": [_format_stat(stat, group_by) for stat in stats[:limit]],
+        }
+    except Exception as e:
+        logger.error(f"error = {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get(
+    "/memory/snapshots/{snapshot_id}/diff", dependencies=[Depends(verify_debug_token)]
+)
+async def diff_snapshot(
+    snapshot_id: str,
+    against: str | None = Query(None, description="id снимка (по умолчанию - сейчас)"),
+    limit: int = Query(20, ge=1, le=500),
+    group_by: str = Query("lineno", enum=list(SNAPSHOT_GROUPING)),
+):
+    """Что выросло с момента снимка snapshot_id: top-N по приросту памяти."""
+    base = _get_snapshot(snapshot_id)
+    if against is not None:
+        current = _get_snapshot(against)
+    elif tracemalloc.is_tracing():
+        current = await asyncio.to_thread(_take_snapshot)
+    else:
+        raise HTTPException(status_code=409, detail="tracemalloc is not tracing")
+    try:
+        stats = current.compare_to(base, group_by)
+        return {
+            "pid": os.getpid(),
+            "size_diff": sum(stat.size_diff for stat in stats),
+            "top": [_format_stat(stat, group_by) for stat in stats[:limit]],
+        }
+    except Exception as e:
+        logger.error(f"error = {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/log-levels", dependencies=[Depends(verify_debug_token)])
+async def get_log_levels():
+    """Уровни логгеров приложения в этом воркере (заданный и действующий)."""
+    return {"pid": os.getpid(), "loggers": logger_levels()}
+
+
+@router.put("/log-levels", dependencies=[Depends(verify_debug_token)])
+async def put_log_levels(levels: dict[str, str | None] = Body(...)):
+    """
+    Меняет уровни логгеров во время работы, например
+    {"service.netplan": "DEBUG", "utils.cmd_utils": null}; null возвращает
+    уровень по умолчанию.
+
+    Уровни сохраняются в общий файл (settings.log_levels_file): этот воркер
+    применяет их сразу, остальные - в течение log_levels_sync_interval секунд.
+    """
+    for level in levels.values():
+        if level is not None:
+            try:
+                parse_level(level)
+            except ValueError as e:
+                raise HTTPException(status_code=422, detail=str(e))
+    try:
+        await asyncio.to_thread(update_levels_file, settings.log_levels_file, levels)
+        sync_levels(settings.log_levels_file)
+        return {"pid": os.getpid(), "loggers": logger_levels()}
+    except Exception as e:
+        logger.error(f"error = {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,15 +1,21 @@
-import io
-import threading
+import asyncio
 
-import simplejson as json
 import yaml  # PyYAML
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi.encoders import jsonable_encoder
 
-from core.log import logger
+from core.config import settings
+from core.log import LazyJson, get_logger
 from model import models
+from service.apply_scheduler import ApplyScheduler, get_apply_scheduler
+from service.apply_try import take_snapshot
+from service.file_locks import get_file_locks
 from service.netplan import NetplanService, get_netplan_service
-from utils.os_utils import delayed_netplan_change
+from service.netplan_diff import apply_scope
+from service.netplan_repo import NetplanRepository, get_netplan_repo
+from service.netplan_validation import ensure_valid
+
+logger = get_logger(__name__)
 
 
 router = APIRouter()
@@ -27,14 +33,62 @@ async def get_interfaces1(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/config_cache_stats")
+async def config_cache_stats(
+    netplan_repo: NetplanRepository = Depends(get_netplan_repo),
+):
+    return netplan_repo.stats()
+
+
+@router.get("/apply_status")
+async def apply_status_list(
+    apply_scheduler: ApplyScheduler = Depends(get_apply_scheduler),
+):
+    return await asyncio.to_thread(apply_scheduler.list_jobs)
+
+
+@router.get("/apply_status/{job_id}")
+async def apply_status(
+    job_id: str,
+    apply_scheduler: ApplyScheduler = Depends(get_apply_scheduler),
+):
+    job = await asyncio.to_thread(apply_scheduler.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Apply job not found")
+    return job
+
+
+@router.post("/apply_confirm/{job_id}")
+async def apply_confirm(
+    job_id: str,
+    apply_scheduler: ApplyScheduler = Depends(get_apply_scheduler),
+):
+    """
+    Подтверждает пробное применение (try_apply=true&confirm=true): клиент
+    вызывает его по новой конфигурации, иначе по истечении
+    APPLY_TRY_TIMEOUT она откатывается.
+    """
+    try:
+        job = await asyncio.to_thread(apply_scheduler.confirm, job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Apply job not found")
+    return {"response": "OK", "job_id": job_id}
+
+
 @router.post("/submitBridge")
-async def submitBridge(data: models.SubmitBridge):
+async def submitBridge(
+    data: models.SubmitBridge,
+    try_apply: bool = False,
+    confirm: bool = False,
+    netplan_repo: NetplanRepository = Depends(get_netplan_repo),
+    apply_scheduler: ApplyScheduler = Depends(get_apply_scheduler),
+):
     try:
-        debug = False
         data = jsonable_encoder(data)
 
-        if debug:
-            logger.debug(f"submitBridge >> data = {json.dumps(data)}")
+        logger.debug("submitBridge >> data = %s", LazyJson(data))
 
         # create netplan objects (https://netplan.io/)
         netplan_bridge = {
@@ -57,192 +111,191 @@ async def submitBridge(data: models.SubmitBridge):
                 "set-name": "eth1",
             },
         }
-        if debug:
-            logger.debug("netplan_bridge = " + json.dumps(netplan_bridge))
-
-        # get netplan file
-        with open(NETPLAN, "r") as stream:
-            try:
-                netplan_config = yaml.safe_load(stream)
-                if debug:
-                    logger.debug("netplan_config = " + json.dumps(netplan_config))
-                stream.close()
-            except yaml.YAMLError as e:
-                logger.error(f"error = {str(e)}")
-                raise HTTPException(status_code=500, detail=str(e))
-
-        # update netplan file
-        netplan_config["network"]["bridges"] = netplan_bridge
-        netplan_config["network"]["ethernets"] = netplan_ethernet
-
         # remove unused values
         if not data["gateway"]:
-            del netplan_config["network"]["bridges"]["br0"]["routes"]
-            del netplan_config["network"]["bridges"]["br0"]["nameservers"]
-
-        # write netplan changes
-        with io.open(NETPLAN, "w", encoding="utf8") as outfile:
-            yaml.dump(
-                netplan_config, outfile, default_flow_style=False, allow_unicode=True
+            del netplan_bridge["br0"]["routes"]
+            del netplan_bridge["br0"]["nameservers"]
+        logger.debug("netplan_bridge = %s", LazyJson(netplan_bridge))
+
+        def update_network(network):
+            network["bridges"] = netplan_bridge
+            network["ethernets"] = netplan_ethernet
+
+        # read-modify-write под блокировкой файла (между воркерами тоже);
+        # чтение, проверка и запись - в потоке
+        async with get_file_locks().lock([settings.netplan_eth]):
+            diff, snapshot = await asyncio.to_thread(
+                _update_eth_config, netplan_repo, update_network, try_apply
             )
 
-        # apply changes
-        thr = threading.Thread(target=delayed_netplan_change)
-        thr.start()
+            # apply changes
+            job_id = (
+                await asyncio.to_thread(
+                    apply_scheduler.submit,
+                    "submitBridge",
+                    interfaces=apply_scope(diff),
+                    snapshot=snapshot,
+                    confirm=confirm,
+                    changed=diff["interfaces"],
+                )
+                if diff["changed"]
+                else None
+            )
 
-        return {"response": "OK"}
+        return {"response": "OK", "job_id": job_id, "diff": diff}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"error = {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/submitEth1")
-async def submitEth1(data: models.SubmitEth):
+async def submitEth1(
+    data: models.SubmitEth,
+    try_apply: bool = False,
+    confirm: bool = False,
+    netplan_repo: NetplanRepository = Depends(get_netplan_repo),
+    apply_scheduler: ApplyScheduler = Depends(get_apply_scheduler),
+):
+    return await _submit_eth(
+        data,
+        "eth0",
+        "submitEth1",
+        netplan_repo,
+        apply_scheduler,
+        try_apply,
+        confirm,
+    )
+
+
+@router.post("/submitEth2")
+async def submitEth2(
+    data: models.SubmitEth,
+    try_apply: bool = False,
+    confirm: bool = False,
+    netplan_repo: NetplanRepository = Depends(get_netplan_repo),
+    apply_scheduler: ApplyScheduler = Depends(get_apply_scheduler),
+):
+    return await _submit_eth(
+        data,
+        "eth1",
+        "submitEth2",
+        netplan_repo,
+        apply_scheduler,
+        try_apply,
+        confirm,
+    )
+
+
+async def _submit_eth(
+    data: models.SubmitEth,
+    iface: str,
+    reason: str,
+    netplan_repo: NetplanRepository,
+    apply_scheduler: ApplyScheduler,
+    try_apply: bool = False,
+    confirm: bool = False,
+):
     try:
-        debug = True
         data = jsonable_encoder(data)
 
-        if debug:
-            logger.debug(f"data = {json.dumps(data)}")
+        logger.debug("data = %s", LazyJson(data))
 
         # create netplan objects (https://netplan.io/)
-        if data["dhcp"]:
-            netplan_eth1 = {
-                "dhcp4": True,
-                "dhcp6": False,
-                "match": {"macaddress": data["mac"]},
-                "set-name": "eth0",
-            }
-        else:
-            netplan_eth1 = {
-                "dhcp4": False,
-                "dhcp6": False,
-                "match": {"macaddress": data["mac"]},
-                "set-name": "eth0",
-                "routes": [{"to": "default", "via": data["gateway"]}],
-                "addresses": data["addresses"],
-                "nameservers": {"addresses": data["nameservers"]},
-            }
-        if debug:
-            logger.debug("netplan_eth1 = " + json.dumps(netplan_eth1))
-
-        # get netplan file
-        with open(NETPLAN, "r") as stream:
-            try:
-                netplan_config = yaml.safe_load(stream)  # dictionary, not list
-                if debug:
-                    logger.debug("netplan_config = " + json.dumps(netplan_config))
-                stream.close()
-            except yaml.YAMLError as e:
-                logger.error(f"error = {str(e)}")
-                raise HTTPException(status_code=500, detail=str(e))
-
-        # update netplan file
-        if "ethernets" in netplan_config["network"]:
-            netplan_config["network"]["ethernets"]["eth0"] = netplan_eth1
-        else:
-            netplan_config["network"]["ethernets"] = {}
-            netplan_config["network"]["ethernets"]["eth0"] = netplan_eth1
-
-        # remove unused values
-        if data["deleteEth"]:
-            if "ethernets" in netplan_config["network"]:
-                if "eth0" in netplan_config["network"]["ethernets"]:
-                    del netplan_config["network"]["ethernets"]["eth0"]
-        else:
-            if "bridges" in netplan_config["network"]:
-                del netplan_config["network"]["bridges"]
-            if not data["gateway"]:
-                if "routes" in netplan_config["network"]["ethernets"]["eth0"]:
-                    del netplan_config["network"]["ethernets"]["eth0"]["routes"]
-
-        # write netplan changes
-        with io.open(NETPLAN, "w", encoding="utf8") as outfile:
-            yaml.dump(
-                netplan_config, outfile, default_flow_style=False, allow_unicode=True
+        netplan_eth = NetplanService.build_ethernet(
+            iface,
+            mac=data["mac"],
+            dhcp=data["dhcp"],
+            gateway=data["gateway"],
+            addresses=data["addresses"],
+            nameservers=data["nameservers"],
+        )
+        logger.debug("netplan_%s = %s", iface, LazyJson(netplan_eth))
+
+        def update_network(network):
+            ethernets = network.setdefault("ethernets", {})
+            if data["deleteEth"]:
+                ethernets.pop(iface, None)
+            else:
+                ethernets[iface] = netplan_eth
+                network.pop("bridges", None)
+
+        # read-modify-write под блокировкой файла (между воркерами тоже);
+        # чтение, проверка и запись - в потоке
+        async with get_file_locks().lock([settings.netplan_eth]):
+            diff, snapshot = await asyncio.to_thread(
+                _update_eth_config, netplan_repo, update_network, try_apply
             )
 
-        # apply changes
-        thr = threading.Thread(target=delayed_netplan_change)
-        thr.start()
+            # apply changes
+            job_id = (
+                await asyncio.to_thread(
+                    apply_scheduler.submit,
+                    reason,
+                    interfaces=apply_scope(diff),
+                    snapshot=snapshot,
+                    confirm=confirm,
+                    changed=diff["interfaces"],
+                )
+                if diff["changed"]
+                else None
+            )
 
-        return {"response": "OK"}
+        return {"response": "OK", "job_id": job_id, "diff": diff}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"error = {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/submitEth2")
-async def submitEth2(data: models.SubmitEth):
+def _update_eth_config(
+    netplan_repo: NetplanRepository, update_network, try_apply: bool
+) -> tuple[dict, dict | None]:
+    """
+    Read-modify-write settings.netplan_eth (вызывается в потоке под
+    блокировкой файла): update_network(network) меняет секцию network.
+
+    :return: (разница конфигураций, снимок для отката или None).
+    """
+    # get netplan file
     try:
-        debug = True
-        data = jsonable_encoder(data)
+        netplan_config = netplan_repo.load(settings.netplan_eth)
+        logger.debug("netplan_config = %s", LazyJson(netplan_config))
+    except yaml.YAMLError as e:
+        logger.error(f"error = {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        if debug:
-            logger.debug(f"data = {json.dumps(data)}")
+    # update netplan file (файла может ещё не быть)
+    netplan_config = netplan_config or {}
+    update_network(NetplanService.ensure_network(netplan_config))
 
-        # create netplan objects (https://netplan.io/)
-        if data["dhcp"]:
-            netplan_eth2 = {
-                "dhcp4": True,
-                "dhcp6": False,
-                "match": {"macaddress": data["mac"]},
-                "set-name": "eth1",
-            }
-        else:
-            netplan_eth2 = {
-                "dhcp4": False,
-                "dhcp6": False,
-                "match": {"macaddress": data["mac"]},
-                "set-name": "eth1",
-                "routes": [{"to": "default", "via": data["gateway"]}],
-                "addresses": data["addresses"],
-                "nameservers": {"addresses": data["nameservers"]},
-            }
-        if debug:
-            logger.debug("netplan_eth2 = " + json.dumps(netplan_eth2))
-
-        # get netplan file
-        with open(NETPLAN, "r") as stream:
-            try:
-                netplan_config = yaml.safe_load(stream)
-                if debug:
-                    logger.debug("netplan_config = " + json.dumps(netplan_config))
-                stream.close()
-            except yaml.YAMLError as e:
-                logger.error(f"error = {str(e)}")
-                raise HTTPException(status_code=500, detail=str(e))
-
-        # update netplan file
-        if "ethernets" in netplan_config["network"]:
-            netplan_config["network"]["ethernets"]["eth1"] = netplan_eth2
-        else:
-            netplan_config["network"]["ethernets"] = {}
-            netplan_config["network"]["ethernets"]["eth1"] = netplan_eth2
+    # validate before write (422 со списком ошибок)
+    ensure_valid({settings.netplan_eth: netplan_config})
 
-        # remove unused values
-        if data["deleteEth"]:
-            if "ethernets" in netplan_config["network"]:
-                if "eth1" in netplan_config["network"]["ethernets"]:
-                    del netplan_config["network"]["ethernets"]["eth1"]
-        else:
-            if "bridges" in netplan_config["network"]:
-                del netplan_config["network"]["bridges"]
-            if not data["gateway"]:
-                if "routes" in netplan_config["network"]["ethernets"]["eth1"]:
-                    del netplan_config["network"]["ethernets"]["eth1"]["routes"]
-
-        # write netplan changes
-        with io.open(NETPLAN, "w", encoding="utf8") as outfile:
-            yaml.dump(
-                netplan_config, outfile, default_flow_style=False, allow_unicode=True
-            )
+    # snapshot for rollback (пробное применение)
+    snapshot = take_snapshot([settings.netplan_eth]) if try_apply else None
+
+    # write netplan changes (если конфигурация по смыслу изменилась)
+    return netplan_repo.update(settings.netplan_eth, netplan_config), snapshot
 
-        # apply changes
-        thr = threading.Thread(target=delayed_netplan_change)
-        thr.start()
 
-        return {"response": "OK"}
+@router.post("/submitNetwork")
+async def submitNetwork(
+    data: models.NetworkState,
+    try_apply: bool = False,
+    confirm: bool = False,
+    netplan_service: NetplanService = Depends(get_netplan_service),
+):
+    """
+    Применяет желаемое состояние сразу для нескольких ethernet, bridge и
+    Wi-Fi интерфейсов: одна проверка, одна запись на файл, один netplan apply.
+    """
+    try:
+        return await netplan_service.apply_network_state(data, try_apply, confirm)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"error = {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,10 +1,19 @@
+import asyncio
 import subprocess
+from typing import List
 
 import simplejson as json
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 
-from core.config import logger
+from core.config import settings
+from core.log import LazyJson, get_logger
 from model.models import InterfaceName
+from service.stats_sampler import get_stats_sampler
+from utils.netlink import format_ip_a, get_network_snapshot
+from utils.sysfs_utils import read_operstate
+
+logger = get_logger(__name__)
 
 router = APIRouter()
 
@@ -13,12 +22,15 @@ router = APIRouter()
 async def get_ip_a():
     try:
         # test: http://localhost:8080/get_ip_a
-        debug = False
         ret_obj = {}
 
-        ret_obj["response"] = subprocess.getoutput("ip a")
-        if debug:
-            logger.info(f"ret_obj = {json.dumps(ret_obj)}")
+        # Совместимость: текст в формате `ip a`, построенный из снимка netlink
+        try:
+            ret_obj["response"] = format_ip_a(get_network_snapshot())
+        except OSError as e:
+            logger.warning(f"netlink is not available, falling back to `ip a`: {e}")
+            ret_obj["response"] = subprocess.getoutput("ip a")
+        logger.debug("ret_obj = %s", LazyJson(ret_obj))
 
         return ret_obj
     except Exception as e:
@@ -26,6 +38,47 @@ async def get_ip_a():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/get_ip_state")
+async def get_ip_state(
+    iface: List[str] | None = Query(None, description="Интерфейсы (по умолчанию все)"),
+    fields: List[str] | None = Query(
+        None,
+        description="Поля интерфейса: index, flags, mtu, qdisc, state, "
+        "link_type, mac, broadcast, master, addresses",
+    ),
+    routes: bool = Query(True, description="Включить маршруты основной таблицы"),
+):
+    """Структурированный снимок сетевого состояния (rtnetlink, без `ip a`)."""
+    try:
+        snapshot = get_network_snapshot()
+    except OSError as e:
+        logger.error(f"error = {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    interfaces = snapshot["interfaces"]
+    if iface:
+        unknown = [name for name in iface if name not in interfaces]
+        if unknown:
+            raise HTTPException(
+                status_code=404, detail=f"Interface not found: {', '.join(unknown)}"
+            )
+        interfaces = {name: interfaces[name] for name in iface}
+    if fields:
+        interfaces = {
+            name: {key: value for key, value in link.items() if key in fields}
+            for name, link in interfaces.items()
+        }
+
+    ret_obj = {"interfaces": interfaces}
+    if routes:
+        ret_obj["routes"] = [
+            route
+            for route in snapshot["routes"]
+            if not iface or route["dev"] in iface
+        ]
+    return ret_obj
+
+
 @router.get("/get_status_iface")
 async def get_status_iface(
     iface: InterfaceName = Query(
@@ -34,16 +87,59 @@ async def get_status_iface(
 ):
     try:
         # test: http://localhost:8080/get_eth0_status
-        debug = False
         ret_obj = {}
 
-        ret_obj["response"] = subprocess.getoutput(
-            f"grep '' /sys/class/net/{iface}/operstate"
-        )
-        if debug:
-            logger.info(f"ret_obj = {json.dumps(ret_obj)}")
+        ret_obj["response"] = read_operstate(iface.value)
+        logger.debug("ret_obj = %s", LazyJson(ret_obj))
 
         return ret_obj
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Interface {iface.value} not found")
     except Exception as e:
         logger.error(f"error = {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/stats")
+async def get_stats(
+    iface: List[str] | None = Query(None, description="Интерфейсы (по умолчанию все)"),
+):
+    """Текущие счётчики и состояние интерфейсов из /sys/class/net."""
+    snapshot = get_stats_sampler().sample()
+    if iface:
+        snapshot = {name: stats for name, stats in snapshot.items() if name in iface}
+    return {"interfaces": snapshot}
+
+
+@router.get("/stats_stream")
+async def stats_stream(
+    request: Request,
+    interval: float = Query(1.0, gt=0, description="Период отправки, секунды"),
+    iface: List[str] | None = Query(None, description="Интерфейсы (по умолчанию все)"),
+):
+    """
+    Server-Sent Events: состояние и скорости rx/tx интерфейсов с периодом interval.
+    Все подписчики воркера обслуживаются одним общим циклом чтения sysfs.
+    """
+    sampler = get_stats_sampler()
+
+    async def stream():
+        subscription = sampler.subscribe(interval, iface)
+        try:
+            while not await request.is_disconnected():
+                try:
+                    snapshot = await asyncio.wait_for(
+                        subscription.queue.get(), settings.sse_keepalive
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: stats\ndata: {json.dumps(snapshot)}\n\n"
+        finally:
+            sampler.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -4,7 +4,9 @@ from fastapi import APIRouter, HTTPException
 
 from utils.os_utils import delayed_reboot, delayed_shutdown
 
-from core.log import logger
+from core.log import get_logger
+
+logger = get_logger(__name__)
 
 router = APIRouter()
 
@@ -1,50 +1,226 @@
 # api/wifi.py
 
 import asyncio
+import time
+from functools import lru_cache
+
+import simplejson as json
+from fastapi import APIRouter, HTTPException, Form, Depends, Request, Query
+from fastapi.responses import (
+    HTMLResponse,
+    JSONResponse,
+    RedirectResponse,
+    StreamingResponse,
+)
 
-from fastapi import APIRouter, HTTPException, Form, Depends, Request
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
-
-from core.config import settings, logger
+from core.config import settings
+from core.log import get_logger
+from core.tasks import spawn
 from model.models import BaseWiFiData, UpdateWiFiData
 from service.netplan import NetplanService, get_netplan_service
+from service.netplan_diff import apply_scope
+from service.nm_monitor import get_connection_watcher, is_wifi_connected_to_async
+from service.state_store import StateStore, get_state_store
 from utils.ip_utils import (
+    get_all_ip_addresses,
     get_net_iface,
-    get_wifi_ssids,
-    get_current_wifi_info,
-    get_available_wifi,
-    is_wifi_connected,
-    disconnect_wifi,
-    connection_wifi_up,
+    get_wifi_ssids_async,
+    get_current_wifi_info_async,
+    disconnect_wifi_async,
+    invalidate_wifi_scan,
 )
 
+logger = get_logger(__name__)
+
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
 
-connected_flag = False
+
+@lru_cache()
+def get_templates():
+    # jinja2 импортируется и окружение шаблонов создаётся при первой отрисовке
+    from fastapi.templating import Jinja2Templates
+
+    return Jinja2Templates(directory="templates")
+
+
+# События попытки подключения, после которых поток SSE закрывается
+FINAL_EVENTS = ("connected", "failed")
+
+APPLY_EVENTS = {
+    "running": "apply_started",
+    "done": "apply_finished",
+    "failed": "apply_failed",
+}
 
 
-async def wait_for_connection(iwface: str):
-    """Функция ожидания подключения Wi-Fi."""
-    global connected_flag
+def _apply_listener(attempt_id: str):
+    """
+    Пишет этапы netplan apply в события попытки подключения (вызывается из
+    потока планировщика, не из event loop).
+    """
+    store = get_state_store()
+
+    def listener(job):
+        event = APPLY_EVENTS.get(job["state"])
+        if event:
+            store.add_wifi_event(attempt_id, event, job["id"])
+
+    return listener
+
+
+def _needs_apply(diff: dict, iwface: str, ssid: str) -> bool:
+    """
+    netplan apply нужен, если конфигурация изменилась или интерфейс сейчас
+    не подключён к этой сети (повторная отправка формы после обрыва).
+    """
+    return diff["changed"] or not get_connection_watcher().is_connected(iwface, ssid)
 
-    for _ in range(15):
-        if is_wifi_connected():
-            connected_flag = True
-            break
-        await asyncio.sleep(1)
+
+def _apply_interfaces(diff: dict, iwface: str) -> list[str] | None:
+    """
+    Интерфейсы для scoped apply: при неизменной конфигурации достаточно
+    заново поднять соединение iwface.
+    """
+    return apply_scope(diff) if diff["changed"] else [iwface]
+
+
+def _nm_lifecycle_event(event: str) -> str | None:
+    if event.startswith("connecting (getting IP configuration)"):
+        return "getting_ip"
+    if event.startswith("connecting"):
+        return "associating"
+    return None
+
+
+async def wait_for_connection(
+    attempt_id: str, iwface: str, ssid: str, fresh: bool = False
+):
+    """
+    Функция ожидания подключения Wi-Fi.
+
+    Ждёт события NetworkManager о подключении iwface к ssid; если монитор
+    событий не запущен, раз в секунду опрашивает состояние iwface. Этапы и
+    результат записываются в общий StateStore, чтобы их видел любой воркер.
+    """
+    store = get_state_store()
+    last_event = None
+    # on_event вызывается синхронно из event loop: запись в StateStore уходит
+    # в поток, а цепочка задач сохраняет порядок событий
+    written: asyncio.Task | None = None
+
+    async def write_after(previous, lifecycle, event):
+        if previous is not None:
+            await previous
+        await asyncio.to_thread(store.add_wifi_event, attempt_id, lifecycle, event)
+
+    def on_event(event):
+        nonlocal last_event, written
+        lifecycle = _nm_lifecycle_event(event)
+        if lifecycle and lifecycle != last_event:
+            last_event = lifecycle
+            written = spawn(write_after(written, lifecycle, event), "wifi_event")
+
+    connected = False
+    watcher = get_connection_watcher()
+    if watcher.running:
+        connected = await watcher.wait_for(
+            iwface, ssid, settings.wifi_connect_timeout, fresh, on_event
+        )
     else:
-        connected_flag = False
+        for _ in range(int(settings.wifi_connect_timeout)):
+            if await is_wifi_connected_to_async(iwface, ssid):
+                connected = True
+                break
+            await asyncio.sleep(1)
+    if written is not None:
+        await written
+    if connected:
+        ip_addresses = get_all_ip_addresses(iwface)
+        await asyncio.to_thread(
+            store.add_wifi_event, attempt_id, "ip_acquired", ",".join(ip_addresses)
+        )
+    status = "connected" if connected else "failed"
+    await asyncio.to_thread(store.set_wifi_attempt_status, attempt_id, status)
+    invalidate_wifi_scan()
+
+
+def _loading_context(request, attempt_id: str) -> dict:
+    return {
+        "request": request,
+        "check_url": f"/api/wifi/checkConnection?attempt={attempt_id}",
+        "events_url": f"/api/wifi/connectionEvents?attempt={attempt_id}",
+        "redirect_url": "/api/wifi/getWiFi",
+        "attempt_count": 0,
+    }
 
 
 @router.get("/checkConnection", response_class=JSONResponse)
-async def check_connection():
-    # if is_wifi_connected():
-    if connected_flag:
+async def check_connection(
+    attempt: str | None = Query(None, description="id попытки подключения"),
+    iface: str | None = Query(None, description="Wi-Fi интерфейс"),
+    state_store: StateStore = Depends(get_state_store),
+):
+    if attempt:
+        wifi_attempt = await asyncio.to_thread(state_store.get_wifi_attempt, attempt)
+    else:
+        wifi_attempt = await asyncio.to_thread(state_store.latest_wifi_attempt, iface)
+    status = wifi_attempt["status"] if wifi_attempt else None
+    if status == "connected":
         logger.info("Wi-Fi соединение установлено")
-        return {"connected": True}
-    return {"connected": False}
+        return {"connected": True, "status": status}
+    return {"connected": False, "status": status}
+
+
+@router.get("/connectionEvents")
+async def connection_events(
+    request: Request,
+    attempt: str = Query(..., description="id попытки подключения"),
+    state_store: StateStore = Depends(get_state_store),
+):
+    """
+    Server-Sent Events: этапы попытки подключения (config_written или
+    config_unchanged, apply_started, apply_finished, associating, getting_ip,
+    ip_acquired, connected/failed) по мере их появления в общем StateStore.
+    """
+    if await asyncio.to_thread(state_store.get_wifi_attempt, attempt) is None:
+        raise HTTPException(status_code=404, detail="Connection attempt not found")
+
+    last_event_id = request.headers.get("last-event-id", "")
+    after_seq = int(last_event_id) if last_event_id.isdigit() else 0
+    deadline = time.monotonic() + (
+        settings.apply_max_delay + settings.wifi_connect_timeout + 30
+    )
+
+    async def stream():
+        nonlocal after_seq
+        last_sent = time.monotonic()
+        while time.monotonic() < deadline:
+            if await request.is_disconnected():
+                return
+            events = await asyncio.to_thread(
+                state_store.list_wifi_events, attempt, after_seq
+            )
+            for event in events:
+                after_seq = event["seq"]
+                last_sent = time.monotonic()
+                yield (
+                    f"id: {event['seq']}\n"
+                    f"event: {event['event']}\n"
+                    f"data: {json.dumps(event)}\n\n"
+                )
+                if event["event"] in FINAL_EVENTS:
+                    return
+            if time.monotonic() - last_sent > settings.sse_keepalive:
+                last_sent = time.monotonic()
+                yield ": keepalive\n\n"
+            await asyncio.sleep(settings.sse_poll_interval)
+        yield "event: timeout\ndata: {}\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.get("/getWiFi", response_class=HTMLResponse)
@@ -56,20 +232,23 @@ async def get_wifi(request: Request):
         #     fields = network.split(":")
         #     if "*" in fields[0]:  # Активное соединение помечено '*'
 
-        if is_wifi_connected():
-            wifi_info = get_current_wifi_info()
-            ip_addresses = wifi_info.get("ip_addresses")
+        # Один (кэшированный) скан nmcli отвечает и на "подключены ли мы",
+        # и на "к какой сети"
+        wifi_info = await get_current_wifi_info_async(cached=True)
+        if wifi_info:
+            # Подключены, но адрес ещё не получен - адресов может не быть
+            ip_addresses = wifi_info.get("ip_addresses") or []
             ip_addr_static = wifi_info.get("ip_addr_static")
             if ip_addr_static not in ip_addresses:
                 wifi_info["ip_addr_static"] = (
                     'Нажмите кнопку "Update" для добавления статического адреса'
                 )
-            return templates.TemplateResponse(
+            return get_templates().TemplateResponse(
                 "wifi_info_form.html", {"request": {}, "wifi_info": wifi_info}
             )
         # Если активного соединения нет, возвращаем форму для подключения
-        ssids = get_wifi_ssids()
-        return templates.TemplateResponse(
+        ssids = await get_wifi_ssids_async(cached=True)
+        return get_templates().TemplateResponse(
             "wifi_form.html", {"request": request, "ssids": ssids}
         )
 
@@ -84,10 +263,9 @@ async def connect_wifi(
     ssid: str = Form(...),
     ssid_password: str = Form(...),
     netplan_service: NetplanService = Depends(get_netplan_service),
+    state_store: StateStore = Depends(get_state_store),
 ):
-    global connected_flag
-    connected_flag = False
-
+    attempt_id = None
     try:
         interfaces = get_net_iface()  # список интерфейсов
         iwface = None
@@ -100,24 +278,45 @@ async def connect_wifi(
         if not iwface:
             raise HTTPException(status_code=404, detail="Wi-Fi interface not found")
 
+        attempt_id = await asyncio.to_thread(
+            state_store.start_wifi_attempt, iwface, ssid
+        )
         data = BaseWiFiData(ssid=ssid, ssidPassword=ssid_password, iwface=iwface)
 
-        if not await netplan_service.create_netplan_config(data):
+        diff = await netplan_service.create_netplan_config(data)
+        if not diff:
             raise HTTPException(status_code=500, detail="Error writing netplan file")
 
-        await netplan_service.apply_conn_wifi()
-        asyncio.create_task(wait_for_connection(iwface))
-        return templates.TemplateResponse(
-            "loading.html",
-            {
-                "request": request,
-                "check_url": "/api/wifi/checkConnection",
-                "redirect_url": "/api/wifi/getWiFi",
-                "attempt_count": 0,
-            },
+        if _needs_apply(diff, iwface, ssid):
+            await asyncio.to_thread(
+                state_store.add_wifi_event, attempt_id, "config_written"
+            )
+            await netplan_service.apply_conn_wifi(
+                _apply_listener(attempt_id),
+                _apply_interfaces(diff, iwface),
+                diff["interfaces"] or [iwface],
+            )
+            invalidate_wifi_scan()
+        else:
+            await asyncio.to_thread(
+                state_store.add_wifi_event, attempt_id, "config_unchanged"
+            )
+        spawn(wait_for_connection(attempt_id, iwface, ssid), "wifi_wait")
+        return get_templates().TemplateResponse(
+            "loading.html", _loading_context(request, attempt_id)
         )
+    except HTTPException:
+        if attempt_id:
+            await asyncio.to_thread(
+                state_store.set_wifi_attempt_status, attempt_id, "failed"
+            )
+        raise
     except Exception as e:
         logger.error(f"error = {str(e)}")
+        if attempt_id:
+            await asyncio.to_thread(
+                state_store.set_wifi_attempt_status, attempt_id, "failed"
+            )
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -126,9 +325,9 @@ async def get_update_wifi_data():
     """
     Возвращает HTML-форму для создания Wi-Fi конфигурации.
     """
-    wifi_info = get_current_wifi_info()
+    wifi_info = await get_current_wifi_info_async()
 
-    return templates.TemplateResponse(
+    return get_templates().TemplateResponse(
         "wifi_update_form.html", {"request": {}, "wifi_info": wifi_info}
     )
 
@@ -141,12 +340,12 @@ async def update_wifi(
     ip_addr_static: str = Form(...),
     nameservers: str = Form(...),
     netplan_service: NetplanService = Depends(get_netplan_service),
+    state_store: StateStore = Depends(get_state_store),
 ):
     """
     Обрабатывает данные формы и настраивает Wi-Fi через Netplan.
     """
-    global connected_flag
-    connected_flag = False
+    attempt_id = await asyncio.to_thread(state_store.start_wifi_attempt, iwface, ssid)
     try:
         # Разделяем строку nameservers на список
 
@@ -165,22 +364,45 @@ async def update_wifi(
         )
 
         # Обновляем Wi-Fi конфигурацию
-        if not await netplan_service.update_wifi(wifi_data.model_dump()):
+        diff = await netplan_service.update_wifi(wifi_data.model_dump())
+        if not diff:
             raise HTTPException(status_code=500, detail="Error update netplan file")
 
-        disconnected = disconnect_wifi()
-        await netplan_service.apply_conn_wifi()
-        asyncio.create_task(wait_for_connection(iwface))
-        return templates.TemplateResponse(
-            "loading.html",
-            {
-                "request": {},
-                "check_url": "/api/wifi/checkConnection",
-                "redirect_url": "/api/wifi/getWiFi",
-                "attempt_count": 0,
-            },
+        disconnected = False
+        if _needs_apply(diff, iwface, ssid):
+            await asyncio.to_thread(
+                state_store.add_wifi_event, attempt_id, "config_written"
+            )
+            disconnected = await disconnect_wifi_async()
+            await netplan_service.apply_conn_wifi(
+                _apply_listener(attempt_id),
+                _apply_interfaces(diff, iwface),
+                diff["interfaces"] or [iwface],
+            )
+            invalidate_wifi_scan()
+        else:
+            # Та же конфигурация и соединение уже есть - связь не разрываем
+            await asyncio.to_thread(
+                state_store.add_wifi_event, attempt_id, "config_unchanged"
+            )
+        # соединение было принудительно разорвано - ждём нового подключения
+        spawn(
+            wait_for_connection(attempt_id, iwface, ssid, fresh=disconnected),
+            "wifi_wait",
         )
+        return get_templates().TemplateResponse(
+            "loading.html", _loading_context({}, attempt_id)
+        )
+    except HTTPException:
+        # Конфигурация не прошла проверку - ничего не записано
+        await asyncio.to_thread(
+            state_store.set_wifi_attempt_status, attempt_id, "failed"
+        )
+        raise
     except Exception as e:
+        await asyncio.to_thread(
+            state_store.set_wifi_attempt_status, attempt_id, "failed"
+        )
         return {"status": "error", "message": str(e)}
 
 
@@ -188,7 +410,8 @@ async def update_wifi(
 async def connection_up(netplan_service: NetplanService = Depends(get_netplan_service)):
     netplan_config = netplan_service.get_netplan_conf(settings.netplan_wifi01)
     if netplan_config:
-        if netplan_service.netplan_conf_up(netplan_config):
+        if await netplan_service.netplan_conf_up_async(netplan_config):
+            invalidate_wifi_scan()
             return RedirectResponse(url="/api/wifi/getWiFi")
     return {
         "status": "error",
@@ -198,8 +421,9 @@ async def connection_up(netplan_service: NetplanService = Depends(get_netplan_se
 
 @router.get("/downWiFi")
 async def connection_down():
-    disconnect = disconnect_wifi()
+    disconnect = await disconnect_wifi_async()
     if disconnect:
+        invalidate_wifi_scan()
         return RedirectResponse(url="/api/wifi/getWiFi")
     else:
         return {
@@ -0,0 +1,452 @@
+# bench/run_bench.py
+# Нагрузочный бенчмарк API на заглушках nmcli/netplan/sudo, копии
+# netplan-конфигураций и поддельном /sys/class/net.
+#
+# Запуск из корня репозитория:
+#   python -m bench.run_bench --concurrency 8 --requests 100
+#
+# Приложение вызывается напрямую через ASGI (без сети и HTTP-клиента),
+# поэтому измеряется код приложения, а не сетевой стек. Результат
+# записывается в bench/results/<время>.json для сравнения запусков. Если
+# сценарий вернул неожиданный код ответа (не 2xx и не из EXPECTED_STATUSES),
+# запуск завершается с кодом 1.
+
+import argparse
+import asyncio
+import fnmatch
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from urllib.parse import urlencode
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+FAKEBIN_DIR = os.path.join(BENCH_DIR, "fakebin")
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures", "netplan")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+FAKE_IFACES = {
+    "lo": {
+        "operstate": "unknown",
+        "carrier": "1",
+        "speed": "-1",
+        "address": "00:00:00:00:00:00",
+        "flags": "0x9",
+    },
+    "eth0": {
+        "operstate": "up",
+        "carrier": "1",
+        "speed": "1000",
+        "address": "02:00:00:00:00:01",
+        "flags": "0x1003",
+    },
+    "eth1": {
+        "operstate": "down",
+        "carrier": "0",
+        "speed": "-1",
+        "address": "02:00:00:00:00:02",
+        "flags": "0x1003",
+    },
+    "wlan0": {
+        "operstate": "up",
+        "carrier": "1",
+        "speed": "-1",
+        "address": "02:00:00:00:00:03",
+        "flags": "0x1003",
+    },
+    # Создаётся netplan apply для submitBridge; в поддельном sysfs есть сразу
+    "br0": {
+        "operstate": "up",
+        "carrier": "1",
+        "speed": "-1",
+        "address": "02:00:00:00:00:04",
+        "flags": "0x1003",
+    },
+}
+BENCH_TOKEN = "bench"
+
+ETH = {
+    "mac": "02:00:00:00:00:01",
+    "dhcp": False,
+    "gateway": "192.168.5.2",
+    "addresses": ["192.168.5.75/24"],
+    "nameservers": ["192.168.5.10"],
+    "deleteEth": False,
+}
+NETWORK = {
+    "ethernets": {
+        "eth0": {
+            "mac": "02:00:00:00:00:01",
+            "addresses": ["192.168.5.75/24"],
+            "gateway": "192.168.5.2",
+            "nameservers": ["192.168.5.10"],
+        },
+        "eth1": {"mac": "02:00:00:00:00:02", "dhcp": True},
+    },
+    "wifis": {"wlan0": {"ssid": "Home", "ssidPassword": "benchmark-password"}},
+}
+
+# Сценарии: (имя, метод, путь, query, тело, тип тела).
+# Не вызываются: /api/station/* (reboot, shutdown, удаление логов),
+# бесконечные SSE-потоки (/api/wifi/connectionEvents, /api/network/stats_stream)
+# и /api/debug/profile (заведомо длится seconds секунд).
+SCENARIOS = [
+    ("wifi.checkConnection", "GET", "/api/wifi/checkConnection", {"iface": "wlan0"}, None, None),
+    ("wifi.getWiFi", "GET", "/api/wifi/getWiFi", {}, None, None),
+    ("wifi.updateWiFi.form", "GET", "/api/wifi/updateWiFi", {}, None, None),
+    (
+        "wifi.connectWiFi",
+        "POST",
+        "/api/wifi/connectWiFi",
+        {},
+        {"ssid": "Home", "ssid_password": "benchmark-password"},
+        "form",
+    ),
+    (
+        "wifi.updateWiFi",
+        "POST",
+        "/api/wifi/updateWiFi",
+        {},
+        {
+            "ssid": "Home",
+            "ssid_password": "benchmark-password",
+            "iwface": "wlan0",
+            "ip_addr_static": "192.168.10.21",
+            "nameservers": "1.1.1.1",
+        },
+        "form",
+    ),
+    ("wifi.upWiFi", "GET", "/api/wifi/upWiFi", {}, None, None),
+    ("wifi.downWiFi", "GET", "/api/wifi/downWiFi", {}, None, None),
+    ("network.get_ip_a", "GET", "/api/network/get_ip_a", {}, None, None),
+    ("network.get_ip_state", "GET", "/api/network/get_ip_state", {}, None, None),
+    ("network.get_status_iface", "GET", "/api/network/get_status_iface", {"iface": "eth0"}, None, None),
+    ("network.stats", "GET", "/api/network/stats", {}, None, None),
+    ("netplan.get_eth_interfaces", "GET", "/api/netplan/get_eth_interfaces", {}, None, None),
+    ("netplan.config_cache_stats", "GET", "/api/netplan/config_cache_stats", {}, None, None),
+    ("netplan.apply_status", "GET", "/api/netplan/apply_status", {}, None, None),
+    ("netplan.submitEth1", "POST", "/api/netplan/submitEth1", {}, ETH, "json"),
+    ("netplan.submitEth2", "POST", "/api/netplan/submitEth2", {}, dict(ETH, mac="02:00:00:00:00:02", addresses=["192.168.5.76/24"]), "json"),
+    (
+        "netplan.submitBridge",
+        "POST",
+        "/api/netplan/submitBridge",
+        {},
+        {
+            "mac1": "02:00:00:00:00:01",
+            "mac2": "02:00:00:00:00:02",
+            "gateway": "192.168.5.2",
+            "addresses": ["192.168.5.80/24"],
+            "nameservers": ["192.168.5.10"],
+        },
+        "json",
+    ),
+    ("netplan.submitNetwork", "POST", "/api/netplan/submitNetwork", {}, NETWORK, "json"),
+    ("debug.memory", "GET", "/api/debug/memory", {}, None, None),
+    ("metrics", "GET", "/metrics", {}, None, None),
+]
+# Ожидаемые коды ответа, кроме 2xx: сценарий с другим кодом проваливает запуск
+EXPECTED_STATUSES = {
+    "wifi.upWiFi": {307},
+    "wifi.downWiFi": {307},
+}
+
+
+def _unexpected_statuses(name: str, statuses: dict[str, int]) -> list[str]:
+    expected = EXPECTED_STATUSES.get(name, set())
+    return [
+        code
+        for code in statuses
+        if not (200 <= int(code) < 300 or int(code) in expected)
+    ]
+
+
+def prepare_environment(workdir: str, args) -> dict[str, str]:
+    """Копирует конфигурации, строит поддельный sysfs и возвращает переменные окружения."""
+    netplan_dir = os.path.join(workdir, "netplan")
+    shutil.copytree(FIXTURES_DIR, netplan_dir)
+
+    sys_class_net = os.path.join(workdir, "sys", "class", "net")
+    for index, (iface, attrs) in enumerate(FAKE_IFACES.items()):
+        iface_dir = os.path.join(sys_class_net, iface)
+        os.makedirs(os.path.join(iface_dir, "statistics"))
+        for name, value in attrs.items():
+            with open(os.path.join(iface_dir, name), "w") as f:
+                f.write(f"{value}\n")
+        for counter in ("rx_bytes", "tx_bytes", "rx_packets", "tx_packets"):
+            with open(os.path.join(iface_dir, "statistics", counter), "w") as f:
+                f.write(f"{(index + 1) * 1000}\n")
+
+    return {
+        "PATH": f"{FAKEBIN_DIR}{os.pathsep}{os.environ.get('PATH', '')}",
+        "BENCH_CALLS_LOG": os.path.join(workdir, "calls.log"),
+        "NMCLI_LATENCY": str(args.nmcli_latency),
+        "NETPLAN_LATENCY": str(args.netplan_latency),
+        "NETPLAN_ETH": os.path.join(netplan_dir, "20-static-ip.yaml"),
+        "NETPLAN_WIFI": os.path.join(netplan_dir, "30-wifi-static.yaml"),
+        "NETPLAN_WIFI01": os.path.join(netplan_dir, "31-wifi-static.yaml"),
+        "NETPLAN_BRIDGE": os.path.join(netplan_dir, "01-netcfg.yaml"),
+        "SYS_CLASS_NET": sys_class_net,
+        "STATE_DB": os.path.join(workdir, "state.db"),
+        "APPLY_LOCK_FILE": os.path.join(workdir, "apply.lock"),
+        "LOCK_DIR": os.path.join(workdir, "locks"),
+        "LOG_LEVELS_FILE": os.path.join(workdir, "log-levels.json"),
+        "WARM_CACHE_FILE": os.path.join(workdir, "warm-cache.json"),
+        "APPLY_DEBOUNCE": str(args.apply_debounce),
+        "METRICS_DIR": os.path.join(workdir, "metrics"),
+        "DEBUG_DIR": os.path.join(workdir, "debug"),
+        "DEBUG_TOKEN": BENCH_TOKEN,
+        "WIFI_CONNECT_TIMEOUT": "1",
+        "NM_BACKEND": args.nm_backend,
+    }
+
+
+def _build_request(method, path, query, body, body_type):
+    headers = [(b"x-debug-token", BENCH_TOKEN.encode())]
+    payload = b""
+    if body_type == "json":
+        payload = json.dumps(body).encode()
+        headers.append((b"content-type", b"application/json"))
+    elif body_type == "form":
+        payload = urlencode(body).encode()
+        headers.append((b"content-type", b"application/x-www-form-urlencoded"))
+    if payload:
+        headers.append((b"content-length", str(len(payload)).encode()))
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": urlencode(query, doseq=True).encode(),
+        "headers": headers,
+        "server": ("bench", 80),
+        "client": ("127.0.0.1", 0),
+    }
+    return scope, payload
+
+
+async def call(app, scope, payload) -> int:
+    """Один запрос к ASGI-приложению; возвращает HTTP-статус."""
+    request_sent = False
+    status = 0
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        # Ответ уже отправлен - ждём, пока приложение не завершит обработку
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(dict(scope), receive, send)
+    return status
+
+
+def _count_calls(calls_log: str, offset: int) -> tuple[int, Counter]:
+    # Модули приложения импортируются только после настройки окружения
+    from utils.cmd_utils import command_label
+
+    try:
+        with open(calls_log, "r") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return offset, Counter()
+    calls = Counter(command_label(line.split()) for line in lines[offset:])
+    return len(lines), calls
+
+
+async def _wait_apply_idle(timeout: float):
+    """Ждёт, пока отработают задания netplan apply, поставленные сценарием."""
+
+    from service.state_store import get_state_store
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        jobs = get_state_store().list_apply_jobs()
+        if not any(job["state"] in ("queued", "running") for job in jobs):
+            return
+        await asyncio.sleep(0.05)
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    index = min(int(round(q * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+async def run_scenario(app, scenario, args, calls_log, calls_offset):
+    name, method, path, query, body, body_type = scenario
+    scope, payload = _build_request(method, path, query, body, body_type)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    statuses = Counter()
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            status = await call(app, scope, payload)
+            latencies.append(time.perf_counter() - started)
+            statuses[status] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    # Фоновая работа сценария (apply, ожидание подключения) тоже считается
+    await _wait_apply_idle(args.settle_timeout)
+    await asyncio.sleep(args.settle)
+    calls_offset, calls = _count_calls(calls_log, calls_offset)
+
+    result = {
+        "endpoint": f"{method} {path}",
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "elapsed": round(elapsed, 4),
+        "throughput": round(args.requests / elapsed, 2),
+        "latency_ms": {
+            "min": round(min(latencies) * 1000, 3),
+            "mean": round(statistics.mean(latencies) * 1000, 3),
+            "p50": round(_percentile(latencies, 0.50) * 1000, 3),
+            "p99": round(_percentile(latencies, 0.99) * 1000, 3),
+            "max": round(max(latencies) * 1000, 3),
+        },
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+        "subprocesses": {
+            "total": sum(calls.values()),
+            "per_request": round(sum(calls.values()) / args.requests, 3),
+            "by_command": dict(calls),
+        },
+    }
+    return name, result, calls_offset
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args, env: dict) -> dict:
+    # Настройки приложения читаются из окружения при импорте
+    import main
+    from core.log import logger
+
+    logger.setLevel(args.log_level)
+    app = main.app
+    scenarios = [s for s in SCENARIOS if any(fnmatch.fnmatch(s[0], p) for p in args.only)]
+    results = {}
+    calls_offset = 0
+    async with app.router.lifespan_context(app):
+        # Прогрев: импорт ленивых модулей, компиляция шаблонов
+        if not args.no_warmup:
+            for scenario in scenarios:
+                scope, payload = _build_request(*scenario[1:])
+                await call(app, scope, payload)
+        await _wait_apply_idle(args.settle_timeout)
+        calls_offset, _ = _count_calls(env["BENCH_CALLS_LOG"], 0)
+
+        for scenario in scenarios:
+            name, result, calls_offset = await run_scenario(
+                app, scenario, args, env["BENCH_CALLS_LOG"], calls_offset
+            )
+            results[name] = result
+            print(
+                f"{name:32} {result['throughput']:>9.1f} req/s  "
+                f"p50 {result['latency_ms']['p50']:>9.2f} ms  "
+                f"p99 {result['latency_ms']['p99']:>9.2f} ms  "
+                f"subprocesses {result['subprocesses']['total']:>5}  "
+                f"statuses {result['statuses']}",
+                flush=True,
+            )
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="netplan_api benchmark")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=50, help="запросов на сценарий")
+    parser.add_argument("--nmcli-latency", type=float, default=0.05)
+    parser.add_argument("--netplan-latency", type=float, default=0.2)
+    parser.add_argument(
+        "--nm-backend", default="nmcli", choices=["nmcli", "dbus", "simulated"]
+    )
+    parser.add_argument("--apply-debounce", type=float, default=0.1)
+    parser.add_argument(
+        "--only", nargs="+", default=["*"], help="шаблоны имён сценариев (fnmatch)"
+    )
+    parser.add_argument("--no-warmup", action="store_true")
+    parser.add_argument("--settle", type=float, default=0.2)
+    parser.add_argument("--settle-timeout", type=float, default=30.0)
+    parser.add_argument("--log-level", default="ERROR", help="уровень логов приложения")
+    parser.add_argument("--output", help="путь к JSON с результатами")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="netplan-api-bench-")
+    try:
+        env = prepare_environment(workdir, args)
+        os.environ.update(env)
+        # Шаблоны и статика приложения ищутся относительно корня репозитория
+        os.chdir(ROOT_DIR)
+        sys.path.insert(0, ROOT_DIR)
+
+        started_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+        results = asyncio.run(run(args, env))
+
+        report = {
+            "started_at": started_at,
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "params": {
+                key: value for key, value in vars(args).items() if key != "output"
+            },
+            "results": results,
+        }
+        output = args.output or os.path.join(
+            RESULTS_DIR, f"{started_at.replace(':', '')}.json"
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Results: {output}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    failed = {
+        name: result["statuses"]
+        for name, result in results.items()
+        if _unexpected_statuses(name, result["statuses"])
+    }
+    if failed:
+        for name, statuses in failed.items():
+            print(f"FAILED {name}: statuses {statuses}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
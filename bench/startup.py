@@ -0,0 +1,142 @@
+# bench/startup.py
+# Время холодного старта: отчёт -X importtime по импорту main и проверка
+# времени до первого ответа воркера uvicorn на заглушках из bench/fakebin.
+#
+# Запуск из корня репозитория:
+#   python -m bench.startup --budget 3 --path /api/network/get_ip_state
+#
+# Код возврата 1, если первый ответ получен позже --budget секунд - скрипт
+# можно использовать как проверку в CI.
+
+import argparse
+import http.client
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.run_bench import ROOT_DIR, prepare_environment
+
+
+def import_report(env: dict, top: int) -> dict:
+    """Импорт main в отдельном процессе с -X importtime."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # import time: self [us] | cumulative | imported package
+    modules = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        modules.append(
+            {
+                "module": name.strip(),
+                "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+            }
+        )
+    total = next((m["cumulative_ms"] for m in modules if m["module"] == "main"), None)
+    slowest = sorted(modules, key=lambda m: -m["self_ms"])[:top]
+    return {"total_ms": total, "modules": len(modules), "slowest_self": slowest}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_to_first_response(env: dict, path: str, timeout: float) -> tuple[float, int]:
+    """Запускает uvicorn main:app и опрашивает path до первого ответа."""
+    port = _free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning",
+        ],
+        cwd=ROOT_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {server.returncode}")
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+            try:
+                conn.request("GET", path)
+                status = conn.getresponse().status
+                return time.perf_counter() - started, status
+            except OSError:
+                time.sleep(0.01)
+            finally:
+                conn.close()
+        raise TimeoutError(f"no response from {path} in {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="netplan_api cold start")
+    parser.add_argument("--budget", type=float, default=3.0, help="секунд до первого ответа")
+    parser.add_argument("--path", default="/api/network/get_ip_state")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15, help="модулей в отчёте importtime")
+    parser.add_argument("--nmcli-latency", type=float, default=0.05)
+    parser.add_argument("--netplan-latency", type=float, default=0.2)
+    parser.add_argument("--apply-debounce", type=float, default=0.1)
+    parser.add_argument(
+        "--nm-backend", default="nmcli", choices=["nmcli", "dbus", "simulated"]
+    )
+    parser.add_argument("--output", help="путь к JSON с результатами")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="netplan-api-startup-")
+    try:
+        env = dict(os.environ, **prepare_environment(workdir, args))
+
+        report = import_report(env, args.top)
+        print(f"import main: {report['total_ms']:.1f} ms, {report['modules']} modules")
+        for module in report["slowest_self"]:
+            print(f"  {module['self_ms']:>8.1f} ms  {module['module']}")
+
+        runs = []
+        for _ in range(args.runs):
+            elapsed, status = time_to_first_response(env, args.path, args.budget * 5)
+            runs.append(elapsed)
+            print(f"first response: {elapsed:.3f}s (status {status})")
+        report["first_response_s"] = runs
+
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+
+        worst = max(runs)
+        if worst > args.budget:
+            print(f"FAIL: {worst:.3f}s > budget {args.budget}s")
+            return 1
+        print(f"OK: {worst:.3f}s <= budget {args.budget}s")
+        return 0
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,19 @@
 # core/config.py
 
 import json
+import os
 from pathlib import Path
 
 from pydantic import Field
 from pydantic_settings import BaseSettings
 
-from core.log import logger
+from core.log import logger, setup_logging
 
 env_path = Path(__file__).resolve().parent / ".env"
-logger.info(f"env_path - {env_path}")  # Используем логгер для информации
+
+# Каталог состояния сервиса (создаётся с правами 0700): в нём снимок кэшей с
+# паролями Wi-Fi и файлы, которые читают все воркеры - не в общем /tmp
+STATE_DIR = "/var/lib/netplan-api"
 
 
 class Settings(BaseSettings):
@@ -18,6 +22,15 @@ class Settings(BaseSettings):
         env_file = ".env"  # or your specific env file path
 
     debug: bool = True
+
+    # Логирование: уровень логгеров приложения и формат вывода (text/json);
+    # уровни отдельных модулей меняются во время работы через /api/debug/log-levels
+    log_level: str = Field("INFO", alias="LOG_LEVEL")
+    log_format: str = Field("text", alias="LOG_FORMAT")
+    log_levels_file: str = Field(
+        f"{STATE_DIR}/log-levels.json", alias="LOG_LEVELS_FILE"
+    )
+    log_levels_sync_interval: float = Field(2.0, alias="LOG_LEVELS_SYNC_INTERVAL")
     netplan_eth: str = Field("/etc/netplan/20-static-ip.yaml", alias="NETPLAN_ETH")
     netplan_wifi: str = Field("/etc/netplan/30-wifi-static.yaml", alias="NETPLAN_WIFI")
     netplan_wifi01: str = Field(
@@ -25,8 +38,109 @@ class Settings(BaseSettings):
     )
     netplan_br: str = Field("/etc/netplan/01-netcfg.yaml", alias="NETPLAN_BRIDGE")
 
+    # Асинхронный запуск внешних команд (nmcli, netplan)
+    cmd_timeout: float = Field(10.0, alias="CMD_TIMEOUT")
+    cmd_concurrency: int = Field(4, alias="CMD_CONCURRENCY")
+
+    # Кэш сканирования Wi-Fi: свежие данные / допустимо устаревшие (секунды)
+    wifi_scan_ttl: float = Field(10.0, alias="WIFI_SCAN_TTL")
+    wifi_scan_stale_ttl: float = Field(60.0, alias="WIFI_SCAN_STALE_TTL")
+
+    # Планировщик netplan apply: пауза для объединения изменений,
+    # максимальная задержка, межпроцессная блокировка и применение только
+    # для затронутых интерфейсов (без полного netplan apply)
+    apply_debounce: float = Field(1.0, alias="APPLY_DEBOUNCE")
+    apply_max_delay: float = Field(5.0, alias="APPLY_MAX_DELAY")
+    apply_lock_file: str = Field(
+        f"{STATE_DIR}/apply.lock", alias="APPLY_LOCK_FILE"
+    )
+    apply_scoped: bool = Field(True, alias="APPLY_SCOPED")
+    # Предельное время шага применения (команда и ожидание готовности)
+    # и период опроса готовности (секунды)
+    apply_phase_timeout: float = Field(120.0, alias="APPLY_PHASE_TIMEOUT")
+    readiness_poll_interval: float = Field(0.2, alias="READINESS_POLL_INTERVAL")
+    # Ожидание tap-интерфейса OpenVPN на каждом шаге перезапуска (секунды)
+    vpn_tap_timeout: float = Field(15.0, alias="VPN_TAP_TIMEOUT")
+    # Пробное применение (try_apply): срок проверок связности (секунды) и
+    # имя для проверки DNS (пусто - DNS не проверяется)
+    apply_try_timeout: float = Field(30.0, alias="APPLY_TRY_TIMEOUT")
+    apply_probe_dns_host: str = Field("", alias="APPLY_PROBE_DNS_HOST")
+
+    # Блокировки read-modify-write netplan-файлов между воркерами:
+    # каталог файлов блокировок и предельное ожидание (секунды)
+    lock_dir: str = Field(f"{STATE_DIR}/locks", alias="LOCK_DIR")
+    file_lock_timeout: float = Field(10.0, alias="FILE_LOCK_TIMEOUT")
+
+    # Проверка перед записью netplan: изменённые ethernet/Wi-Fi интерфейсы
+    # (или их MAC) должны быть в системе; false - для горячего подключения
+    validate_links: bool = Field(True, alias="VALIDATE_LINKS")
+
+    # Драйвер NetworkManager: nmcli, dbus (нужен jeepney) или simulated
+    nm_backend: str = Field("nmcli", alias="NM_BACKEND")
+
+    # Отслеживание подключения Wi-Fi по событиям NetworkManager
+    nm_monitor_cmd: str = Field("nmcli monitor", alias="NM_MONITOR_CMD")
+    nm_monitor_restart_delay: float = Field(5.0, alias="NM_MONITOR_RESTART_DELAY")
+    wifi_connect_timeout: float = Field(15.0, alias="WIFI_CONNECT_TIMEOUT")
+
+    # Общее состояние воркеров gunicorn (SQLite)
+    state_db: str = Field(f"{STATE_DIR}/state.db", alias="STATE_DB")
+
+    # Server-Sent Events: период проверки новых событий и keepalive (секунды)
+    sse_poll_interval: float = Field(0.2, alias="SSE_POLL_INTERVAL")
+    sse_keepalive: float = Field(15.0, alias="SSE_KEEPALIVE")
+
+    # Каталог интерфейсов sysfs (подменяется в бенчмарках)
+    sys_class_net: str = Field("/sys/class/net", alias="SYS_CLASS_NET")
+
+    # Минимальный период чтения статистики интерфейсов из sysfs (секунды)
+    stats_min_interval: float = Field(0.2, alias="STATS_MIN_INTERVAL")
+
+    # Метрики Prometheus: каталог файлов воркеров и период их сброса (секунды)
+    metrics_dir: str = Field(f"{STATE_DIR}/metrics", alias="METRICS_DIR")
+    metrics_flush_interval: float = Field(5.0, alias="METRICS_FLUSH_INTERVAL")
+
+    # Отладочный API (/api/debug): пустой токен - API отключён
+    debug_token: str = Field("", alias="DEBUG_TOKEN")
+    debug_dir: str = Field(f"{STATE_DIR}/debug", alias="DEBUG_DIR")
+    profile_max_seconds: float = Field(60.0, alias="PROFILE_MAX_SECONDS")
+    # tracemalloc с первого запроса: глубина стека аллокаций (0 - выключен)
+    tracemalloc_frames: int = Field(0, alias="TRACEMALLOC_FRAMES")
+
+    # Снимок кэшей (сканы Wi-Fi, состояние устройств, разобранные netplan-файлы)
+    # для быстрого первого ответа после перезапуска; пустой путь - выключено
+    warm_cache_file: str = Field(
+        f"{STATE_DIR}/warm-cache.json", alias="WARM_CACHE_FILE"
+    )
+    warm_cache_interval: float = Field(60.0, alias="WARM_CACHE_INTERVAL")
+
+    # Подключать все роутеры при старте, а не при первом запросе к ним
+    preload_routers: bool = Field(False, alias="PRELOAD_ROUTERS")
+
 
 settings = Settings()
+setup_logging(settings.log_level, settings.log_format)
+
+
+def log_settings():
+    """Логирует настройки (без секретов) при старте приложения, а не при импорте."""
+    logger.info(f"env_path - {env_path}")
+    formatted_settings = json.dumps(
+        settings.model_dump(exclude={"debug_token"}), indent=4
+    )
+    logger.info(f"Settings: {formatted_settings}")
+
 
-formatted_settings = json.dumps(settings.model_dump(), indent=4)
-logger.info(f"Settings: {formatted_settings}")
+def ensure_state_dirs():
+    """Создаёт каталоги файлов состояния (только для владельца) при старте."""
+    paths = [settings.lock_dir, settings.metrics_dir, settings.debug_dir]
+    for path in (
+        settings.state_db,
+        settings.apply_lock_file,
+        settings.log_levels_file,
+        settings.warm_cache_file,
+    ):
+        if path:
+            paths.append(os.path.dirname(os.path.abspath(path)))
+    for path in paths:
+        os.makedirs(path, mode=0o700, exist_ok=True)
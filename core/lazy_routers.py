@@ -0,0 +1,65 @@
+# core/lazy_routers.py
+# Роутеры api/* импортируются при первом запросе к своему префиксу, а не при
+# старте воркера: воркер начинает отвечать раньше, а модули неиспользуемых
+# разделов API (например, /api/debug) не загружаются вовсе.
+
+import importlib
+import time
+
+from core.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class LazyRouters:
+    """
+    Список роутеров, подключаемых к приложению по требованию.
+
+    :param routers: Кортежи (prefix, module, tags); в модуле ожидается
+        атрибут router (APIRouter).
+    """
+
+    def __init__(self, routers):
+        self.pending = {prefix: (module, tags) for prefix, module, tags in routers}
+
+    def load(self, app, prefix: str):
+        module_name, tags = self.pending[prefix]
+        started = time.perf_counter()
+        module = importlib.import_module(module_name)
+        app.include_router(module.router, prefix=prefix, tags=tags)
+        del self.pending[prefix]
+        # Схема OpenAPI кэшируется при первом запросе - строим её заново
+        app.openapi_schema = None
+        logger.info(
+            f"Router {module_name} loaded in {time.perf_counter() - started:.3f}s"
+        )
+
+    def load_all(self, app):
+        for prefix in list(self.pending):
+            self.load(app, prefix)
+
+    def load_for_path(self, app, path: str):
+        for prefix in list(self.pending):
+            if path == prefix or path.startswith(prefix + "/"):
+                self.load(app, prefix)
+
+
+class LazyRouterMiddleware:
+    """
+    ASGI-middleware: перед маршрутизацией подключает роутер, которому
+    принадлежит путь запроса. Для путей из load_all_paths (документация и
+    схема OpenAPI) подключаются все роутеры сразу.
+    """
+
+    def __init__(self, app, routers: LazyRouters, load_all_paths=()):
+        self.app = app
+        self.routers = routers
+        self.load_all_paths = set(load_all_paths)
+
+    async def __call__(self, scope, receive, send):
+        if self.routers.pending and scope["type"] in ("http", "websocket"):
+            if scope["path"] in self.load_all_paths:
+                self.routers.load_all(scope["app"])
+            else:
+                self.routers.load_for_path(scope["app"], scope["path"])
+        await self.app(scope, receive, send)
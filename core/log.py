@@ -1,16 +1,267 @@
 # Configure logging
+# Записи кладутся в очередь (QueueHandler), а оформление и вывод выполняет
+# поток QueueListener - вызов логгера не блокирует event loop на записи в
+# stderr/журнал. Логгеры модулей - потомки netplan_api (get_logger(__name__)),
+# их уровни можно менять во время работы (/api/debug/log-levels).
 
+import asyncio
+import atexit
+import copy
+import json
 import logging
+import os
+import queue
+import re
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
 
-# logging.basicConfig(
-#     level=logging.INFO,
-#     format="%(asctime)s - %(levelname)s - %(funcName)s - %(message)s",
-# )
+from utils.file_utils import atomic_write
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
+ROOT_LOGGER = "netplan_api"
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+REDACTED = "***"
+
+# password, ssidPassword, ssid_password, psk, debug_token, X-Debug-Token ...
+_SECRET_KEY = re.compile(r"password|passwd|psk|secret|token", re.IGNORECASE)
+_SECRET_VALUE = re.compile(
+    r"""(?P<key>["']?[\w-]*(?:password|passwd|psk|secret|token)["']?\s*[:=]\s*)"""
+    r"""(?P<value>"(?:[^"\\]|\\.)*"|'[^']*'|[^\s,;}\]]+)""",
+    re.IGNORECASE,
 )
 
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
+logger = logging.getLogger(ROOT_LOGGER)
+
+_listener: QueueListener | None = None
+_base_level = logging.INFO
+# Уровни, заданные во время работы: имя логгера -> уровень
+_overrides: dict[str, str] = {}
+_overrides_mtime: int | None = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Логгер модуля (get_logger(__name__)) - потомок netplan_api."""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def redact(text: str) -> str:
+    """Заменяет значения секретов (пароли Wi-Fi, токены) в тексте."""
+
+    def _replace(match):
+        value = match["value"]
+        quote = value[0] if value[0] in "\"'" else ""
+        return f"{match['key']}{quote}{REDACTED}{quote}"
+
+    return _SECRET_VALUE.sub(_replace, text)
+
+
+def is_secret_key(key) -> bool:
+    return isinstance(key, str) and bool(_SECRET_KEY.search(key))
+
+
+def redact_data(data):
+    """Копия структуры с заменёнными значениями секретных ключей."""
+    if isinstance(data, dict):
+        return {
+            key: REDACTED if is_secret_key(key) else redact_data(value)
+            for key, value in data.items()
+        }
+    if isinstance(data, (list, tuple)):
+        return [redact_data(value) for value in data]
+    return data
+
+
+class LazyJson:
+    """
+    Аргумент записи лога: JSON объекта (без секретов) строится, только если
+    запись действительно будет выведена.
+
+        logger.debug("netplan_config = %s", LazyJson(netplan_config))
+    """
+
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self) -> str:
+        return json.dumps(redact_data(self.data), ensure_ascii=False, default=str)
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON (для journald/Loki/ELK)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "pid": record.process,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RedactingFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.msg = redact(record.getMessage())
+        record.args = None
+        if record.exc_text:
+            record.exc_text = redact(record.exc_text)
+        return True
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Сообщение собирается в вызывающем потоке: аргументы (словари
+        # конфигурации) могут измениться сразу после вызова логгера.
+        # Оформление (время, JSON) и вывод - в потоке QueueListener.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(level: str = "INFO", fmt: str = "text"):
+    """
+    Настраивает вывод: очередь на корневом логгере, поток QueueListener
+    со StreamHandler (формат text или json) и фильтром секретов.
+    """
+    global _listener, _base_level
+    if _listener is not None:
+        _listener.stop()
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(
+        JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT)
+    )
+    handler.addFilter(RedactingFilter())
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers = [_QueueHandler(log_queue)]
+    root.setLevel(logging.INFO)
+
+    _base_level = logging.getLevelName(level.upper())
+    logger.setLevel(_base_level)
+    for name, override in _overrides.items():
+        logging.getLogger(name).setLevel(override)
+
+    _listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+
+
+@atexit.register
+def _stop_listener():
+    # Дописывает записи, оставшиеся в очереди
+    if _listener is not None:
+        _listener.stop()
+
+
+def _logger_name(name: str) -> str:
+    if name in ("", ROOT_LOGGER) or name.startswith(f"{ROOT_LOGGER}."):
+        return name or ROOT_LOGGER
+    # Логгеры библиотек (uvicorn.access, ...) - по полному имени
+    if name in logging.root.manager.loggerDict:
+        return name
+    return f"{ROOT_LOGGER}.{name}"
+
+
+def parse_level(level: str) -> int:
+    """:raises ValueError: если уровень не DEBUG/INFO/WARNING/ERROR/CRITICAL."""
+    value = logging.getLevelName(str(level).upper())
+    if not isinstance(value, int):
+        raise ValueError(f"Unknown log level: {level}")
+    return value
+
+
+def apply_levels(levels: dict[str, str | None]):
+    """
+    Задаёт уровни логгеров; None возвращает уровень по умолчанию
+    (наследуемый от родителя, для netplan_api - из настроек).
+    """
+    for name, level in levels.items():
+        name = _logger_name(name)
+        if level is None:
+            _overrides.pop(name, None)
+            default = _base_level if name == ROOT_LOGGER else logging.NOTSET
+            logging.getLogger(name).setLevel(default)
+        else:
+            _overrides[name] = logging.getLevelName(parse_level(level))
+            logging.getLogger(name).setLevel(_overrides[name])
+
+
+def sync_levels(path: str):
+    """
+    Применяет уровни из общего файла, если он изменился: так настройка,
+    сделанная запросом в один воркер gunicorn, доходит до остальных.
+    """
+    global _overrides_mtime
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    if mtime == _overrides_mtime:
+        return
+    levels = {}
+    if mtime is not None:
+        with open(path) as f:
+            levels = json.load(f)
+    # Уровни, удалённые из файла, сбрасываются
+    reset = {name: None for name in _overrides if name not in levels}
+    apply_levels({**reset, **levels})
+    _overrides_mtime = mtime
+
+
+def update_levels_file(path: str, levels: dict[str, str | None]):
+    """Дополняет общий файл уровней; None удаляет уровень логгера из файла."""
+    try:
+        with open(path) as f:
+            current = json.load(f)
+    except FileNotFoundError:
+        current = {}
+    for name, level in levels.items():
+        name = _logger_name(name)
+        if level is None:
+            current.pop(name, None)
+        else:
+            current[name] = logging.getLevelName(parse_level(level))
+    atomic_write(path, json.dumps(current, indent=2))
+
+
+async def sync_levels_periodically(path: str, interval: float):
+    """Периодическая синхронизация уровней (запускается в lifespan)."""
+    while True:
+        try:
+            sync_levels(path)
+        except Exception as e:
+            logger.error(f"Log levels sync failed: {e}")
+        await asyncio.sleep(interval)
+
+
+def logger_levels() -> dict[str, dict]:
+    """Уровни логгеров приложения: заданный и действующий."""
+    names = [ROOT_LOGGER] + sorted(
+        name
+        for name, item in logging.root.manager.loggerDict.items()
+        if isinstance(item, logging.Logger)
+        and (name.startswith(f"{ROOT_LOGGER}.") or name in _overrides)
+    )
+    result = {}
+    for name in names:
+        item = logging.getLogger(name)
+        result[name] = {
+            "level": logging.getLevelName(item.level),
+            "effective": logging.getLevelName(item.getEffectiveLevel()),
+        }
+    return result
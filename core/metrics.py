@@ -0,0 +1,404 @@
+# core/metrics.py
+# Метрики в формате Prometheus без внешних зависимостей.
+#
+# Каждый воркер gunicorn считает метрики у себя и периодически сбрасывает
+# их в файл settings.metrics_dir/<pid>.json; /metrics суммирует файлы всех
+# живых воркеров (файлы завершившихся воркеров удаляются - для Prometheus
+# это выглядит как обычный сброс счётчиков при рестарте).
+
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+
+from core.config import settings
+from core.log import get_logger
+from utils.proc_utils import read_memory_status
+
+logger = get_logger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def labels(self, **labels) -> "_Child":
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        return _Child(self, key)
+
+    def _dump(self) -> dict:
+        with self._lock:
+            samples = [[list(key), self._copy(value)] for key, value in self._values.items()]
+        return {
+            "type": self.kind,
+            "help": self.documentation,
+            "labelnames": list(self.labelnames),
+            "samples": samples,
+        }
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+
+class _Child:
+    def __init__(self, metric: _Metric, key: tuple):
+        self._metric = metric
+        self._key = key
+
+    def inc(self, amount: float = 1):
+        self._metric._inc(self._key, amount)
+
+    def dec(self, amount: float = 1):
+        self._metric._inc(self._key, -amount)
+
+    def set(self, value: float):
+        self._metric._set(self._key, value)
+
+    def observe(self, value: float):
+        self._metric._observe(self._key, value)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _inc(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def inc(self, amount: float = 1):
+        self._inc((), amount)
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def _set(self, key, value):
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1):
+        self._inc((), -amount)
+
+    def set(self, value: float):
+        self._set((), value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _observe(self, key, value):
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = {
+                    "buckets": [0] * len(self.buckets),
+                    "sum": 0.0,
+                    "count": 0,
+                }
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry["buckets"][i] += 1
+            entry["sum"] += value
+            entry["count"] += 1
+
+    def observe(self, value: float):
+        self._observe((), value)
+
+    def time(self, **labels) -> "_Timer":
+        """Контекстный менеджер: наблюдает длительность блока в секундах."""
+        return _Timer(self, tuple(str(labels[name]) for name in self.labelnames))
+
+    @staticmethod
+    def _copy(value):
+        return dict(value, buckets=list(value["buckets"]))
+
+    def _dump(self) -> dict:
+        dumped = super()._dump()
+        dumped["buckets"] = list(self.buckets)
+        return dumped
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, key: tuple):
+        self._histogram = histogram
+        self._key = key
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self._started
+        self._histogram._observe(self._key, self.elapsed)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric):
+        self._metrics[metric.name] = metric
+
+    def dump(self) -> dict:
+        return {name: metric._dump() for name, metric in self._metrics.items()}
+
+
+REGISTRY = Registry()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def flush():
+    """Сбрасывает метрики текущего воркера в settings.metrics_dir/<pid>.json."""
+    os.makedirs(settings.metrics_dir, mode=0o700, exist_ok=True)
+    path = os.path.join(settings.metrics_dir, f"{os.getpid()}.json")
+    # /metrics и периодический сброс могут писать одновременно
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(REGISTRY.dump(), f)
+    os.replace(tmp_path, path)
+
+
+def _merge(target: dict, dumped: dict):
+    for name, metric in dumped.items():
+        merged = target.setdefault(name, dict(metric, samples={}))
+        for labelvalues, value in metric["samples"]:
+            key = tuple(labelvalues)
+            if metric["type"] == "histogram":
+                entry = merged["samples"].setdefault(
+                    key, {"buckets": [0] * len(value["buckets"]), "sum": 0.0, "count": 0}
+                )
+                entry["buckets"] = [a + b for a, b in zip(entry["buckets"], value["buckets"])]
+                entry["sum"] += value["sum"]
+                entry["count"] += value["count"]
+            else:
+                merged["samples"][key] = merged["samples"].get(key, 0) + value
+
+
+def collect_all() -> dict:
+    """Суммирует метрики всех живых воркеров."""
+    flush()
+    merged = {}
+    for filename in os.listdir(settings.metrics_dir):
+        if not filename.endswith(".json"):
+            continue
+        path = os.path.join(settings.metrics_dir, filename)
+        try:
+            pid = int(filename[: -len(".json")])
+        except ValueError:
+            continue
+        if not _pid_alive(pid):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            continue
+        try:
+            with open(path) as f:
+                _merge(merged, json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping metrics file {path}: {e}")
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, labelvalues, extra=None) -> str:
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(merged: dict) -> str:
+    """Текстовый формат экспозиции Prometheus 0.0.4."""
+    lines = []
+    for name, metric in sorted(merged.items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        labelnames = metric["labelnames"]
+        for key, value in sorted(metric["samples"].items()):
+            if metric["type"] == "histogram":
+                for bound, count in zip(metric["buckets"], value["buckets"]):
+                    labels = _format_labels(labelnames, key, ("le", _format_value(bound)))
+                    lines.append(f"{name}_bucket{labels} {count}")
+                labels = _format_labels(labelnames, key, ("le", "+Inf"))
+                lines.append(f"{name}_bucket{labels} {value['count']}")
+                labels = _format_labels(labelnames, key)
+                lines.append(f"{name}_sum{labels} {_format_value(value['sum'])}")
+                lines.append(f"{name}_count{labels} {value['count']}")
+            else:
+                labels = _format_labels(labelnames, key)
+                lines.append(f"{name}{labels} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# Метрики приложения
+
+REQUEST_SECONDS = Histogram(
+    "netplan_api_request_seconds",
+    "HTTP request latency",
+    ("router", "route", "method", "status"),
+)
+SUBPROCESS_SECONDS = Histogram(
+    "netplan_api_subprocess_seconds",
+    "Duration of external commands",
+    ("command", "result"),
+)
+YAML_SECONDS = Histogram(
+    "netplan_api_yaml_seconds",
+    "YAML parse/serialize time",
+    ("op",),
+)
+YAML_BYTES = Histogram(
+    "netplan_api_yaml_bytes",
+    "YAML document size",
+    ("op",),
+    buckets=BYTES_BUCKETS,
+)
+APPLY_PHASE_SECONDS = Histogram(
+    "netplan_api_apply_phase_seconds",
+    "Duration of netplan apply phases",
+    ("phase",),
+)
+APPLY_SECONDS = Histogram(
+    "netplan_api_apply_seconds",
+    "Duration of netplan apply runs by strategy",
+    ("strategy",),
+)
+APPLY_RUNS = Counter(
+    "netplan_api_apply_runs_total",
+    "Netplan apply runs by result",
+    ("result",),
+)
+CONFIG_UPDATES = Counter(
+    "netplan_api_config_updates_total",
+    "Netplan file updates by result (changed, unchanged)",
+    ("result",),
+)
+FILE_LOCK_WAIT_SECONDS = Histogram(
+    "netplan_api_file_lock_wait_seconds",
+    "Time spent waiting for a per-file lock",
+    ("file",),
+)
+FILE_LOCK_TIMEOUTS = Counter(
+    "netplan_api_file_lock_timeouts_total",
+    "Per-file lock acquisitions that timed out",
+    ("file",),
+)
+CACHE_REQUESTS = Counter(
+    "netplan_api_cache_requests_total",
+    "Cache lookups by cache and result (hit, stale, miss)",
+    ("cache", "result"),
+)
+BACKGROUND_TASKS = Gauge(
+    "netplan_api_background_tasks",
+    "In-flight background tasks",
+    ("kind",),
+)
+WORKER_RSS = Gauge(
+    "netplan_api_worker_rss_bytes",
+    "Resident memory of a gunicorn worker",
+    ("pid",),
+)
+WORKER_THREADS = Gauge(
+    "netplan_api_worker_threads",
+    "Threads of a gunicorn worker",
+    ("pid",),
+)
+WORKER_ASYNCIO_TASKS = Gauge(
+    "netplan_api_worker_asyncio_tasks",
+    "All asyncio tasks of a gunicorn worker, tracked or not",
+    ("pid",),
+)
+
+
+def update_process_metrics():
+    """Снимок памяти, потоков и задач воркера (вызывать из event loop)."""
+    pid = os.getpid()
+    memory = read_memory_status()
+    if memory:
+        WORKER_RSS.labels(pid=pid).set(memory["VmRSS"])
+    WORKER_THREADS.labels(pid=pid).set(threading.active_count())
+    WORKER_ASYNCIO_TASKS.labels(pid=pid).set(len(asyncio.all_tasks()))
+
+
+class MetricsMiddleware:
+    """
+    ASGI-middleware: длительность запросов по роутеру, шаблону маршрута
+    (/api/wifi/checkConnection, а не конкретный URL), методу и статусу.
+    Для потоковых ответов (SSE) учитывается время до конца потока.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # FastAPI кладёт найденный маршрут в scope["route"]
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            parts = route.split("/")
+            router = parts[2] if len(parts) > 3 and parts[1] == "api" else "root"
+            REQUEST_SECONDS.labels(
+                router=router, route=route, method=scope["method"], status=status
+            ).observe(time.perf_counter() - started)
+
+
+async def flush_periodically():
+    """Периодический сброс метрик воркера (запускается в lifespan)."""
+    while True:
+        try:
+            update_process_metrics()
+            await asyncio.to_thread(flush)
+        except Exception as e:
+            logger.error(f"Metrics flush failed: {e}")
+        await asyncio.sleep(settings.metrics_flush_interval)
@@ -0,0 +1,37 @@
+# core/tasks.py
+# Фоновые asyncio-задачи воркера: держим ссылки (иначе задачу может собрать
+# сборщик мусора) и считаем выполняющиеся задачи по видам для метрик.
+
+import asyncio
+from collections import Counter
+from typing import Coroutine
+
+from core.log import get_logger
+from core.metrics import BACKGROUND_TASKS
+
+logger = get_logger(__name__)
+
+_tasks: set[asyncio.Task] = set()
+_kinds: Counter = Counter()
+
+
+def spawn(coro: Coroutine, kind: str) -> asyncio.Task:
+    """Запускает корутину в фоне; kind - метка вида задачи для метрик."""
+    task = asyncio.create_task(coro)
+    _tasks.add(task)
+    _kinds[kind] += 1
+    BACKGROUND_TASKS.labels(kind=kind).inc()
+
+    def _done(t: asyncio.Task):
+        _tasks.discard(t)
+        _kinds[kind] -= 1
+        BACKGROUND_TASKS.labels(kind=kind).dec()
+        if not t.cancelled() and t.exception() is not None:
+            logger.error(f"Background task '{kind}' failed: {t.exception()}")
+
+    task.add_done_callback(_done)
+    return task
+
+
+def running_tasks() -> dict[str, int]:
+    return {kind: count for kind, count in _kinds.items() if count}
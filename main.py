@@ -4,22 +4,69 @@
 # DEV: sudo uvicorn rest:app --reload --host 0.0.0.0 --port 8080
 # PROD: sudo gunicorn -w 4 -b 0.0.0.0:8080 -k uvicorn.workers.UvicornWorker main:app
 
-from contextlib import asynccontextmanager
+import asyncio
+import tracemalloc
+from contextlib import asynccontextmanager, suppress
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import ORJSONResponse
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 
-from api import netplan, station, network, wifi
-from core.log import logger
+from core import metrics
+from core.config import ensure_state_dirs, log_settings, settings
+from core.lazy_routers import LazyRouterMiddleware, LazyRouters
+from core.log import logger, sync_levels_periodically
+from core.tasks import spawn
+from service.debug_profiles import RequestProfilerMiddleware
 
 VERSION = "v0.3.0"
 
 
 @asynccontextmanager
 async def startup_and_shutdown(app: FastAPI):
+    # Тяжёлые модули импортируются здесь, а не при импорте main
+    from service import warm_cache
+    from service.nm_monitor import get_connection_watcher
+    from utils.nm_backend import get_nm_backend
+
+    log_settings()
+    ensure_state_dirs()
+    # Ошибка конфигурации драйвера (нет jeepney для dbus) - сразу при старте
+    get_nm_backend()
+    if settings.tracemalloc_frames:
+        tracemalloc.start(settings.tracemalloc_frames)
+    if settings.preload_routers:
+        routers.load_all(app)
+    if settings.warm_cache_file and warm_cache.restore():
+        # Первые запросы получат снимок, актуальные данные - из фона
+        spawn(warm_cache.refresh(), "warm_cache_refresh")
+    watcher = get_connection_watcher()
+    await watcher.start()
+    metrics_flusher = asyncio.create_task(metrics.flush_periodically())
+    log_levels_sync = asyncio.create_task(
+        sync_levels_periodically(
+            settings.log_levels_file, settings.log_levels_sync_interval
+        )
+    )
+    warm_cache_saver = None
+    if settings.warm_cache_file:
+        warm_cache_saver = asyncio.create_task(warm_cache.save_periodically())
     yield
+    for task in (metrics_flusher, log_levels_sync):
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    if warm_cache_saver is not None:
+        warm_cache_saver.cancel()
+        with suppress(asyncio.CancelledError):
+            await warm_cache_saver
+        try:
+            await warm_cache.save()
+        except Exception as e:
+            logger.error(f"Warm cache save failed: {e}")
+    await watcher.stop()
+    await get_nm_backend().close()
 
 
 app = FastAPI(
@@ -34,13 +81,35 @@ app = FastAPI(
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 
-app.include_router(wifi.router, prefix="/api/wifi", tags=["wifi"])
-app.include_router(network.router, prefix="/api/network", tags=["network"])
-app.include_router(netplan.router, prefix="/api/netplan", tags=["netplan"])
-app.include_router(station.router, prefix="/api/station", tags=["station"])
+# Роутеры подключаются при первом запросе к своему префиксу
+routers = LazyRouters(
+    [
+        ("/api/wifi", "api.wifi", ["wifi"]),
+        ("/api/network", "api.network", ["network"]),
+        ("/api/netplan", "api.netplan", ["netplan"]),
+        ("/api/station", "api.station", ["station"]),
+        ("/api/debug", "api.debug", ["debug"]),
+    ]
+)
+
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics():
+    """Метрики Prometheus, суммированные по всем воркерам gunicorn."""
+    metrics.update_process_metrics()
+    merged = await asyncio.to_thread(metrics.collect_all)
+    return PlainTextResponse(
+        metrics.render(merged), media_type="text/plain; version=0.0.4"
+    )
+
 
 origins = ["*"]
 
+app.add_middleware(
+    LazyRouterMiddleware,
+    routers=routers,
+    load_all_paths=(app.docs_url, app.openapi_url),
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -48,6 +117,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(RequestProfilerMiddleware)
 logger.info(f" Netplan API REST started; version = {VERSION}")
 
 
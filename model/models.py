@@ -3,7 +3,7 @@
 from enum import Enum
 
 from pydantic import BaseModel
-from typing import List  # needed for python 3.8 and below
+from typing import Dict, List  # needed for python 3.8 and below
 
 
 class SubmitBridge(BaseModel):
@@ -46,6 +46,37 @@ class UpdateStationWifi(BaseModel):
     network_ap_gateway: str
 
 
+class EthernetState(BaseModel):
+    mac: str | None = None
+    dhcp: bool = False
+    gateway: str = ""
+    addresses: List[str] = []
+    nameservers: List[str] = []
+
+
+class BridgeState(BaseModel):
+    interfaces: List[str]
+    dhcp: bool = False
+    gateway: str = ""
+    addresses: List[str] = []
+    nameservers: List[str] = []
+
+
+class WifiState(BaseModel):
+    ssid: str
+    ssidPassword: str
+    addresses: List[str] = []
+    nameservers: List[str] = []
+
+
+class NetworkState(BaseModel):
+    """Желаемое состояние интерфейсов; значение null удаляет интерфейс."""
+
+    ethernets: Dict[str, EthernetState | None] = {}
+    bridges: Dict[str, BridgeState | None] = {}
+    wifis: Dict[str, WifiState | None] = {}
+
+
 class InterfaceName(str, Enum):
     enp4s0 = "enp4s0"
     eth0 = "eth0"
@@ -0,0 +1,384 @@
+# service/apply_scheduler.py
+
+import fcntl
+import json
+import subprocess
+import threading
+import time
+import uuid
+from functools import lru_cache
+
+from core.config import settings
+from core.log import get_logger
+from core.metrics import APPLY_RUNS, APPLY_SECONDS
+from service.apply_try import restore_snapshot, run_probes
+from service.scoped_apply import build_scoped_phases, link_names
+from service.state_store import get_state_store
+from utils.os_utils import run_netplan_apply, run_phases
+
+logger = get_logger(__name__)
+
+
+class ApplyScheduler:
+    """
+    Единая очередь применения netplan-конфигурации.
+
+    Каждый submit() создаёт задание с job id. Задания, пришедшие в течение
+    apply_debounce секунд друг за другом, объединяются в один запуск
+    `netplan generate && netplan apply`. Запуски выполняются по одному:
+    внутри процесса - одним рабочим потоком, между воркерами gunicorn -
+    через fcntl-блокировку settings.apply_lock_file. Если другой воркер
+    начал apply уже после постановки наших заданий в очередь, наши
+    изменения уже на диске и применены им - повторный apply не нужен.
+
+    Если все задания запуска указали затронутые интерфейсы (interfaces),
+    выполняется scoped apply: `netplan generate` и перезагрузка только
+    соединений этих интерфейсов (service.scoped_apply). Полный apply -
+    когда интерфейсы не указаны, scoped apply невозможен или завершился
+    ошибкой (strategy "full_fallback").
+
+    Задания со снимком файлов (snapshot) применяются пробно и всегда
+    отдельным запуском: после apply запуск переходит в состояние probing и
+    проверяет связность (service.apply_try). Если проверки не прошли или
+    apply завершился ошибкой, изменённые заданием интерфейсы
+    восстанавливаются из снимка и применяются заново (состояние rolled_back).
+
+    Статусы заданий хранятся в общем StateStore, поэтому видны из любого
+    воркера.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending: list[dict] = []
+        self._last_submit = 0.0
+        self._listeners: dict[str, callable] = {}
+        self._snapshots: dict[str, dict] = {}
+        self._thread: threading.Thread | None = None
+
+    def submit(
+        self,
+        reason: str,
+        listener=None,
+        interfaces=None,
+        snapshot: dict | None = None,
+        confirm: bool = False,
+        changed=None,
+    ) -> str:
+        """
+        Ставит применение конфигурации в очередь.
+
+        :param listener: Необязательный callback(job), вызываемый (из потока
+            планировщика) при каждом изменении состояния задания.
+        :param interfaces: Интерфейсы, которых касается изменение
+            (netplan_diff.apply_scope); None - нужен полный netplan apply.
+        :param snapshot: Снимок файлов до записи (apply_try.take_snapshot) -
+            пробное применение с откатом к нему.
+        :param confirm: Пробное применение ждёт подтверждения клиента
+            (confirm()).
+        :param changed: Изменённые интерфейсы (diff["interfaces"]): полный
+            apply завершается, когда они появились в системе и подняты.
+        :return: job id.
+        """
+        job = {
+            "id": uuid.uuid4().hex,
+            "reason": reason,
+            "state": "queued",
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "run_id": None,
+            "interfaces": sorted(interfaces) if interfaces is not None else None,
+            "changed": sorted(changed or interfaces or []),
+            "strategy": None,
+            "duration": None,
+            "try": snapshot is not None,
+            "confirm": snapshot is not None and confirm,
+            "probes": {},
+            "phases": {},
+            "error": None,
+        }
+        get_state_store().save_apply_job(job)
+        with self._cond:
+            if listener is not None:
+                self._listeners[job["id"]] = listener
+            if snapshot is not None:
+                self._snapshots[job["id"]] = snapshot
+            self._pending.append(job)
+            self._last_submit = time.monotonic()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="netplan-apply", daemon=True
+                )
+                self._thread.start()
+            self._cond.notify()
+        logger.info(f"Netplan apply queued: job={job['id']} reason={reason}")
+        return job["id"]
+
+    @staticmethod
+    def get_job(job_id: str) -> dict | None:
+        return get_state_store().get_apply_job(job_id)
+
+    @staticmethod
+    def list_jobs() -> list[dict]:
+        return get_state_store().list_apply_jobs()
+
+    @staticmethod
+    def confirm(job_id: str) -> dict | None:
+        """
+        Подтверждает пробное применение (из любого воркера).
+
+        :return: Задание или None, если его нет.
+        :raises ValueError: если задание не ждёт подтверждения.
+        """
+        store = get_state_store()
+        job = store.get_apply_job(job_id)
+        if job is None:
+            return None
+        if not job.get("confirm") or job["state"] != "probing":
+            raise ValueError(f"Apply job {job_id} is not waiting for confirmation")
+        store.confirm_apply_job(job_id)
+        return job
+
+    def _update(self, batch: list[dict], **fields):
+        store = get_state_store()
+        for job in batch:
+            job.update(fields)
+            store.save_apply_job(job)
+            listener = self._listeners.get(job["id"])
+            if job["state"] in ("done", "failed", "rolled_back"):
+                self._listeners.pop(job["id"], None)
+            if listener is not None:
+                try:
+                    listener(dict(job))
+                except Exception as e:
+                    logger.error(f"Apply job listener failed: {e}")
+
+    def _next_batch(self) -> list[dict]:
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            # debounce: ждём, пока поток изменений не затихнет
+            first_submit = time.monotonic()
+            while True:
+                now = time.monotonic()
+                quiet_left = self._last_submit + settings.apply_debounce - now
+                total_left = first_submit + settings.apply_max_delay - now
+                wait = min(quiet_left, total_left)
+                if wait <= 0:
+                    break
+                self._cond.wait(wait)
+            # Пробное задание - всегда отдельный запуск: его проверки и откат
+            # не затрагивают соседние задания очереди
+            if self._pending[0]["try"]:
+                size = 1
+            else:
+                size = next(
+                    (i for i, job in enumerate(self._pending) if job["try"]),
+                    len(self._pending),
+                )
+            batch, self._pending = self._pending[:size], self._pending[size:]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._apply(batch)
+            except Exception as e:
+                logger.error(f"Netplan apply scheduler error: {e}")
+                APPLY_RUNS.labels(result="error").inc()
+                self._finish(batch, "failed", str(e))
+
+    @staticmethod
+    def _batch_interfaces(batch: list[dict]) -> list[str] | None:
+        if not settings.apply_scoped:
+            return None
+        if any(job["interfaces"] is None for job in batch):
+            return None
+        return sorted({iface for job in batch for iface in job["interfaces"]})
+
+    @staticmethod
+    def _batch_links(batch: list[dict]) -> list[str]:
+        """Интерфейсы в системе, готовности которых ждёт полный apply."""
+        return link_names({iface for job in batch for iface in job.get("changed", [])})
+
+    @staticmethod
+    def _read_last_run(lock_file) -> tuple[float, list[str] | None]:
+        lock_file.seek(0)
+        content = lock_file.read().strip()
+        if not content:
+            return 0.0, None
+        try:
+            last_run = json.loads(content)
+        except ValueError:
+            return 0.0, None
+        # Объединяться можно только с успешно завершённым запуском; старый
+        # формат (только время запуска) результата не хранит
+        if not isinstance(last_run, dict) or last_run.get("result") != "done":
+            return 0.0, None
+        return last_run["started"], last_run["interfaces"]
+
+    @staticmethod
+    def _write_last_run(lock_file, record: dict | None) -> None:
+        lock_file.seek(0)
+        lock_file.truncate()
+        if record is not None:
+            lock_file.write(json.dumps(record))
+        lock_file.flush()
+
+    def _take_snapshot(self, batch: list[dict]) -> dict:
+        """Снимок файлов пробного задания (оно всегда запускается отдельно)."""
+        snapshot = {}
+        with self._cond:
+            for job in batch:
+                for path, saved in self._snapshots.pop(job["id"], {}).items():
+                    snapshot.setdefault(path, saved)
+        return snapshot
+
+    def _try(self, batch, snapshot, error, phases) -> tuple[str, str | None, dict]:
+        """Проверки связности после пробного apply и откат при их провале."""
+        probes = {}
+        changed = {iface for job in batch for iface in job.get("changed", [])}
+        if error is None:
+            self._update(batch, state="probing")
+            started = time.monotonic()
+            ok, probes = run_probes(
+                snapshot, [job["id"] for job in batch if job["confirm"]], changed
+            )
+            phases["probes"] = round(time.monotonic() - started, 3)
+            if ok:
+                return "done", None, probes
+            failed = [name for name, probe in probes.items() if not probe["ok"]]
+            error = f"Connectivity probes failed: {', '.join(failed)}"
+
+        # Откат выполняется до конца при любых ошибках: иначе станция
+        # останется с непроверенной (недоступной) конфигурацией
+        logger.error(f"{error}; rolling back netplan configuration")
+        started = time.monotonic()
+        try:
+            restore_snapshot(snapshot, changed)
+        except Exception as e:
+            error = f"{error}; rollback restore failed: {e}"
+            logger.error(f"Error restoring netplan snapshot: {e}")
+        phases["rollback_restore"] = round(time.monotonic() - started, 3)
+        rollback = {}
+        try:
+            run_netplan_apply(rollback, self._batch_links(batch))
+        except Exception as e:
+            error = f"{error}; rollback apply failed: {e}"
+            logger.error(f"Error applying netplan rollback: {e}")
+        finally:
+            phases.update({f"rollback_{k}": v for k, v in rollback.items()})
+        return "rolled_back", error, probes
+
+    def _apply(self, batch: list[dict]):
+        run_id = uuid.uuid4().hex
+        last_submitted = max(job["submitted_at"] for job in batch)
+        interfaces = self._batch_interfaces(batch)
+
+        with open(settings.apply_lock_file, "a+") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                last_started, last_interfaces = self._read_last_run(lock_file)
+                # Чужой scoped apply покрывает наши задания, только если
+                # перезагрузил все наши интерфейсы
+                covered = last_interfaces is None or (
+                    interfaces is not None
+                    and set(interfaces) <= set(last_interfaces)
+                )
+                snapshot = self._take_snapshot(batch)
+                # Пробное применение не объединяется с чужим запуском:
+                # проверки и откат выполняет только этот воркер
+                if last_started > last_submitted and covered and not snapshot:
+                    logger.info(
+                        f"Netplan apply for {len(batch)} job(s) coalesced "
+                        f"into a run started by another worker"
+                    )
+                    APPLY_RUNS.labels(result="coalesced").inc()
+                    self._finish(batch, "done", None, run_id="external")
+                    return
+
+                started = time.time()
+                record = {
+                    "started": started,
+                    "interfaces": interfaces,
+                    "result": "running",
+                }
+                self._write_last_run(lock_file, record)
+
+                self._update(batch, state="running", started_at=started, run_id=run_id)
+                logger.info(
+                    f"Netplan apply run={run_id} for {len(batch)} job(s), "
+                    f"interfaces={interfaces if interfaces is not None else 'all'}"
+                )
+
+                phases = {}
+                error = None
+                strategy = "full"
+                scoped_phases = (
+                    build_scoped_phases(interfaces) if interfaces is not None else None
+                )
+                try:
+                    if scoped_phases is not None:
+                        strategy = "scoped"
+                        try:
+                            run_phases(scoped_phases, phases)
+                        except subprocess.SubprocessError as e:
+                            logger.warning(
+                                f"Scoped netplan apply failed ({e}), "
+                                f"falling back to full apply"
+                            )
+                            strategy = "full_fallback"
+                            full_phases = {}
+                            try:
+                                run_netplan_apply(
+                                    full_phases, self._batch_links(batch)
+                                )
+                            finally:
+                                phases.update(
+                                    {f"full_{k}": v for k, v in full_phases.items()}
+                                )
+                    else:
+                        run_netplan_apply(phases, self._batch_links(batch))
+                    logger.info(
+                        f"Netplan configuration applied successfully ({strategy})."
+                    )
+                except subprocess.SubprocessError as e:
+                    error = str(e)
+                    logger.error(f"Error applying netplan configuration: {error}")
+                state = "failed" if error else "done"
+                probes = {}
+                if snapshot:
+                    state, error, probes = self._try(batch, snapshot, error, phases)
+                # Неудачный или отменённый запуск ничего не покрывает: воркеры,
+                # ждущие блокировку, должны применить свои изменения сами
+                self._write_last_run(
+                    lock_file, {**record, "result": state} if state == "done" else None
+                )
+                # Один результат на запуск; длительность - вместе с проверками
+                # связности и откатом
+                duration = round(time.time() - started, 3)
+                APPLY_SECONDS.labels(strategy=strategy).observe(duration)
+                APPLY_RUNS.labels(result=state).inc()
+                self._finish(
+                    batch,
+                    state,
+                    error,
+                    phases=phases,
+                    strategy=strategy,
+                    duration=duration,
+                    probes=probes,
+                )
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _finish(self, batch, state, error, **fields):
+        with self._cond:
+            for job in batch:
+                self._snapshots.pop(job["id"], None)
+        self._update(batch, state=state, error=error, finished_at=time.time(), **fields)
+
+
+@lru_cache()
+def get_apply_scheduler() -> ApplyScheduler:
+    return ApplyScheduler()
@@ -0,0 +1,229 @@
+# service/apply_try.py
+# Пробное применение (аналог `netplan try`): перед записью сохраняется снимок
+# файлов, после apply проверяется связность (шлюзы, DNS, подтверждение
+# клиента). Если проверки не прошли за settings.apply_try_timeout секунд,
+# планировщик возвращает из снимка изменённые интерфейсы и применяет
+# конфигурацию заново - станция не остаётся недоступной после ошибочного
+# статического адреса.
+
+import asyncio
+import copy
+import os
+import stat
+import time
+from contextlib import ExitStack
+
+from core.config import settings
+from core.log import get_logger
+from service.file_locks import get_file_locks
+from service.netplan_diff import IFACE_SECTIONS
+from service.netplan_repo import get_netplan_repo, load_yaml
+from service.state_store import get_state_store
+from utils.file_utils import atomic_write
+
+logger = get_logger(__name__)
+
+PING_TIMEOUT = 1
+
+
+def take_snapshot(paths) -> dict[str, tuple[bytes, int] | None]:
+    """Содержимое и права файлов (None - файла нет) до записи."""
+    snapshot = {}
+    for path in dict.fromkeys(os.path.abspath(path) for path in paths):
+        try:
+            with open(path, "rb") as f:
+                snapshot[path] = (f.read(), stat.S_IMODE(os.fstat(f.fileno()).st_mode))
+        except FileNotFoundError:
+            snapshot[path] = None
+    return snapshot
+
+
+def _restore_interfaces(current: dict, saved: dict, interfaces) -> dict:
+    """
+    current, в котором интерфейсы interfaces и общие параметры network
+    (version, renderer) взяты из saved; остальные интерфейсы (записанные
+    другими запросами после снимка) не трогаются.
+    """
+    doc = copy.deepcopy(current)
+    network = doc.get("network")
+    if not isinstance(network, dict):
+        network = doc["network"] = {}
+    saved_network = saved.get("network") or {}
+    for key in set(network) | set(saved_network):
+        if key in IFACE_SECTIONS:
+            continue
+        if key in saved_network:
+            network[key] = copy.deepcopy(saved_network[key])
+        else:
+            network.pop(key)
+    for section in IFACE_SECTIONS:
+        saved_section = saved_network.get(section) or {}
+        configs = network.get(section) or {}
+        for name in interfaces:
+            if name in saved_section:
+                configs[name] = copy.deepcopy(saved_section[name])
+            else:
+                configs.pop(name, None)
+        if configs:
+            network[section] = configs
+        else:
+            network.pop(section, None)
+    return doc
+
+
+def _rollback_lock(paths) -> ExitStack:
+    """
+    Блокировка файлов для отката: без неё запись затёрла бы изменения
+    запроса, который держит блокировку, поэтому откат ждёт её сколько
+    потребуется (запросы держат блокировку только на время записи).
+    """
+    stack = ExitStack()
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            stack.enter_context(get_file_locks().lock_sync(paths))
+            return stack
+        except TimeoutError as e:
+            logger.warning(f"Rollback lock attempt {attempt}: {e}")
+
+
+def restore_snapshot(snapshot: dict[str, tuple[bytes, int] | None], interfaces):
+    """
+    Возвращает из снимка конфигурацию интерфейсов interfaces (изменённых
+    пробным заданием), сливая её с текущим содержимым файлов.
+    """
+    repo = get_netplan_repo()
+    with _rollback_lock(list(snapshot)):
+        for path, saved in snapshot.items():
+            try:
+                current = repo.load(path)
+                if current is None:
+                    # Файл удалён после снимка - возвращается целиком
+                    if saved is not None:
+                        atomic_write(path, saved[0], mode=saved[1])
+                    continue
+                doc = _restore_interfaces(
+                    current, load_yaml(saved[0]) or {} if saved else {}, interfaces
+                )
+                network = doc.get("network") or {}
+                if saved is None and not any(network.get(s) for s in IFACE_SECTIONS):
+                    # Файл создан пробным заданием и других интерфейсов в нём нет
+                    os.remove(path)
+                else:
+                    repo.write(path, doc)
+            finally:
+                repo.invalidate(path)
+    logger.warning(
+        f"Netplan interfaces {sorted(interfaces)} restored from snapshot: "
+        f"{list(snapshot)}"
+    )
+
+
+def snapshot_gateways(snapshot, interfaces=None) -> list[str]:
+    """
+    Шлюзы (routes.via) интерфейсов interfaces из новых версий файлов
+    снимка; без interfaces (изменены только общие параметры) - все шлюзы.
+    """
+    repo = get_netplan_repo()
+    gateways = []
+    for path in snapshot:
+        network = (repo.load(path) or {}).get("network") or {}
+        for section in IFACE_SECTIONS:
+            configs = network.get(section)
+            if not isinstance(configs, dict):
+                continue
+            for name, config in configs.items():
+                if interfaces and name not in interfaces:
+                    continue
+                if not isinstance(config, dict):
+                    continue
+                for route in config.get("routes") or []:
+                    if route.get("via"):
+                        gateways.append(str(route["via"]))
+    return list(dict.fromkeys(gateways))
+
+
+async def _until(check, deadline: float) -> bool:
+    """Повторяет check() до успеха или deadline (time.monotonic)."""
+    while True:
+        if await check():
+            return True
+        left = deadline - time.monotonic()
+        if left <= 0:
+            return False
+        await asyncio.sleep(min(settings.readiness_poll_interval, left))
+
+
+async def _ping(gateway: str) -> bool:
+    proc = await asyncio.create_subprocess_exec(
+        "ping",
+        "-c",
+        "1",
+        "-W",
+        str(PING_TIMEOUT),
+        gateway,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    return await proc.wait() == 0
+
+
+async def _resolve(host: str) -> bool:
+    try:
+        return bool(await asyncio.get_running_loop().getaddrinfo(host, None))
+    except OSError:
+        return False
+
+
+async def _confirmed(job_ids: list[str]) -> bool:
+    store = get_state_store()
+    for job_id in job_ids:
+        if not await asyncio.to_thread(store.is_apply_confirmed, job_id):
+            return False
+    return True
+
+
+async def _probe(name: str, check, deadline: float) -> tuple[str, dict]:
+    started = time.monotonic()
+    try:
+        ok = await _until(check, deadline)
+    except Exception as e:
+        logger.error(f"Probe {name} error: {e}")
+        ok = False
+    return name, {"ok": ok, "seconds": round(time.monotonic() - started, 3)}
+
+
+async def _run_probes(gateways, dns_host, confirm_ids, timeout) -> dict[str, dict]:
+    deadline = time.monotonic() + timeout
+    probes = [
+        _probe(f"gateway {gw}", lambda gw=gw: _ping(gw), deadline) for gw in gateways
+    ]
+    if dns_host:
+        probes.append(_probe(f"dns {dns_host}", lambda: _resolve(dns_host), deadline))
+    if confirm_ids:
+        probes.append(_probe("confirm", lambda: _confirmed(confirm_ids), deadline))
+    return dict(await asyncio.gather(*probes))
+
+
+def run_probes(
+    snapshot, confirm_ids: list[str], interfaces=None
+) -> tuple[bool, dict[str, dict]]:
+    """
+    Проверки связности после apply, параллельно и с общим сроком
+    settings.apply_try_timeout (вызывается из потока планировщика).
+
+    :param confirm_ids: Задания, применение которых должен подтвердить
+        клиент (POST /api/netplan/apply_confirm/{job_id}).
+    :param interfaces: Изменённые интерфейсы: проверяются только их шлюзы.
+    :return: (все проверки прошли, {проверка: {"ok", "seconds"}}).
+    """
+    probes = asyncio.run(
+        _run_probes(
+            snapshot_gateways(snapshot, interfaces),
+            settings.apply_probe_dns_host,
+            confirm_ids,
+            settings.apply_try_timeout,
+        )
+    )
+    return all(probe["ok"] for probe in probes.values()), probes
@@ -0,0 +1,114 @@
+# service/debug_profiles.py
+# Хранение профилей и профилирование отдельных запросов. Модуль лёгкий и
+# подключается в main.py сразу, в отличие от роутера api/debug.py,
+# который загружается только при первом обращении к /api/debug.
+
+import asyncio
+import os
+import secrets
+import time
+import uuid
+
+import simplejson as json
+
+from core.config import settings
+from core.log import get_logger
+from utils.file_utils import atomic_write
+from utils.profiler import SamplingProfiler
+
+logger = get_logger(__name__)
+
+PROFILE_REQUEST_HEADER = "x-profile-request"
+PROFILE_ID_HEADER = "x-profile-id"
+MAX_STORED_PROFILES = 20
+
+
+def token_valid(token: str | None) -> bool:
+    return bool(settings.debug_token) and secrets.compare_digest(
+        (token or "").encode(), settings.debug_token.encode()
+    )
+
+
+def profiles_dir() -> str:
+    return os.path.join(settings.debug_dir, "profiles")
+
+
+def save_profile(profile_id: str, result: dict):
+    """
+    Сохраняет профиль в общий каталог, чтобы его можно было получить
+    из любого воркера gunicorn; хранятся только последние профили.
+    """
+    directory = profiles_dir()
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    result = dict(result, id=profile_id, pid=os.getpid())
+    atomic_write(os.path.join(directory, f"{profile_id}.json"), json.dumps(result))
+
+    files = sorted(
+        (entry for entry in os.scandir(directory) if entry.name.endswith(".json")),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    for entry in files[:-MAX_STORED_PROFILES]:
+        try:
+            os.unlink(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def load_profile(profile_id: str) -> dict | None:
+    try:
+        uuid.UUID(hex=profile_id)
+    except ValueError:
+        return None
+    try:
+        with open(os.path.join(profiles_dir(), f"{profile_id}.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+class RequestProfilerMiddleware:
+    """
+    Профилирует отдельные запросы с заголовками X-Profile-Request и
+    X-Debug-Token: на время обработки запускается семплирующий профилировщик,
+    id сохранённого профиля возвращается в заголовке X-Profile-Id.
+
+    Семплируются все потоки воркера (event loop и threadpool для
+    синхронного кода), поэтому в профиль попадают и параллельные запросы.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        if PROFILE_REQUEST_HEADER.encode() not in headers or not token_valid(
+            headers.get(b"x-debug-token", b"").decode()
+        ):
+            return await self.app(scope, receive, send)
+
+        profile_id = uuid.uuid4().hex
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (PROFILE_ID_HEADER.encode(), profile_id.encode())
+                ]
+            await send(message)
+
+        profiler = SamplingProfiler()
+        profiler.start()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop()
+            result = profiler.result(
+                f"{scope['method']} {scope['path']} "
+                f"({round(time.perf_counter() - started, 3)}s)"
+            )
+            try:
+                await asyncio.to_thread(save_profile, profile_id, result)
+            except Exception as e:
+                logger.error(f"Failed to save request profile: {e}")
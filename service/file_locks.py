@@ -0,0 +1,147 @@
+# service/file_locks.py
+# Блокировки read-modify-write netplan-файлов. Внутри воркера запросы к
+# одному файлу ждут asyncio.Lock, между воркерами gunicorn - fcntl-блокировку
+# отдельного файла в settings.lock_dir (сам netplan-файл заменяется через
+# rename, блокировка на нём не пережила бы запись). Разные файлы не
+# блокируют друг друга.
+
+import asyncio
+import fcntl
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from functools import lru_cache
+
+from fastapi import HTTPException
+
+from core.config import settings
+from core.log import get_logger
+from core.metrics import FILE_LOCK_TIMEOUTS, FILE_LOCK_WAIT_SECONDS
+
+logger = get_logger(__name__)
+
+# Интервал опроса fcntl-блокировки: от 5 мс с удвоением до 100 мс
+POLL_MIN = 0.005
+POLL_MAX = 0.1
+
+
+class FileLockManager:
+    """
+    Блокировки по пути файла.
+
+        async with get_file_locks().lock([settings.netplan_eth]):
+            # repo.load(...), изменение, repo.update(...) - в потоке
+            diff = await asyncio.to_thread(read_modify_write)
+
+    Несколько файлов блокируются в порядке сортировки путей, поэтому
+    запросы, меняющие одни и те же файлы, не блокируют друг друга навечно.
+    """
+
+    def __init__(self):
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    @staticmethod
+    def _lock_path(path: str) -> str:
+        name = os.path.abspath(path).strip("/").replace("/", "_")
+        return os.path.join(settings.lock_dir, f"{name}.lock")
+
+    @staticmethod
+    def _open(path: str):
+        os.makedirs(settings.lock_dir, mode=0o700, exist_ok=True)
+        return open(FileLockManager._lock_path(path), "a")
+
+    @staticmethod
+    def _try_flock(lock_file) -> bool:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    @staticmethod
+    def _timeout(path: str, timeout: float):
+        FILE_LOCK_TIMEOUTS.labels(file=os.path.basename(path)).inc()
+        logger.warning(f"Lock on {path} not acquired in {timeout}s")
+        raise HTTPException(
+            status_code=503, detail=f"{os.path.basename(path)} is busy, try again"
+        )
+
+    @asynccontextmanager
+    async def lock(self, paths, timeout: float | None = None):
+        """
+        Блокирует файлы paths на время блока (из event loop воркера).
+
+        :raises HTTPException: 503, если блокировки не получены за timeout
+            (по умолчанию settings.file_lock_timeout) секунд.
+        """
+        timeout = settings.file_lock_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        held = []
+        try:
+            for path in sorted({os.path.abspath(path) for path in paths}):
+                started = time.monotonic()
+                lock = self._locks.setdefault(path, asyncio.Lock())
+                try:
+                    await asyncio.wait_for(
+                        lock.acquire(), max(0.0, deadline - time.monotonic())
+                    )
+                except asyncio.TimeoutError:
+                    self._timeout(path, timeout)
+                try:
+                    lock_file = self._open(path)
+                except BaseException:
+                    lock.release()
+                    raise
+                held.append((lock, lock_file))
+                interval = POLL_MIN
+                while not self._try_flock(lock_file):
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        self._timeout(path, timeout)
+                    await asyncio.sleep(min(interval, left))
+                    interval = min(interval * 2, POLL_MAX)
+                FILE_LOCK_WAIT_SECONDS.labels(file=os.path.basename(path)).observe(
+                    time.monotonic() - started
+                )
+            yield
+        finally:
+            for lock, lock_file in reversed(held):
+                lock_file.close()  # снимает fcntl-блокировку
+                lock.release()
+
+    @contextmanager
+    def lock_sync(self, paths, timeout: float | None = None):
+        """
+        То же для потоков (планировщик apply): только fcntl-блокировка -
+        flock через отдельно открытый файл исключает и запросы этого воркера.
+
+        :raises TimeoutError: если блокировки не получены за timeout секунд.
+        """
+        timeout = settings.file_lock_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        held = []
+        try:
+            for path in sorted({os.path.abspath(path) for path in paths}):
+                started = time.monotonic()
+                lock_file = self._open(path)
+                held.append(lock_file)
+                interval = POLL_MIN
+                while not self._try_flock(lock_file):
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        FILE_LOCK_TIMEOUTS.labels(file=os.path.basename(path)).inc()
+                        raise TimeoutError(f"Lock on {path} not acquired in {timeout}s")
+                    time.sleep(min(interval, left))
+                    interval = min(interval * 2, POLL_MAX)
+                FILE_LOCK_WAIT_SECONDS.labels(file=os.path.basename(path)).observe(
+                    time.monotonic() - started
+                )
+            yield
+        finally:
+            for lock_file in reversed(held):
+                lock_file.close()
+
+
+@lru_cache()
+def get_file_locks() -> FileLockManager:
+    return FileLockManager()
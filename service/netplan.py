@@ -1,20 +1,26 @@
 # service.netplan
 
-import io
-import threading
+import asyncio
+import errno
+import os
 from functools import lru_cache
-from pathlib import Path
 
-import simplejson as json
 import yaml
 from fastapi import HTTPException
 from fastapi.encoders import jsonable_encoder
 
 from core.config import settings
-from core.log import logger
-from model.models import BaseWiFiData, UpdateWiFiData
-from utils.ip_utils import connection_wifi_up
-from utils.os_utils import delayed_netplan_change
+from core.log import LazyJson, get_logger
+from model.models import BaseWiFiData, NetworkState, UpdateWiFiData
+from service.apply_scheduler import get_apply_scheduler
+from service.apply_try import take_snapshot
+from service.file_locks import get_file_locks
+from service.netplan_diff import apply_scope, merge_diffs
+from service.netplan_repo import get_netplan_repo
+from service.netplan_validation import ensure_valid, validate
+from utils.ip_utils import connection_wifi_up, connection_wifi_up_async
+
+logger = get_logger(__name__)
 
 
 class NetplanService:
@@ -22,26 +28,33 @@ class NetplanService:
         self.name = "netplan_service"
 
     @staticmethod
-    async def apply_conn_wifi():
-        # Применение изменений через команду netplan
+    async def apply_conn_wifi(listener=None, interfaces=None, changed=None) -> str:
+        # Применение изменений через планировщик netplan apply (submit пишет
+        # задание в StateStore - не в event loop)
         logger.info("Applying netplan changes...")
-        thr = threading.Thread(target=delayed_netplan_change)
-        thr.start()
+        return await asyncio.to_thread(
+            get_apply_scheduler().submit,
+            "wifi",
+            listener,
+            interfaces,
+            changed=changed,
+        )
 
     @staticmethod
     def get_network(netplan_config):
-        with open(netplan_config, "r") as stream:
-            try:
-                netplan_config = yaml.safe_load(stream)
-                if settings.debug:
-                    logger.debug("netplan_config = " + json.dumps(netplan_config))
-                stream.close()
-            except yaml.YAMLError as e:
-                logger.error(f"error = {str(e)}")
-                raise HTTPException(status_code=500, detail=str(e))
+        config_name = netplan_config
+        try:
+            netplan_config = get_netplan_repo().load(config_name)
+            logger.debug("netplan_config = %s", LazyJson(netplan_config))
+        except yaml.YAMLError as e:
+            logger.error(f"error = {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+        if netplan_config is None:
+            raise FileNotFoundError(
+                errno.ENOENT, os.strerror(errno.ENOENT), config_name
+            )
         network = netplan_config.get("network")
-        if settings.debug:
-            logger.debug("network = " + json.dumps(network))
+        logger.debug("network = %s", LazyJson(network))
         return network
 
     async def get_eth_interfaces(self):
@@ -50,8 +63,7 @@ class NetplanService:
 
         ethernets = network.get("ethernets", "")
         if ethernets:
-            if settings.debug:
-                logger.debug("ethernets = " + json.dumps(ethernets))
+            logger.debug("ethernets = %s", LazyJson(ethernets))
             for key, value in ethernets.items():
                 iface = {}
                 iface["dhcp"] = value.get("dhcp4", False)
@@ -69,14 +81,12 @@ class NetplanService:
         return ifaces
 
     async def get_wifi_interfaces(self):
-        debug = True
         ifaces = {}
 
         network = self.get_network(settings.netplan_wifi)
         wifis = network.get("wifis", "")
         if wifis:
-            if debug:
-                logger.debug("wifis = " + json.dumps(wifis))
+            logger.debug("wifis = %s", LazyJson(wifis))
             for key, value in wifis.items():
                 iface = {}
                 iface["dhcp"] = value.get("dhcp4", False)
@@ -94,19 +104,16 @@ class NetplanService:
                     iface["ssid_password"] = wifi_access_points[key].get("password", {})
 
                 ifaces[key] = iface
-        if debug:
-            logger.info(f"ifaces = {json.dumps(ifaces)}")
+        logger.debug("ifaces = %s", LazyJson(ifaces))
         return ifaces
 
     async def get_br_interfaces(self):
-        debug = True
         ifaces = {}
 
         network = self.get_network(settings.netplan_wifi)
         bridges = network.get("bridges", "")
         if bridges:
-            if settings.debug:
-                logger.debug("bridges = " + json.dumps(bridges))
+            logger.debug("bridges = %s", LazyJson(bridges))
 
             for key, value in bridges.items():
                 iface = {}
@@ -119,149 +126,307 @@ class NetplanService:
                         br0_gateway = routes[0].get("via", "")
                     if nameservers:
                         br0_nameservers = nameservers.get("addresses", "")
-        if debug:
-            logger.info(f"ifaces = {json.dumps(ifaces)}")
+        logger.debug("ifaces = %s", LazyJson(ifaces))
         return ifaces
 
     @staticmethod
     def get_netplan_conf(config_name):
-        netplan_path = Path(config_name)
-        if netplan_path.exists():
-            try:
-                with open(netplan_path, "r") as stream:
-                    netplan_config = yaml.safe_load(stream)
-                    logger.debug(f"netplan_config = {json.dumps(netplan_config)}")
+        try:
+            netplan_config = get_netplan_repo().load(config_name)
+            if netplan_config is not None:
+                logger.debug("netplan_config = %s", LazyJson(netplan_config))
                 return netplan_config
-            except yaml.YAMLError as e:
-                logger.error(f"Error reading netplan file: {str(e)}")
+        except yaml.YAMLError as e:
+            logger.error(f"Error reading netplan file: {str(e)}")
         return {}
 
-
     @staticmethod
     def netplan_conf_up(netplan_config):
+        device, ap = NetplanService._first_wifi_ap(netplan_config)
+        return connection_wifi_up(device, ap)
+
+    @staticmethod
+    async def netplan_conf_up_async(netplan_config):
+        device, ap = NetplanService._first_wifi_ap(netplan_config)
+        return await connection_wifi_up_async(device, ap)
+
+    @staticmethod
+    def _first_wifi_ap(netplan_config):
         wifis = netplan_config.get("network").get("wifis")
         device = list(wifis.keys())[0]
         ap_dict = wifis[device].get("access-points")
         ap = list(ap_dict.keys())[0]
-        return connection_wifi_up(device, ap)
+        return device, ap
 
     @staticmethod
-    async def create_netplan_config(data: BaseWiFiData):
-        data = jsonable_encoder(data)
-        debug = settings.debug
-        if debug:
-            logger.debug(f"data = {json.dumps(data)}")
+    def ensure_network(netplan_config: dict, renderer: str | None = None) -> dict:
+        """Возвращает секцию network, создавая её при необходимости."""
+        if not netplan_config.get("network"):
+            netplan_config["network"] = {"version": 2}
+            if renderer:
+                netplan_config["network"]["renderer"] = renderer
+        return netplan_config["network"]
 
-        # Создание объекта netplan Wi-Fi
+    @staticmethod
+    def normalize_addresses(addresses) -> list:
+        normalized = []
+        for addr in addresses or []:
+            if "/" not in addr:
+                addr += "/24"  # Указываем префикс по умолчанию (например, 24)
+            normalized.append(addr)
+        return normalized
+
+    @staticmethod
+    def build_ethernet(
+        name, mac=None, dhcp=False, gateway="", addresses=None, nameservers=None
+    ) -> dict:
+        # create netplan objects (https://netplan.io/)
+        netplan_eth = {"dhcp4": dhcp, "dhcp6": False}
+        if mac:
+            netplan_eth["match"] = {"macaddress": mac}
+            netplan_eth["set-name"] = name
+        if not dhcp:
+            if gateway:
+                netplan_eth["routes"] = [{"to": "default", "via": gateway}]
+            netplan_eth["addresses"] = addresses or []
+            netplan_eth["nameservers"] = {"addresses": nameservers or []}
+        return netplan_eth
+
+    @staticmethod
+    def build_bridge(
+        interfaces, dhcp=False, gateway="", addresses=None, nameservers=None
+    ) -> dict:
+        netplan_br = {"interfaces": list(interfaces), "dhcp4": dhcp}
+        if addresses:
+            netplan_br["addresses"] = addresses
+        if gateway:
+            netplan_br["routes"] = [{"to": "default", "via": gateway}]
+        if nameservers:
+            netplan_br["nameservers"] = {"addresses": nameservers}
+        return netplan_br
+
+    @staticmethod
+    def build_wifi(ssid, password, addresses=None, nameservers=None) -> dict:
         netplan_wifi = {
             "dhcp4": True,  # Используем DHCP для IPv4
             "dhcp6": True,  # Включаем DHCP для IPv6
-            "access-points": {data["ssid"]: {"password": data["ssidPassword"]}},
         }
+        if addresses:
+            netplan_wifi["addresses"] = NetplanService.normalize_addresses(addresses)
+        netplan_wifi["access-points"] = {ssid: {"password": password}}
+        if nameservers:
+            netplan_wifi["nameservers"] = {"addresses": nameservers}
+        return netplan_wifi
+
+    async def apply_network_state(
+        self, state: NetworkState, try_apply: bool = False, confirm: bool = False
+    ) -> dict:
+        """
+        Применяет желаемое состояние нескольких интерфейсов за один проход.
+
+        Ethernet и bridge интерфейсы пишутся в settings.netplan_eth, Wi-Fi -
+        в settings.netplan_wifi01. Все проверки выполняются до записи;
+        каждый затронутый файл пишется один раз, apply запускается один раз.
+        С try_apply конфигурация откатывается, если после apply пропала
+        связность (или нет подтверждения клиента при confirm).
+        """
+        errors = []
+        sections = {
+            "ethernets": state.ethernets,
+            "bridges": state.bridges,
+            "wifis": state.wifis,
+        }
+        seen = {}
+        for section, ifaces in sections.items():
+            for name in ifaces:
+                if name in seen:
+                    errors.append(f"{name}: defined in both {seen[name]} and {section}")
+                seen[name] = section
+
+        # Файлы, которые меняет запрос: read-modify-write под блокировкой
+        # файлов (между воркерами тоже)
+        paths = []
+        if state.ethernets or state.bridges:
+            paths.append(settings.netplan_eth)
+        if state.wifis:
+            paths.append(settings.netplan_wifi01)
+
+        # Чтение, проверка и запись файлов - в потоке, под блокировкой
+        async with get_file_locks().lock(paths):
+            files, diff, snapshot = await asyncio.to_thread(
+                self._write_network_state, state, errors, try_apply
+            )
+            job_id = (
+                await asyncio.to_thread(
+                    get_apply_scheduler().submit,
+                    "submitNetwork",
+                    interfaces=apply_scope(diff),
+                    snapshot=snapshot,
+                    confirm=confirm,
+                    changed=diff["interfaces"],
+                )
+                if files
+                else None
+            )
+            return {"response": "OK", "files": files, "job_id": job_id, "diff": diff}
+
+    def _write_network_state(
+        self, state: NetworkState, errors: list, try_apply: bool
+    ) -> tuple[list[str], dict, dict | None]:
+        """
+        Read-modify-write файлов apply_network_state (вызывается в потоке
+        под блокировкой файлов).
+
+        :return: (записанные файлы, общая разница, снимок для отката или None).
+        """
+        repo = get_netplan_repo()
+        try:
+            eth_config = repo.load(settings.netplan_eth) or {}
+            wifi_config = repo.load(settings.netplan_wifi01) or {}
+        except yaml.YAMLError as e:
+            logger.error(f"Error reading netplan file: {str(e)}")
+            raise HTTPException(status_code=500, detail="Error reading netplan file")
+
+        eth_network = self.ensure_network(eth_config)
+        wifi_network = self.ensure_network(wifi_config, "NetworkManager")
+
+        for name, eth in state.ethernets.items():
+            ethernets = eth_network.setdefault("ethernets", {})
+            if eth is None:
+                ethernets.pop(name, None)
+            else:
+                ethernets[name] = self.build_ethernet(
+                    name,
+                    mac=eth.mac,
+                    dhcp=eth.dhcp,
+                    gateway=eth.gateway,
+                    addresses=eth.addresses,
+                    nameservers=eth.nameservers,
+                )
 
-        if debug:
-            logger.debug(f"netplan_wifi = {json.dumps(netplan_wifi)}")
+        for name, br in state.bridges.items():
+            bridges = eth_network.setdefault("bridges", {})
+            if br is None:
+                bridges.pop(name, None)
+            else:
+                bridges[name] = self.build_bridge(
+                    br.interfaces,
+                    dhcp=br.dhcp,
+                    gateway=br.gateway,
+                    addresses=br.addresses,
+                    nameservers=br.nameservers,
+                )
 
-        netplan_config = NetplanService.get_netplan_conf(settings.netplan_wifi01)
+        for name, wifi in state.wifis.items():
+            wifis = wifi_network.setdefault("wifis", {})
+            if wifi is None:
+                wifis.pop(name, None)
+            else:
+                wifis[name] = self.build_wifi(
+                    wifi.ssid,
+                    wifi.ssidPassword,
+                    addresses=wifi.addresses,
+                    nameservers=wifi.nameservers,
+                )
 
-        if "network" not in netplan_config:
-            netplan_config["network"] = {}
-            netplan_config["network"]["version"] = 2
-            netplan_config["network"]["renderer"] = "NetworkManager"
+        # Адреса, шлюзы, MAC, члены bridge, наличие интерфейсов и конфликты
+        # с остальными файлами netplan - до записи
+        updates = {}
+        if state.ethernets or state.bridges:
+            updates[settings.netplan_eth] = eth_config
+        if state.wifis:
+            updates[settings.netplan_wifi01] = wifi_config
+        errors.extend(validate(updates))
+
+        if errors:
+            raise HTTPException(status_code=422, detail=errors)
+
+        snapshot = take_snapshot(updates) if try_apply else None
+
+        # Пишутся только файлы, конфигурация в которых по смыслу изменилась
+        files = []
+        diffs = []
+        for path, config, touched in (
+            (settings.netplan_eth, eth_config, state.ethernets or state.bridges),
+            (settings.netplan_wifi01, wifi_config, state.wifis),
+        ):
+            if not touched:
+                continue
+            file_diff = repo.update(path, config)
+            diffs.append(file_diff)
+            if file_diff["changed"]:
+                files.append(path)
+
+        return files, merge_diffs(diffs), snapshot
 
-        # Обновление или создание записи для Wi-Fi интерфейса (например, wlan0)
-        if "wifis" not in netplan_config["network"]:
-            netplan_config["network"]["wifis"] = {}
+    @staticmethod
+    async def create_netplan_config(data: BaseWiFiData):
+        data = jsonable_encoder(data)
+        logger.debug("data = %s", LazyJson(data))
 
-        # Обновляем конфигурацию Wi-Fi для заданного интерфейса (iwface)
-        netplan_config["network"]["wifis"][data["iwface"]] = netplan_wifi
+        # Создание объекта netplan Wi-Fi
+        netplan_wifi = NetplanService.build_wifi(data["ssid"], data["ssidPassword"])
 
-        # Запись в файл Netplan
-        try:
-            with io.open(settings.netplan_wifi01, "w", encoding="utf8") as outfile:
-                yaml.dump(
-                    netplan_config,
-                    outfile,
-                    default_flow_style=False,
-                    allow_unicode=True,
-                )
-                if debug:
-                    logger.debug(f"Updated netplan_config = {json.dumps(netplan_config)}")
-        except Exception as e:
-            logger.error(f"Error writing netplan file: {str(e)}")
-            return False
-        return True
+        logger.debug("netplan_wifi = %s", LazyJson(netplan_wifi))
+
+        # read-modify-write под блокировкой файла (между воркерами тоже)
+        async with get_file_locks().lock([settings.netplan_wifi01]):
+            return await asyncio.to_thread(
+                NetplanService._write_wifi, data["iwface"], netplan_wifi
+            )
 
     async def update_wifi(self, data: UpdateWiFiData):
-        debug = settings.debug
         data = jsonable_encoder(data)
 
-        if debug:
-            logger.debug(f"data = {json.dumps(data)}")
-
-        addresses = []
-        for addr in data["addresses"]:
-            if "/" not in addr:
-                addr += "/24"  # Указываем префикс по умолчанию (например, 24)
-            addresses.append(addr)
+        logger.debug("data = %s", LazyJson(data))
 
         # create netplan objects (https://netplan.io/)
-        netplan_wifi = {
-            "dhcp4": True,
-            "dhcp6": True,
-            "addresses": addresses,
-            "access-points": {data["ssid"]: {"password": data["ssidPassword"]}},
-        }
+        netplan_wifi = self.build_wifi(
+            data["ssid"],
+            data["ssidPassword"],
+            addresses=data["addresses"],
+            nameservers=data.get("nameservers"),
+        )
 
-        if data.get("nameservers"):
-            netplan_wifi["nameservers"] = {"addresses": data["nameservers"]}
+        logger.debug("netplan_wifi = %s", LazyJson(netplan_wifi))
 
-        if debug:
-            logger.debug("netplan_wifi = " + json.dumps(netplan_wifi))
+        # read-modify-write под блокировкой файла (между воркерами тоже)
+        async with get_file_locks().lock([settings.netplan_wifi01]):
+            return await asyncio.to_thread(
+                self._write_wifi, data["iwface"], netplan_wifi
+            )
 
-        # get netplan file
-        netplan_path = Path(settings.netplan_wifi01)
-        if netplan_path.exists():
-            try:
-                with open(netplan_path, "r") as stream:
-                    netplan_config = yaml.safe_load(stream)
-                    if debug:
-                        logger.debug(f"netplan_config = {json.dumps(netplan_config)}")
-            except yaml.YAMLError as e:
-                logger.error(f"Error reading netplan file: {str(e)}")
-                raise HTTPException(
-                    status_code=500, detail="Error reading netplan file"
-                )
+    @staticmethod
+    def _write_wifi(iwface: str, netplan_wifi: dict) -> dict | None:
+        """
+        Read-modify-write settings.netplan_wifi01 (вызывается в потоке под
+        блокировкой файла).
 
-        if "network" not in netplan_config:
-            netplan_config["network"] = {}
-            netplan_config["network"]["version"] = 2
-            netplan_config["network"]["renderer"] = "NetworkManager"
+        :return: Разница конфигураций или None, если файл не записан.
+        """
+        # get netplan file
+        try:
+            netplan_config = get_netplan_repo().load(settings.netplan_wifi01) or {}
+            logger.debug("netplan_config = %s", LazyJson(netplan_config))
+        except yaml.YAMLError as e:
+            logger.error(f"Error reading netplan file: {str(e)}")
+            raise HTTPException(status_code=500, detail="Error reading netplan file")
 
-        # Обновление или создание записи для Wi-Fi интерфейса (например, wlan0)
-        if "wifis" not in netplan_config["network"]:
-            netplan_config["network"]["wifis"] = {}
+        network = NetplanService.ensure_network(netplan_config, "NetworkManager")
 
         # Обновляем конфигурацию Wi-Fi для заданного интерфейса (iwface)
-        netplan_config["network"]["wifis"][data["iwface"]] = netplan_wifi
+        network.setdefault("wifis", {})[iwface] = netplan_wifi
+
+        logger.debug("Updated netplan_config = %s", LazyJson(netplan_config))
 
-        if debug:
-            logger.debug(f"Updated netplan_config = {json.dumps(netplan_config)}")
+        ensure_valid({settings.netplan_wifi01: netplan_config})
 
-        # Запись изменений обратно в файл Netplan
+        # Запись изменений обратно в файл Netplan (если они есть)
         try:
-            with io.open(settings.netplan_wifi01, "w", encoding="utf8") as outfile:
-                yaml.dump(
-                    netplan_config,
-                    outfile,
-                    default_flow_style=False,
-                    allow_unicode=True,
-                )
+            return get_netplan_repo().update(settings.netplan_wifi01, netplan_config)
         except Exception as e:
             logger.error(f"Error writing netplan file: {str(e)}")
-            return False
-        # netplan_path.chmod(0o644)
-        return True
+            return None
 
 
 @lru_cache()
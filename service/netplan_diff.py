@@ -0,0 +1,164 @@
+# service/netplan_diff.py
+# Семантическое сравнение netplan-документов: одинаковая по смыслу
+# конфигурация (другой порядок ключей и адресов, 2001:DB8::1/64 и
+# 2001:db8::1/64, явное dhcp6: false и его отсутствие) не считается
+# изменением, и запись файла и netplan apply не нужны.
+
+import ipaddress
+
+from core.log import REDACTED, is_secret_key
+
+# Секции network, ключи которых - имена интерфейсов
+IFACE_SECTIONS = (
+    "ethernets",
+    "wifis",
+    "bridges",
+    "bonds",
+    "vlans",
+    "tunnels",
+    "modems",
+    "vrfs",
+)
+# Секции, изменения в которых можно применить перезагрузкой соединения
+# интерфейса; виртуальные устройства (bridge, bond, vlan ...) создаёт
+# только полный netplan apply
+SCOPED_SECTIONS = ("ethernets", "wifis")
+# Переименование интерфейса (udev) требует полного apply
+FULL_APPLY_KEYS = ("match", "set-name", "renderer")
+# Флаги netplan, которые по умолчанию выключены
+DEFAULT_FALSE = ("dhcp4", "dhcp6", "optional", "critical")
+# Списки, порядок элементов в которых не важен (порядок DNS-серверов важен)
+UNORDERED_LISTS = ("addresses", "interfaces", "routes", "routing-policy")
+DEFAULT_ROUTES = ("0.0.0.0/0", "::/0")
+
+
+def _normalize_ip(value):
+    if not isinstance(value, str):
+        return value
+    try:
+        if "/" in value:
+            return str(ipaddress.ip_interface(value))
+        return str(ipaddress.ip_address(value))
+    except ValueError:
+        return value
+
+
+def _sort_key(value) -> str:
+    return repr(value)
+
+
+def normalize(value, key: str | None = None, parent: str | None = None):
+    """Каноническая форма фрагмента документа (key - ключ, под которым он лежит)."""
+    if isinstance(value, dict):
+        result = {}
+        for k, v in value.items():
+            v = normalize(v, k, key)
+            if v in (None, "", [], {}) or (k in DEFAULT_FALSE and v is False):
+                continue
+            result[k] = v
+        return result
+    if isinstance(value, list):
+        items = [normalize(item, None, key) for item in value]
+        if key in UNORDERED_LISTS and parent != "nameservers":
+            items.sort(key=_sort_key)
+        return items
+    if key == "macaddress" and isinstance(value, str):
+        return value.lower()
+    if key == "to" and value in DEFAULT_ROUTES:
+        return "default"
+    if key in ("via", "to") or parent in ("addresses", "nameservers"):
+        return _normalize_ip(value)
+    return value
+
+
+def _safe(path: list, value):
+    # Пароли Wi-Fi не попадают в ответ API
+    if any(is_secret_key(part) for part in path if isinstance(part, str)):
+        return REDACTED
+    if isinstance(value, dict):
+        return {k: _safe(path + [k], v) for k, v in value.items()}
+    return value
+
+
+def _walk(old, new, path: list, changes: list):
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in sorted(set(old) | set(new), key=str):
+            if key not in new:
+                changes.append(
+                    {"path": path + [key], "op": "remove", "old": old[key]}
+                )
+            elif key not in old:
+                changes.append({"path": path + [key], "op": "add", "new": new[key]})
+            else:
+                _walk(old[key], new[key], path + [key], changes)
+    elif old != new:
+        changes.append({"path": path, "op": "change", "old": old, "new": new})
+
+
+def diff_documents(current: dict | None, desired: dict | None) -> dict:
+    """
+    Разница между текущим и желаемым документом.
+
+    :return: {"changed", "changes": [{"path", "op", "old", "new"}],
+        "interfaces": затронутые интерфейсы, "global": изменены ли настройки
+        вне секций интерфейсов (renderer, version ...), "scoped": достаточно
+        ли перезагрузить соединения затронутых интерфейсов}.
+    """
+    changes = []
+    _walk(normalize(current or {}), normalize(desired or {}), [], changes)
+
+    interfaces = set()
+    is_global = False
+    scoped = True
+    for change in changes:
+        path = change["path"]
+        if len(path) >= 3 and path[0] == "network" and path[1] in IFACE_SECTIONS:
+            interfaces.add(path[2])
+            if (
+                path[1] not in SCOPED_SECTIONS
+                or (len(path) == 3 and change["op"] == "remove")
+                or any(part in FULL_APPLY_KEYS for part in path[3:])
+            ):
+                scoped = False
+        elif len(path) == 2 and path[0] == "network" and path[1] in IFACE_SECTIONS:
+            # Секция целиком добавлена/удалена: удалённые интерфейсы и секции
+            # без scoped apply (bridges ...) требуют полного netplan apply
+            section = change.get("new") or change.get("old") or {}
+            interfaces.update(section)
+            if path[1] not in SCOPED_SECTIONS or change["op"] == "remove":
+                scoped = False
+        else:
+            if path == ["network"]:
+                network = change.get("new") or change.get("old") or {}
+                for section in IFACE_SECTIONS:
+                    interfaces.update(network.get(section, {}))
+            is_global = True
+        for field in ("old", "new"):
+            if field in change:
+                change[field] = _safe(path, change[field])
+        change["path"] = ".".join(str(part) for part in path)
+
+    return {
+        "changed": bool(changes),
+        "changes": changes,
+        "interfaces": sorted(interfaces),
+        "global": is_global,
+        "scoped": bool(changes) and scoped and not is_global,
+    }
+
+
+def apply_scope(diff: dict) -> list[str] | None:
+    """Интерфейсы для scoped apply или None, если нужен полный netplan apply."""
+    return diff["interfaces"] if diff["scoped"] else None
+
+
+def merge_diffs(diffs: list[dict]) -> dict:
+    """Объединяет разницы нескольких файлов в одну."""
+    return {
+        "changed": any(d["changed"] for d in diffs),
+        "changes": [change for d in diffs for change in d["changes"]],
+        "interfaces": sorted({iface for d in diffs for iface in d["interfaces"]}),
+        "global": any(d["global"] for d in diffs),
+        "scoped": any(d["changed"] for d in diffs)
+        and all(d["scoped"] for d in diffs if d["changed"]),
+    }
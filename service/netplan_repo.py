@@ -0,0 +1,254 @@
+# service/netplan_repo.py
+
+import copy
+import ctypes
+import ctypes.util
+import os
+import struct
+import threading
+import time
+from functools import lru_cache
+
+import yaml
+
+from core.log import get_logger
+from core.metrics import CACHE_REQUESTS, CONFIG_UPDATES, YAML_BYTES, YAML_SECONDS
+from service.netplan_diff import diff_documents
+from utils.file_utils import atomic_write
+
+logger = get_logger(__name__)
+
+# libyaml-ускоренные загрузчик/дампер, если PyYAML собран с ним
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+YamlDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+# inotify(7)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def load_yaml(stream):
+    with YAML_SECONDS.time(op="load"):
+        return yaml.load(stream, Loader=YamlLoader)
+
+
+def dump_yaml(data, stream=None):
+    with YAML_SECONDS.time(op="dump"):
+        return yaml.dump(
+            data,
+            stream,
+            Dumper=YamlDumper,
+            default_flow_style=False,
+            allow_unicode=True,
+        )
+
+
+class _InotifyWatcher:
+    """
+    Следит за каталогами netplan через inotify (ctypes, без зависимостей)
+    и вызывает callback(path) при любом изменении файла в них.
+    """
+
+    def __init__(self, callback):
+        self._callback = callback
+        self._fd = -1
+        self._dirs: dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._libc = None
+        try:
+            self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            self._fd = self._libc.inotify_init1(os.O_CLOEXEC)
+        except (OSError, AttributeError) as e:
+            logger.debug(f"inotify is not available: {e}")
+        if self._fd < 0:
+            logger.info("inotify is not available, using stat() checks only")
+            return
+        threading.Thread(
+            target=self._run, name="netplan-inotify", daemon=True
+        ).start()
+
+    @property
+    def active(self) -> bool:
+        return self._fd >= 0
+
+    def watch(self, directory: str):
+        if not self.active:
+            return
+        with self._lock:
+            if directory in self._dirs.values():
+                return
+            wd = self._libc.inotify_add_watch(
+                self._fd, os.fsencode(directory), IN_WATCH_MASK
+            )
+            if wd < 0:
+                logger.debug(
+                    f"inotify_add_watch({directory}) failed: "
+                    f"{os.strerror(ctypes.get_errno())}"
+                )
+                return
+            self._dirs[wd] = directory
+
+    def _run(self):
+        while True:
+            try:
+                data = os.read(self._fd, 4096)
+            except OSError as e:
+                logger.error(f"inotify read failed: {e}")
+                return
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                wd, _mask, _cookie, name_len = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset : offset + name_len].rstrip(b"\0")
+                offset += name_len
+                directory = self._dirs.get(wd)
+                if directory and name:
+                    self._callback(os.path.join(directory, os.fsdecode(name)))
+
+
+class NetplanRepository:
+    """
+    Кэш разобранных netplan-файлов.
+
+    Документ хранится вместе с ключом (inode, mtime, size) файла и
+    перечитывается только при изменении ключа, после записи через write()
+    или по событию inotify. Наружу отдаются глубокие копии, поэтому
+    вызывающий код может свободно менять полученный словарь.
+    """
+
+    def __init__(self):
+        self._docs: dict[str, tuple[tuple, dict]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._watcher = _InotifyWatcher(self.invalidate)
+
+    @staticmethod
+    def _file_key(st: os.stat_result) -> tuple:
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def load(self, path: str) -> dict | None:
+        """
+        Возвращает копию разобранного документа или None, если файла нет.
+
+        :raises yaml.YAMLError: если файл не является корректным YAML.
+        """
+        path = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self.invalidate(path)
+            return None
+
+        key = self._file_key(st)
+        with self._lock:
+            cached = self._docs.get(path)
+            if cached is not None and cached[0] == key:
+                self.hits += 1
+                CACHE_REQUESTS.labels(cache="netplan_repo", result="hit").inc()
+                return copy.deepcopy(cached[1])
+            self.misses += 1
+            CACHE_REQUESTS.labels(cache="netplan_repo", result="miss").inc()
+
+        self._watcher.watch(os.path.dirname(path))
+        with open(path, "r") as stream:
+            doc = load_yaml(stream)
+        YAML_BYTES.labels(op="load").observe(st.st_size)
+        if doc is None:
+            doc = {}
+
+        with self._lock:
+            self._docs[path] = (key, doc)
+        return copy.deepcopy(doc)
+
+    def write(self, path: str, doc: dict):
+        """Атомарно записывает документ в файл и сбрасывает его кэш."""
+        path = os.path.abspath(path)
+        try:
+            data = dump_yaml(doc)
+            YAML_BYTES.labels(op="dump").observe(len(data.encode()))
+            atomic_write(path, data)
+        finally:
+            self.invalidate(path)
+
+    def update(self, path: str, doc: dict) -> dict:
+        """
+        Записывает документ, только если он по смыслу отличается от файла.
+
+        :return: Разница (netplan_diff.diff_documents); при changed=False
+            файл не перезаписывается и netplan apply не нужен.
+        """
+        diff = diff_documents(self.load(path), doc)
+        if diff["changed"]:
+            self.write(path, doc)
+            CONFIG_UPDATES.labels(result="changed").inc()
+        else:
+            CONFIG_UPDATES.labels(result="unchanged").inc()
+            logger.info(f"{path}: no changes, write skipped")
+        return diff
+
+    def invalidate(self, path: str | None = None):
+        with self._lock:
+            if path is None:
+                self._docs.clear()
+            else:
+                self._docs.pop(os.path.abspath(path), None)
+
+    def export(self) -> dict:
+        """Разобранные документы с ключами файлов (для сохранения на диск)."""
+        with self._lock:
+            return {
+                path: {"key": list(key), "doc": copy.deepcopy(doc)}
+                for path, (key, doc) in self._docs.items()
+            }
+
+    def restore(self, docs: dict) -> int:
+        """
+        Загружает документы, сохранённые export(). Документ принимается,
+        только если ключ (inode, mtime, size) файла не изменился.
+
+        :return: Число восстановленных документов.
+        """
+        restored = 0
+        for path, entry in docs.items():
+            try:
+                key = self._file_key(os.stat(path))
+            except FileNotFoundError:
+                continue
+            if key != tuple(entry["key"]):
+                continue
+            self._watcher.watch(os.path.dirname(path))
+            with self._lock:
+                self._docs.setdefault(path, (key, entry["doc"]))
+            restored += 1
+        return restored
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "files": len(self._docs),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else None,
+            "inotify": self._watcher.active,
+        }
+
+
+@lru_cache()
+def get_netplan_repo() -> NetplanRepository:
+    return NetplanRepository()
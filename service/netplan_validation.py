@@ -0,0 +1,207 @@
+# service/netplan_validation.py
+# Проверка netplan-конфигурации до записи: ошибки, которые иначе всплыли бы
+# только при `netplan generate` в фоне (после перезаписи файла и ответа
+# "OK" клиенту), возвращаются сразу как 422.
+
+import ipaddress
+import os
+import re
+
+from fastapi import HTTPException
+
+from core.config import settings
+from core.log import get_logger
+from service.netplan_diff import IFACE_SECTIONS, diff_documents
+from service.netplan_repo import get_netplan_repo
+from utils.sysfs_utils import link_addresses, list_ifaces
+
+logger = get_logger(__name__)
+
+MAC_RE = re.compile(r"^[0-9a-f]{2}(:[0-9a-f]{2}){5}$", re.IGNORECASE)
+# Секции физических интерфейсов: они должны существовать в системе
+LINK_SECTIONS = ("ethernets", "wifis")
+
+
+def netplan_files() -> list[str]:
+    """Все netplan-файлы, которыми управляет сервис (без повторов)."""
+    return list(
+        dict.fromkeys(
+            [
+                settings.netplan_eth,
+                settings.netplan_br,
+                settings.netplan_wifi,
+                settings.netplan_wifi01,
+            ]
+        )
+    )
+
+
+def _interfaces(doc: dict | None):
+    """(section, name, config) всех интерфейсов документа."""
+    network = (doc or {}).get("network") or {}
+    for section in IFACE_SECTIONS:
+        for name, config in (network.get(section) or {}).items():
+            yield section, name, config or {}
+
+
+def _addresses(config: dict) -> list:
+    # Адрес может быть строкой или словарём {адрес: {lifetime, label}}
+    result = []
+    for item in config.get("addresses") or []:
+        result.extend(item if isinstance(item, dict) else [item])
+    return result
+
+
+def _check_interface(name: str, config: dict, errors: list):
+    networks = []
+    for address in _addresses(config):
+        if "/" not in str(address):
+            errors.append(f"{name}: address {address} has no prefix length")
+            continue
+        try:
+            networks.append(ipaddress.ip_interface(address).network)
+        except ValueError:
+            errors.append(f"{name}: invalid address {address}")
+
+    for route in config.get("routes") or []:
+        via = route.get("via")
+        if via is None:
+            continue
+        try:
+            gateway = ipaddress.ip_address(via)
+        except ValueError:
+            errors.append(f"{name}: invalid gateway {via}")
+            continue
+        # Без статических адресов (DHCP) и с on-link подсеть не проверить
+        same_family = [net for net in networks if net.version == gateway.version]
+        if same_family and not route.get("on-link"):
+            if not any(gateway in net for net in same_family):
+                subnets = ", ".join(str(net) for net in same_family)
+                errors.append(f"{name}: gateway {via} is outside {subnets}")
+
+    for nameserver in (config.get("nameservers") or {}).get("addresses") or []:
+        try:
+            ipaddress.ip_address(nameserver)
+        except ValueError:
+            errors.append(f"{name}: invalid nameserver {nameserver}")
+
+    mac = (config.get("match") or {}).get("macaddress")
+    for value in (mac, config.get("macaddress")):
+        if value is not None and not MAC_RE.match(str(value)):
+            errors.append(f"{name}: invalid MAC address {value}")
+
+
+def _check_links(docs: dict[str, dict], changed: set, errors: list):
+    """Изменённые физические интерфейсы должны быть в системе."""
+    live = set(list_ifaces())
+    macs = link_addresses()
+    for doc in docs.values():
+        for section, name, config in _interfaces(doc):
+            if section not in LINK_SECTIONS or name not in changed:
+                continue
+            mac = (config.get("match") or {}).get("macaddress")
+            if mac is not None:
+                if MAC_RE.match(str(mac)) and str(mac).lower() not in macs:
+                    errors.append(f"{name}: no network device with MAC {mac}")
+            elif name not in live:
+                errors.append(f"{name}: network device not found")
+
+
+def _check_duplicates(docs: dict[str, dict], desired: set, errors: list):
+    """
+    Конфликты между файлами: один интерфейс в разных секциях, один MAC или
+    IP-адрес у разных интерфейсов. Описание одного интерфейса в нескольких
+    файлах netplan объединяет - это не ошибка. Сообщаются только конфликты,
+    в которых участвует новая конфигурация.
+    """
+    sections, macs, addresses = {}, {}, {}
+    for path, doc in docs.items():
+        origin = os.path.basename(path)
+        is_new = path in desired
+        for section, name, config in _interfaces(doc):
+            known = sections.setdefault(name, (section, origin, is_new))
+            if known[0] != section and (is_new or known[2]):
+                errors.append(
+                    f"{name}: defined in {known[0]} ({known[1]}) "
+                    f"and {section} ({origin})"
+                )
+
+            mac = (config.get("match") or {}).get("macaddress")
+            if mac is not None:
+                owner = macs.setdefault(str(mac).lower(), (name, origin, is_new))
+                if owner[0] != name and (is_new or owner[2]):
+                    errors.append(
+                        f"{name}: MAC {mac} is already matched by "
+                        f"{owner[0]} ({owner[1]})"
+                    )
+
+            for address in _addresses(config):
+                try:
+                    ip = ipaddress.ip_interface(address).ip
+                except ValueError:
+                    continue
+                owner = addresses.setdefault(ip, (name, origin, is_new))
+                if owner[0] != name and (is_new or owner[2]):
+                    errors.append(
+                        f"{name}: address {ip} is already used by "
+                        f"{owner[0]} ({owner[1]})"
+                    )
+
+
+def _check_members(docs: dict[str, dict], changed: set, errors: list):
+    """
+    Члены изменённых bridge/bond должны быть описаны в каком-либо из файлов
+    или существовать в системе (например, NIC без своей конфигурации).
+    """
+    defined = {name for doc in docs.values() for _, name, _ in _interfaces(doc)}
+    live = None
+    for doc in docs.values():
+        for section, name, config in _interfaces(doc):
+            if section not in ("bridges", "bonds") or name not in changed:
+                continue
+            for member in config.get("interfaces") or []:
+                if member in defined:
+                    continue
+                if live is None:
+                    live = set(list_ifaces())
+                if member not in live:
+                    errors.append(f"{name}: member {member} is not defined")
+
+
+def validate(updates: dict[str, dict]) -> list[str]:
+    """
+    Проверяет новые документы (path -> doc) вместе с остальными файлами
+    netplan, какими они станут после записи.
+
+    :return: Список ошибок (пустой - конфигурацию можно писать).
+    """
+    repo = get_netplan_repo()
+    docs, changed = {}, set()
+    for path in dict.fromkeys(netplan_files() + list(updates)):
+        current = repo.load(path)
+        if path in updates:
+            docs[path] = updates[path]
+            changed.update(diff_documents(current, updates[path])["interfaces"])
+        elif current:
+            docs[path] = current
+
+    errors = []
+    # Неизменённые интерфейсы уже прошли проверку при своей записи
+    for path in updates:
+        for _, name, config in _interfaces(docs[path]):
+            if name in changed:
+                _check_interface(name, config, errors)
+    _check_members(docs, changed, errors)
+    _check_duplicates(docs, set(updates), errors)
+    if settings.validate_links:
+        _check_links(docs, changed, errors)
+    # Ошибка в общем для нескольких файлов правиле сообщается один раз
+    return list(dict.fromkeys(errors))
+
+
+def ensure_valid(updates: dict[str, dict]):
+    """:raises HTTPException: 422 со списком ошибок, если конфигурация неверна."""
+    errors = validate(updates)
+    if errors:
+        logger.warning(f"Netplan config rejected: {errors}")
+        raise HTTPException(status_code=422, detail=errors)
@@ -0,0 +1,207 @@
+# service/nm_monitor.py
+
+import asyncio
+import re
+import shlex
+import time
+from functools import lru_cache
+
+from core.config import settings
+from core.log import get_logger
+from core.tasks import spawn
+from utils.ip_utils import get_device_status_async
+
+logger = get_logger(__name__)
+
+# "wlan0: connected", "wlan0: connecting (getting IP configuration)",
+# "wlan0: using connection 'netplan-wlan0-MySSID'"
+_DEVICE_LINE = re.compile(r"^(?P<device>[^\s:']+): (?P<event>.+)$")
+_USING_CONNECTION = re.compile(r"^using connection '(?P<connection>.*)'$")
+
+
+def wifi_connection_name(iface: str, ssid: str) -> str:
+    """Имя соединения NetworkManager, которое netplan создаёт для Wi-Fi."""
+    return f"netplan-{iface}-{ssid}"
+
+
+async def is_wifi_connected_to_async(iface: str, ssid: str) -> bool:
+    """
+    Подключён ли iface к ssid по текущему состоянию устройств (опрос
+    драйвера NetworkManager - когда монитор событий не запущен).
+    """
+    connection = wifi_connection_name(iface, ssid)
+    for device in await get_device_status_async() or []:
+        if device["device"] == iface:
+            return device["state"] == "connected" and device["connection"] == connection
+    return False
+
+
+class ConnectionWatcher:
+    """
+    Отслеживает состояние сетевых устройств по потоку событий `nmcli monitor`.
+
+    Для каждого интерфейса хранится последнее состояние (connected,
+    disconnected, connecting (...) и т.д.), активное соединение и время
+    изменения. wait_for() завершается в момент, когда интерфейс перешёл в
+    состояние connected с нужным соединением - без периодического опроса nmcli.
+
+    Источник событий задаётся settings.nm_monitor_cmd; строки можно также
+    передавать напрямую через feed() (локальная замена NetworkManager).
+    """
+
+    def __init__(self, command: str | None = None):
+        self.command = command or settings.nm_monitor_cmd
+        self._states: dict[str, dict] = {}
+        self._waiters: list[tuple] = []
+        self._task: asyncio.Task | None = None
+        self._proc: asyncio.subprocess.Process | None = None
+        self.running = False
+
+    def get_state(self, iface: str) -> dict | None:
+        state = self._states.get(iface)
+        return dict(state) if state else None
+
+    def is_connected(self, iface: str, ssid: str) -> bool:
+        """Подключён ли iface к ssid по последним событиям монитора."""
+        return self._matches(iface, wifi_connection_name(iface, ssid), 0.0)
+
+    def states(self) -> dict:
+        return {iface: dict(state) for iface, state in self._states.items()}
+
+    async def start(self):
+        if self._task is None:
+            # Начальное состояние читается уже в фоне и не задерживает старт
+            self._task = spawn(self._run(), "nm_monitor")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.running = False
+
+    async def wait_for(
+        self,
+        iface: str,
+        ssid: str,
+        timeout: float,
+        fresh: bool = False,
+        on_event=None,
+    ) -> bool:
+        """
+        Ждёт подключения интерфейса iface к сети ssid.
+
+        :param fresh: Учитывать только события после вызова (например, после
+            принудительного отключения), а не текущее состояние.
+        :param on_event: callback(event) для каждого события iface во время ожидания.
+        :return: True, если подключение установлено за timeout секунд.
+        """
+        connection = wifi_connection_name(iface, ssid)
+        since = time.monotonic()
+        if not fresh and self._matches(iface, connection, 0.0):
+            return True
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = (iface, connection, since, future, on_event)
+        self._waiters.append(waiter)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def feed(self, line: str):
+        """Обрабатывает одну строку вывода `nmcli monitor`."""
+        match = _DEVICE_LINE.match(line.strip())
+        if not match:
+            return
+        iface, event = match["device"], match["event"]
+        state = self._states.setdefault(
+            iface, {"state": None, "connection": None, "updated_at": None}
+        )
+
+        using = _USING_CONNECTION.match(event)
+        if using:
+            state["connection"] = using["connection"]
+        else:
+            state["state"] = event
+            if event in ("disconnected", "unavailable", "unmanaged"):
+                state["connection"] = None
+        state["updated_at"] = time.monotonic()
+        logger.debug(f"nm monitor: {iface} -> {event}")
+        self._notify(iface, event)
+        self._resolve(iface)
+
+    def _matches(self, iface: str, connection: str, since: float) -> bool:
+        state = self._states.get(iface)
+        return bool(
+            state
+            and state["state"] == "connected"
+            and state["connection"] == connection
+            and state["updated_at"] >= since
+        )
+
+    def _notify(self, iface: str, event: str):
+        for w_iface, _connection, _since, _future, on_event in list(self._waiters):
+            if w_iface == iface and on_event is not None:
+                try:
+                    on_event(event)
+                except Exception as e:
+                    logger.error(f"nm monitor listener failed: {e}")
+
+    def _resolve(self, iface: str):
+        for waiter in list(self._waiters):
+            w_iface, connection, since, future, _on_event = waiter
+            if w_iface == iface and not future.done():
+                if self._matches(iface, connection, since):
+                    future.set_result(True)
+
+    async def _seed(self):
+        # Начальное состояние устройств от драйвера NetworkManager
+        for device in await get_device_status_async() or []:
+            self._states[device["device"]] = {
+                "state": device["state"],
+                "connection": device["connection"],
+                "updated_at": time.monotonic(),
+            }
+
+    async def _run(self):
+        args = shlex.split(self.command)
+        try:
+            await self._seed()
+        except Exception as e:
+            logger.error(f"NetworkManager state seed failed: {e}")
+        while True:
+            try:
+                self._proc = await asyncio.create_subprocess_exec(
+                    *args,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.DEVNULL,
+                )
+                self.running = True
+                logger.info(f"NetworkManager monitor started: {self.command}")
+                async for raw in self._proc.stdout:
+                    self.feed(raw.decode(errors="replace"))
+                await self._proc.wait()
+                logger.warning("NetworkManager monitor exited, restarting")
+            except asyncio.CancelledError:
+                if self._proc and self._proc.returncode is None:
+                    self._proc.kill()
+                    await self._proc.wait()
+                raise
+            except Exception as e:
+                logger.error(f"NetworkManager monitor failed: {e}")
+            self.running = False
+            await asyncio.sleep(settings.nm_monitor_restart_delay)
+            # пока монитор не работал, события могли быть пропущены
+            await self._seed()
+
+
+@lru_cache()
+def get_connection_watcher() -> ConnectionWatcher:
+    return ConnectionWatcher()
@@ -0,0 +1,114 @@
+# service/scoped_apply.py
+# Применение изменений только для затронутых интерфейсов. После
+# `netplan generate` перезагружаются соединения NetworkManager или ссылки
+# systemd-networkd этих интерфейсов; остальные интерфейсы (eth0 и br0 с
+# рабочим трафиком) не перезапускаются, как при `netplan apply`.
+
+from service.netplan_diff import IFACE_SECTIONS, SCOPED_SECTIONS
+from service.netplan_repo import get_netplan_repo
+from service.netplan_validation import netplan_files
+from service.nm_monitor import wifi_connection_name
+from utils.os_utils import NETPLAN_GENERATE
+from utils.sysfs_utils import link_addresses
+
+NM_RELOAD = ["sudo", "nmcli", "connection", "reload"]
+NETWORKD_RELOAD = ["sudo", "networkctl", "reload"]
+
+
+def find_interfaces(interfaces) -> dict[str, dict]:
+    """Секция, renderer и конфигурация интерфейсов из netplan-файлов."""
+    found = {}
+    repo = get_netplan_repo()
+    for path in netplan_files():
+        network = (repo.load(path) or {}).get("network") or {}
+        for section in SCOPED_SECTIONS:
+            for name, config in (network.get(section) or {}).items():
+                if name in interfaces:
+                    found[name] = {
+                        "section": section,
+                        "renderer": config.get("renderer")
+                        or network.get("renderer")
+                        or "networkd",
+                        "config": config,
+                    }
+    return found
+
+
+def link_names(interfaces) -> list[str]:
+    """
+    Имена в системе для интерфейсов из netplan-файлов, которых надо ждать
+    после apply: set-name, устройство с MAC из match или сам id. Удалённые
+    из конфигурации и optional интерфейсы не ждём.
+    """
+    repo = get_netplan_repo()
+    macs = None
+    links = set()
+    for path in netplan_files():
+        network = (repo.load(path) or {}).get("network") or {}
+        for section in IFACE_SECTIONS:
+            for name, config in (network.get(section) or {}).items():
+                config = config or {}
+                if name not in interfaces or config.get("optional"):
+                    continue
+                match = config.get("match") or {}
+                if config.get("set-name"):
+                    links.add(config["set-name"])
+                elif match.get("macaddress"):
+                    if macs is None:
+                        macs = link_addresses()
+                    link = macs.get(str(match["macaddress"]).lower())
+                    if link:
+                        links.add(link)
+                elif not match:
+                    links.add(name)
+    return sorted(links)
+
+
+def _nm_connection(name: str, iface: dict) -> str | None:
+    """Имя соединения, которое netplan генерирует для NetworkManager."""
+    if iface["section"] == "ethernets":
+        return f"netplan-{name}"
+    access_points = iface["config"].get("access-points") or {}
+    if not access_points:
+        return None
+    return wifi_connection_name(name, next(iter(access_points)))
+
+
+def build_scoped_phases(interfaces) -> list[tuple[str, list[str]]] | None:
+    """
+    Команды применения конфигурации только для interfaces.
+
+    :return: Список (phase, cmd) или None, если интерфейсы нельзя применить
+        по отдельности (нет в конфигурации, неизвестный renderer) - тогда
+        нужен полный netplan apply.
+    """
+    found = find_interfaces(interfaces)
+    if set(found) != set(interfaces):
+        return None
+
+    nm, networkd = [], []
+    for name in sorted(found):
+        renderer = found[name]["renderer"]
+        if renderer == "NetworkManager":
+            connection = _nm_connection(name, found[name])
+            if connection is None:
+                return None
+            nm.append((name, connection))
+        elif renderer == "networkd":
+            networkd.append(name)
+        else:
+            return None
+
+    phases = [("generate", NETPLAN_GENERATE)]
+    if nm:
+        phases.append(("nm_reload", NM_RELOAD))
+        for name, connection in nm:
+            phases.append(
+                (f"nm_up:{name}", ["sudo", "nmcli", "connection", "up", connection])
+            )
+    if networkd:
+        phases.append(("networkd_reload", NETWORKD_RELOAD))
+        phases.append(
+            ("networkd_reconfigure", ["sudo", "networkctl", "reconfigure", *networkd])
+        )
+    return phases
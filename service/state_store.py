@@ -0,0 +1,173 @@
+# service/state_store.py
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from functools import lru_cache
+
+from core.config import settings
+
+MAX_ROWS = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS wifi_attempts (
+    id TEXT PRIMARY KEY,
+    iface TEXT NOT NULL,
+    ssid TEXT NOT NULL,
+    status TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS wifi_attempts_started ON wifi_attempts (started_at);
+CREATE TABLE IF NOT EXISTS wifi_attempt_events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    attempt_id TEXT NOT NULL,
+    event TEXT NOT NULL,
+    detail TEXT,
+    ts REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS wifi_attempt_events_attempt
+    ON wifi_attempt_events (attempt_id, seq);
+CREATE TABLE IF NOT EXISTS apply_jobs (
+    id TEXT PRIMARY KEY,
+    submitted_at REAL NOT NULL,
+    job TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS apply_jobs_submitted ON apply_jobs (submitted_at);
+CREATE TABLE IF NOT EXISTS apply_confirmations (
+    job_id TEXT PRIMARY KEY,
+    confirmed_at REAL NOT NULL
+);
+"""
+
+
+class StateStore:
+    """
+    Общее для всех воркеров gunicorn состояние в локальной базе SQLite
+    (settings.state_db): попытки подключения Wi-Fi с их событиями,
+    задания netplan apply и подтверждения пробного применения.
+
+    Запрос может попасть в любой воркер, поэтому всё, что должно быть видно
+    между запросами (статус подключения, статус apply), хранится здесь,
+    а не в глобальных переменных модуля.
+    """
+
+    def __init__(self, path: str | None = None):
+        self.path = path or settings.state_db
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            self.path, timeout=5.0, isolation_level=None, check_same_thread=False
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def _execute(self, sql: str, params=()) -> list[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def start_wifi_attempt(self, iface: str, ssid: str) -> str:
+        attempt_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO wifi_attempts VALUES (?, ?, ?, 'pending', ?, ?)",
+                (attempt_id, iface, ssid, now, now),
+            )
+            self._conn.execute(
+                "DELETE FROM wifi_attempts WHERE id NOT IN "
+                "(SELECT id FROM wifi_attempts ORDER BY started_at DESC LIMIT ?)",
+                (MAX_ROWS,),
+            )
+            self._conn.execute(
+                "DELETE FROM wifi_attempt_events WHERE attempt_id NOT IN "
+                "(SELECT id FROM wifi_attempts)"
+            )
+        return attempt_id
+
+    def set_wifi_attempt_status(self, attempt_id: str, status: str):
+        self._execute(
+            "UPDATE wifi_attempts SET status = ?, updated_at = ? WHERE id = ?",
+            (status, time.time(), attempt_id),
+        )
+        self.add_wifi_event(attempt_id, status)
+
+    def add_wifi_event(self, attempt_id: str, event: str, detail: str | None = None):
+        self._execute(
+            "INSERT INTO wifi_attempt_events (attempt_id, event, detail, ts) "
+            "VALUES (?, ?, ?, ?)",
+            (attempt_id, event, detail, time.time()),
+        )
+
+    def list_wifi_events(self, attempt_id: str, after_seq: int = 0) -> list[dict]:
+        rows = self._execute(
+            "SELECT seq, event, detail, ts FROM wifi_attempt_events "
+            "WHERE attempt_id = ? AND seq > ? ORDER BY seq",
+            (attempt_id, after_seq),
+        )
+        return [dict(row) for row in rows]
+
+    def get_wifi_attempt(self, attempt_id: str) -> dict | None:
+        rows = self._execute("SELECT * FROM wifi_attempts WHERE id = ?", (attempt_id,))
+        return dict(rows[0]) if rows else None
+
+    def latest_wifi_attempt(self, iface: str | None = None) -> dict | None:
+        if iface:
+            rows = self._execute(
+                "SELECT * FROM wifi_attempts WHERE iface = ? "
+                "ORDER BY started_at DESC LIMIT 1",
+                (iface,),
+            )
+        else:
+            rows = self._execute(
+                "SELECT * FROM wifi_attempts ORDER BY started_at DESC LIMIT 1"
+            )
+        return dict(rows[0]) if rows else None
+
+    def save_apply_job(self, job: dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO apply_jobs VALUES (?, ?, ?)",
+                (job["id"], job["submitted_at"], json.dumps(job)),
+            )
+            self._conn.execute(
+                "DELETE FROM apply_jobs WHERE id NOT IN "
+                "(SELECT id FROM apply_jobs ORDER BY submitted_at DESC LIMIT ?)",
+                (MAX_ROWS,),
+            )
+
+    def get_apply_job(self, job_id: str) -> dict | None:
+        rows = self._execute("SELECT job FROM apply_jobs WHERE id = ?", (job_id,))
+        return json.loads(rows[0]["job"]) if rows else None
+
+    def list_apply_jobs(self) -> list[dict]:
+        rows = self._execute("SELECT job FROM apply_jobs ORDER BY submitted_at")
+        return [json.loads(row["job"]) for row in rows]
+
+    def confirm_apply_job(self, job_id: str):
+        # Отдельная таблица: запись задания целиком перезаписывается
+        # планировщиком и не должна затирать подтверждение
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO apply_confirmations VALUES (?, ?)",
+                (job_id, time.time()),
+            )
+            self._conn.execute(
+                "DELETE FROM apply_confirmations WHERE job_id NOT IN "
+                "(SELECT id FROM apply_jobs)"
+            )
+
+    def is_apply_confirmed(self, job_id: str) -> bool:
+        return bool(
+            self._execute(
+                "SELECT 1 FROM apply_confirmations WHERE job_id = ?", (job_id,)
+            )
+        )
+
+
+@lru_cache()
+def get_state_store() -> StateStore:
+    return StateStore()
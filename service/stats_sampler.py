@@ -0,0 +1,121 @@
+# service/stats_sampler.py
+
+import asyncio
+import time
+from functools import lru_cache
+
+from core.config import settings
+from core.log import get_logger
+from core.tasks import spawn
+from utils.sysfs_utils import list_ifaces, read_iface_stats
+
+logger = get_logger(__name__)
+
+RATE_COUNTERS = ("rx_bytes", "tx_bytes", "rx_packets", "tx_packets")
+
+
+class StatsSubscription:
+    def __init__(self, interval: float, ifaces: list[str] | None):
+        self.interval = interval
+        self.ifaces = set(ifaces) if ifaces else None
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        self.next_due = 0.0
+        self.prev: tuple[float, dict] | None = None
+
+    def publish(self, now: float, snapshot: dict):
+        ifaces = {
+            iface: dict(stats)
+            for iface, stats in snapshot.items()
+            if self.ifaces is None or iface in self.ifaces
+        }
+        if self.prev is not None:
+            prev_time, prev_ifaces = self.prev
+            dt = now - prev_time
+            for iface, stats in ifaces.items():
+                prev = prev_ifaces.get(iface)
+                for counter in RATE_COUNTERS:
+                    rate = None
+                    if prev and dt > 0 and None not in (stats[counter], prev[counter]):
+                        rate = round(max(stats[counter] - prev[counter], 0) / dt, 1)
+                    stats[f"{counter}_per_s"] = rate
+        self.prev = (now, ifaces)
+        self.next_due = now + self.interval
+
+        # Медленный клиент получает последнее значение, а не очередь из старых
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait({"time": time.time(), "interfaces": ifaces})
+
+
+class StatsSampler:
+    """
+    Общий источник статистики интерфейсов для всех подписчиков воркера.
+
+    Один цикл читает /sys/class/net/*/{operstate,carrier,speed,statistics/*}
+    с периодом, равным наименьшему интервалу среди подписчиков, и раздаёт
+    снимок каждому подписчику в его собственном интервале. Пока подписчиков
+    нет, цикл не работает.
+    """
+
+    def __init__(self):
+        self._subscriptions: set[StatsSubscription] = set()
+        self._task: asyncio.Task | None = None
+        self._wakeup = asyncio.Event()
+        self.samples = 0
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscriptions)
+
+    def subscribe(
+        self, interval: float, ifaces: list[str] | None = None
+    ) -> StatsSubscription:
+        interval = max(interval, settings.stats_min_interval)
+        subscription = StatsSubscription(interval, ifaces)
+        self._subscriptions.add(subscription)
+        if self._task is None or self._task.done():
+            self._task = spawn(self._run(), "stats_sampler")
+        self._wakeup.set()
+        return subscription
+
+    def unsubscribe(self, subscription: StatsSubscription):
+        self._subscriptions.discard(subscription)
+        self._wakeup.set()
+
+    @staticmethod
+    def sample() -> dict:
+        snapshot = {}
+        for iface in list_ifaces():
+            stats = read_iface_stats(iface)
+            if stats is not None:
+                snapshot[iface] = stats
+        return snapshot
+
+    async def _run(self):
+        try:
+            while self._subscriptions:
+                now = time.monotonic()
+                due = [s for s in self._subscriptions if s.next_due <= now]
+                if due:
+                    snapshot = self.sample()
+                    self.samples += 1
+                    for subscription in due:
+                        subscription.publish(now, snapshot)
+
+                next_due = min(s.next_due for s in self._subscriptions)
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(
+                        self._wakeup.wait(), max(next_due - time.monotonic(), 0)
+                    )
+                except asyncio.TimeoutError:
+                    pass
+        except Exception as e:
+            logger.error(f"Interface stats sampler failed: {e}")
+        finally:
+            self._task = None
+
+
+@lru_cache()
+def get_stats_sampler() -> StatsSampler:
+    return StatsSampler()
@@ -0,0 +1,139 @@
+# service/warm_cache.py
+# Снимок кэшей воркера на диске (settings.warm_cache_file): после перезапуска
+# pm2/gunicorn первые запросы getWiFi и get_eth_interfaces отвечают из снимка,
+# а актуальные данные загружаются в фоне.
+
+import asyncio
+import json
+import os
+import stat
+import time
+
+from core.config import settings
+from core.log import get_logger
+from service.netplan_repo import get_netplan_repo
+from utils.file_utils import atomic_write
+from utils.ip_utils import (
+    get_available_wifi_async,
+    get_device_status_async,
+    wifi_scan_cache,
+)
+
+logger = get_logger(__name__)
+
+FORMAT_VERSION = 1
+
+
+def snapshot() -> dict:
+    """Текущее содержимое кэшей (вызывается из event loop)."""
+    return {
+        "version": FORMAT_VERSION,
+        "saved_at": time.time(),
+        "wifi_scan": wifi_scan_cache.export(),
+        "netplan_docs": get_netplan_repo().export(),
+    }
+
+
+def write(data: dict, path: str | None = None):
+    # В снимке есть пароли Wi-Fi из netplan - файл доступен только владельцу
+    atomic_write(path or settings.warm_cache_file, json.dumps(data), mode=0o600)
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_valid(data) -> bool:
+    """Структура снимка, которую ожидают restore() кэшей."""
+    if not isinstance(data, dict) or data.get("version") != FORMAT_VERSION:
+        return False
+    scans, docs = data.get("wifi_scan"), data.get("netplan_docs")
+    if not (
+        _is_number(data.get("saved_at"))
+        and isinstance(scans, list)
+        and isinstance(docs, dict)
+    ):
+        return False
+    for entry in scans:
+        if not (
+            isinstance(entry, dict)
+            and isinstance(entry.get("key"), str)
+            and _is_number(entry.get("age"))
+            and "value" in entry
+        ):
+            return False
+    for entry in docs.values():
+        if not (
+            isinstance(entry, dict)
+            and isinstance(entry.get("key"), list)
+            and len(entry["key"]) == 3
+            and "doc" in entry
+        ):
+            return False
+    return True
+
+
+def _is_trusted(st: os.stat_result) -> bool:
+    """
+    Снимок подменяет кэш разобранных netplan-файлов: он принимается, только
+    если принадлежит пользователю процесса и не доступен на запись другим.
+    """
+    return st.st_uid == os.getuid() and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def restore(path: str | None = None) -> bool:
+    """
+    Загружает снимок в кэши. Сканы Wi-Fi помечаются устаревшими, документы
+    netplan принимаются только для файлов, которые не менялись. Чужой,
+    доступный на запись другим или повреждённый снимок не используется.
+
+    :return: True, если восстановлены сканы Wi-Fi (их нужно обновить).
+    """
+    path = path or settings.warm_cache_file
+    try:
+        with open(path) as f:
+            if not _is_trusted(os.fstat(f.fileno())):
+                logger.warning(
+                    f"Warm cache {path} is not owned by uid {os.getuid()} "
+                    f"or is writable by others, ignoring it"
+                )
+                return False
+            data = json.load(f)
+    except FileNotFoundError:
+        return False
+    except (OSError, ValueError) as e:
+        logger.warning(f"Warm cache {path} is not readable: {e}")
+        return False
+    if not _is_valid(data):
+        logger.warning(f"Warm cache {path} has unexpected format, ignoring it")
+        return False
+
+    elapsed = max(0.0, time.time() - data["saved_at"])
+    scans = wifi_scan_cache.restore(data["wifi_scan"], elapsed)
+    docs = get_netplan_repo().restore(data["netplan_docs"])
+    logger.info(
+        f"Warm cache restored from {path}: {scans} scan entries, "
+        f"{docs} netplan documents (saved {elapsed:.0f}s ago)"
+    )
+    return scans > 0
+
+
+async def refresh():
+    """Обновляет восстановленные (устаревшие) сканы в фоне."""
+    await asyncio.gather(
+        get_available_wifi_async(cached=True), get_device_status_async(cached=True)
+    )
+
+
+async def save():
+    await asyncio.to_thread(write, snapshot())
+
+
+async def save_periodically():
+    """Периодическое сохранение снимка (запускается в lifespan)."""
+    while True:
+        await asyncio.sleep(settings.warm_cache_interval)
+        try:
+            await save()
+        except Exception as e:
+            logger.error(f"Warm cache save failed: {e}")
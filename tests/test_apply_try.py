@@ -0,0 +1,83 @@
+# tests/test_apply_try.py
+# Пробное применение: шлюзы для проверок и откат под блокировкой файлов.
+
+import threading
+import time
+
+import pytest
+import yaml
+
+from core.config import settings
+from service.apply_try import restore_snapshot, snapshot_gateways, take_snapshot
+from service.file_locks import get_file_locks
+from service.netplan_repo import get_netplan_repo
+
+
+def _eth(gateway):
+    return {"dhcp4": False, "routes": [{"to": "default", "via": gateway}]}
+
+
+@pytest.fixture
+def netplan_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "lock_dir", str(tmp_path / "locks"))
+    monkeypatch.setattr(settings, "file_lock_timeout", 0.05)
+    path = tmp_path / "20-static-ip.yaml"
+    path.write_text(
+        yaml.safe_dump(
+            {
+                "network": {
+                    "version": 2,
+                    "ethernets": {"eth0": _eth("10.0.0.1"), "eth1": _eth("10.0.1.1")},
+                    "bridges": {"br0": _eth("10.0.2.1")},
+                }
+            }
+        )
+    )
+    yield str(path)
+    get_netplan_repo().invalidate(str(path))
+
+
+def test_gateways_of_changed_interfaces(netplan_file):
+    snapshot = take_snapshot([netplan_file])
+
+    assert snapshot_gateways(snapshot, {"eth1"}) == ["10.0.1.1"]
+    assert snapshot_gateways(snapshot, {"eth0", "br0"}) == ["10.0.0.1", "10.0.2.1"]
+
+
+def test_gateways_without_interfaces_are_all(netplan_file):
+    snapshot = take_snapshot([netplan_file])
+
+    assert snapshot_gateways(snapshot) == ["10.0.0.1", "10.0.1.1", "10.0.2.1"]
+
+
+def test_rollback_waits_for_file_lock(netplan_file):
+    snapshot = take_snapshot([netplan_file])
+    repo = get_netplan_repo()
+    doc = repo.load(netplan_file)
+    doc["network"]["ethernets"]["eth0"] = _eth("10.9.9.1")
+    repo.write(netplan_file, doc)
+
+    locked = threading.Event()
+    released = threading.Event()
+
+    def hold_lock():
+        # Другой запрос меняет eth1, пока откат ждёт блокировку
+        with get_file_locks().lock_sync([netplan_file], timeout=1):
+            locked.set()
+            time.sleep(0.3)
+            current = repo.load(netplan_file)
+            current["network"]["ethernets"]["eth1"] = _eth("10.0.1.254")
+            repo.write(netplan_file, current)
+            released.set()
+
+    holder = threading.Thread(target=hold_lock)
+    holder.start()
+    locked.wait()
+    restore_snapshot(snapshot, {"eth0"})
+    assert released.is_set()
+    holder.join()
+
+    repo.invalidate(netplan_file)
+    ethernets = repo.load(netplan_file)["network"]["ethernets"]
+    assert ethernets["eth0"] == _eth("10.0.0.1")
+    assert ethernets["eth1"] == _eth("10.0.1.254")
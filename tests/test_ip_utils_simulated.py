@@ -0,0 +1,101 @@
+# tests/test_ip_utils_simulated.py
+# Асинхронные функции ip_utils через драйвер NM_BACKEND=simulated.
+
+import asyncio
+
+import pytest
+
+from core.config import settings
+from utils import ip_utils
+from utils.nm_backend import SimulatedBackend, get_nm_backend
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    monkeypatch.setattr(settings, "nm_backend", "simulated")
+    get_nm_backend.cache_clear()
+    ip_utils.invalidate_wifi_scan()
+    yield get_nm_backend()
+    get_nm_backend.cache_clear()
+    ip_utils.invalidate_wifi_scan()
+
+
+def test_backend_selected_by_settings(backend):
+    assert isinstance(backend, SimulatedBackend)
+
+
+def test_get_wifi_state(backend):
+    async def scenario():
+        return (
+            await ip_utils.get_available_wifi_async(),
+            await ip_utils.get_device_status_async(),
+            await ip_utils.get_current_wifi_info_async(),
+            await ip_utils.is_wifi_connected_async(),
+        )
+
+    networks, devices, current, connected = asyncio.run(scenario())
+
+    assert [n["ssid"] for n in networks] == ["Home", "Office", "Guest"]
+    wlan0 = next(d for d in devices if d["device"] == "wlan0")
+    assert wlan0["connection"] == "netplan-wlan0-Home"
+    assert current["ssid"] == "Home"
+    assert connected
+
+
+def test_disconnect_and_connect(backend):
+    async def scenario():
+        disconnected = await ip_utils.disconnect_wifi_async()
+        after_disconnect = await ip_utils.is_wifi_connected_async()
+        found = await ip_utils.connection_wifi_up_async("wlan0", "Office")
+        current = await ip_utils.get_current_wifi_info_async()
+        return disconnected, after_disconnect, found, current
+
+    disconnected, after_disconnect, found, current = asyncio.run(scenario())
+
+    assert disconnected
+    assert not after_disconnect
+    assert found
+    assert current["ssid"] == "Office"
+    assert backend._device("wlan0")["connection"] == "netplan-wlan0-Office"
+
+
+def test_disconnect_without_active_wifi(backend):
+    async def scenario():
+        await ip_utils.disconnect_wifi_async()
+        return await ip_utils.disconnect_wifi_async()
+
+    assert not asyncio.run(scenario())
+
+
+def test_connect_unknown_device(backend):
+    found = asyncio.run(ip_utils.connection_wifi_up_async("wlan9", "Office"))
+
+    assert not found
+    assert backend._device("wlan0")["connection"] == "netplan-wlan0-Home"
+
+
+def test_scan_cache_invalidation(backend):
+    async def scenario():
+        before = await ip_utils.get_current_wifi_info_async(cached=True)
+        await backend.connection_up("wlan0", "netplan-wlan0-Guest")
+        # Кэш ещё свежий: изменение состояния не видно
+        stale = await ip_utils.get_current_wifi_info_async(cached=True)
+        ip_utils.invalidate_wifi_scan()
+        fresh = await ip_utils.get_current_wifi_info_async(cached=True)
+        return before, stale, fresh
+
+    before, stale, fresh = asyncio.run(scenario())
+
+    assert before["ssid"] == "Home"
+    assert stale["ssid"] == "Home"
+    assert fresh["ssid"] == "Guest"
+    assert ip_utils.wifi_scan_cache.misses >= 2
+
+
+def test_cached_results_are_copies(backend):
+    async def scenario():
+        networks = await ip_utils.get_available_wifi_async(cached=True)
+        networks[0]["ssid"] = "Changed"
+        return await ip_utils.get_available_wifi_async(cached=True)
+
+    assert asyncio.run(scenario())[0]["ssid"] == "Home"
@@ -0,0 +1,52 @@
+# tests/test_netplan_diff.py
+# Область применения (scoped / полный netplan apply) по разнице документов.
+
+from service.netplan_diff import apply_scope, diff_documents
+
+ETH0 = {"dhcp4": True}
+BR0 = {"interfaces": ["eth0"], "dhcp4": True}
+
+
+def _doc(**sections):
+    return {"network": {"version": 2, **sections}}
+
+
+def test_interface_change_is_scoped():
+    diff = diff_documents(
+        _doc(ethernets={"eth0": ETH0}),
+        _doc(ethernets={"eth0": {"dhcp4": False, "addresses": ["10.0.0.2/24"]}}),
+    )
+
+    assert apply_scope(diff) == ["eth0"]
+
+
+def test_section_added_in_scoped_section_is_scoped():
+    diff = diff_documents(_doc(), _doc(ethernets={"eth0": ETH0}))
+
+    assert diff["interfaces"] == ["eth0"]
+    assert apply_scope(diff) == ["eth0"]
+
+
+def test_section_removed_needs_full_apply():
+    diff = diff_documents(_doc(ethernets={"eth0": ETH0}), _doc())
+
+    assert diff["interfaces"] == ["eth0"]
+    assert apply_scope(diff) is None
+
+
+def test_unscoped_section_added_needs_full_apply():
+    diff = diff_documents(
+        _doc(ethernets={"eth0": ETH0}),
+        _doc(ethernets={"eth0": ETH0}, bridges={"br0": BR0}),
+    )
+
+    assert diff["interfaces"] == ["br0"]
+    assert apply_scope(diff) is None
+
+
+def test_interface_removed_needs_full_apply():
+    diff = diff_documents(
+        _doc(ethernets={"eth0": ETH0, "eth1": ETH0}), _doc(ethernets={"eth0": ETH0})
+    )
+
+    assert apply_scope(diff) is None
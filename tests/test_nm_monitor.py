@@ -0,0 +1,96 @@
+# tests/test_nm_monitor.py
+# ConnectionWatcher на скриптованных строках `nmcli monitor` (без NetworkManager).
+
+import asyncio
+
+from service.nm_monitor import ConnectionWatcher
+
+CONNECTED = [
+    "wlan0: connecting (prepare)",
+    "wlan0: using connection 'netplan-wlan0-Office'",
+    "wlan0: connecting (getting IP configuration)",
+    "wlan0: connected",
+]
+
+
+async def _feed_later(watcher, lines, delay=0.01):
+    for line in lines:
+        await asyncio.sleep(delay)
+        watcher.feed(line)
+
+
+async def _wait_while_feeding(watcher, lines, timeout, **kwargs):
+    feeder = asyncio.create_task(_feed_later(watcher, lines))
+    try:
+        return await watcher.wait_for("wlan0", "Office", timeout, **kwargs)
+    finally:
+        await feeder
+
+
+def test_feed_tracks_state_and_connection():
+    watcher = ConnectionWatcher(command="true")
+    for line in CONNECTED + ["garbage line", "", "Networkmanager is running"]:
+        watcher.feed(line)
+
+    state = watcher.get_state("wlan0")
+    assert state["state"] == "connected"
+    assert state["connection"] == "netplan-wlan0-Office"
+    assert watcher.is_connected("wlan0", "Office")
+    assert not watcher.is_connected("wlan0", "Home")
+
+    watcher.feed("wlan0: disconnected")
+    assert watcher.get_state("wlan0")["connection"] is None
+    assert not watcher.is_connected("wlan0", "Office")
+
+
+def test_wait_for_resolves_on_target_iface_and_ssid():
+    watcher = ConnectionWatcher(command="true")
+    events = []
+
+    connected = asyncio.run(
+        _wait_while_feeding(watcher, CONNECTED, timeout=2, on_event=events.append)
+    )
+
+    assert connected
+    assert events == [line.split(": ", 1)[1] for line in CONNECTED]
+
+
+def test_wait_for_returns_immediately_when_already_connected():
+    watcher = ConnectionWatcher(command="true")
+    for line in CONNECTED:
+        watcher.feed(line)
+
+    assert asyncio.run(watcher.wait_for("wlan0", "Office", timeout=0.01))
+    # fresh=True учитывает только новые события
+    assert not asyncio.run(watcher.wait_for("wlan0", "Office", 0.05, fresh=True))
+
+
+def test_wait_for_ignores_other_interfaces_and_ssids():
+    watcher = ConnectionWatcher(command="true")
+    events = []
+    lines = [
+        "wlan1: using connection 'netplan-wlan1-Office'",
+        "wlan1: connected",
+        "wlan0: using connection 'netplan-wlan0-Guest'",
+        "wlan0: connected",
+    ]
+
+    connected = asyncio.run(
+        _wait_while_feeding(watcher, lines, timeout=0.3, on_event=events.append)
+    )
+
+    assert not connected
+    # События чужого интерфейса не передаются в callback
+    assert events == ["using connection 'netplan-wlan0-Guest'", "connected"]
+    assert watcher.is_connected("wlan1", "Office")
+
+
+def test_wait_for_times_out_without_events():
+    watcher = ConnectionWatcher(command="true")
+
+    connected = asyncio.run(
+        _wait_while_feeding(watcher, ["wlan0: connecting (prepare)"], timeout=0.1)
+    )
+
+    assert not connected
+    assert watcher._waiters == []
@@ -0,0 +1,19 @@
+# tests/test_startup.py
+# Время до первого ответа uvicorn на заглушках bench/fakebin (bench.startup).
+
+import os
+
+from bench import startup
+from bench.run_bench import prepare_environment
+
+
+def test_first_response_within_budget(tmp_path):
+    args = startup.parse_args([])
+    env = dict(os.environ, **prepare_environment(str(tmp_path), args))
+
+    elapsed, status = startup.time_to_first_response(
+        env, args.path, args.budget * 5
+    )
+
+    assert status == 200
+    assert elapsed <= args.budget, f"first response in {elapsed:.3f}s"
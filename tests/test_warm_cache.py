@@ -0,0 +1,83 @@
+# tests/test_warm_cache.py
+# Загрузка снимка кэшей: повреждённый или чужой файл - то же, что нет снимка.
+
+import json
+import os
+import time
+
+import pytest
+
+from service import warm_cache
+from utils.ip_utils import invalidate_wifi_scan, wifi_scan_cache
+
+
+@pytest.fixture(autouse=True)
+def clean_cache():
+    invalidate_wifi_scan()
+    yield
+    invalidate_wifi_scan()
+
+
+def _write(path, data, mode=0o600):
+    path.write_text(data if isinstance(data, str) else json.dumps(data))
+    os.chmod(path, mode)
+    return str(path)
+
+
+def _snapshot(**fields):
+    data = {
+        "version": warm_cache.FORMAT_VERSION,
+        "saved_at": time.time(),
+        "wifi_scan": [{"key": "networks", "value": [{"ssid": "Home"}], "age": 0}],
+        "netplan_docs": {},
+    }
+    data.update(fields)
+    return data
+
+
+def test_restore_valid_snapshot(tmp_path):
+    path = _write(tmp_path / "warm.json", _snapshot())
+
+    assert warm_cache.restore(path)
+    assert wifi_scan_cache.stats()["entries"] == 1
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        "",
+        "not json",
+        [],
+        {"version": warm_cache.FORMAT_VERSION},
+        _snapshot(version=0),
+        _snapshot(saved_at="yesterday"),
+        _snapshot(wifi_scan={"networks": []}),
+        _snapshot(wifi_scan=[{"key": "networks"}]),
+        _snapshot(netplan_docs=[]),
+        _snapshot(netplan_docs={"/etc/netplan/a.yaml": {"doc": {}}}),
+    ],
+)
+def test_restore_rejects_malformed_snapshot(tmp_path, data):
+    path = _write(tmp_path / "warm.json", data)
+
+    assert not warm_cache.restore(path)
+    assert wifi_scan_cache.stats()["entries"] == 0
+
+
+@pytest.mark.parametrize("mode", [0o620, 0o602])
+def test_restore_rejects_writable_by_others(tmp_path, mode):
+    path = _write(tmp_path / "warm.json", _snapshot(), mode=mode)
+
+    assert not warm_cache.restore(path)
+    assert wifi_scan_cache.stats()["entries"] == 0
+
+
+def test_restore_rejects_foreign_owner(tmp_path, monkeypatch):
+    path = _write(tmp_path / "warm.json", _snapshot())
+    monkeypatch.setattr(os, "getuid", lambda: os.stat(path).st_uid + 1)
+
+    assert not warm_cache.restore(path)
+
+
+def test_restore_missing_file(tmp_path):
+    assert not warm_cache.restore(str(tmp_path / "missing.json"))
@@ -0,0 +1,122 @@
+# utils/cache_utils.py
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Hashable
+
+from core.log import get_logger
+from core.metrics import CACHE_REQUESTS
+from core.tasks import spawn
+
+logger = get_logger(__name__)
+
+
+class AsyncTTLCache:
+    """
+    Кэш результатов асинхронных загрузчиков (например, сканов nmcli).
+
+    - значение свежее ttl секунд - отдаётся из кэша;
+    - после ttl ещё stale_ttl секунд отдаётся устаревшее значение,
+      а в фоне запускается обновление (stale-while-revalidate);
+    - одновременные промахи по одному ключу разделяют один вызов загрузчика
+      (single-flight);
+    - invalidate() сбрасывает значения и отбрасывает результаты загрузок,
+      начатых до сброса.
+
+    Результат None не кэшируется (ошибка загрузчика).
+    """
+
+    def __init__(self, name: str, ttl: float, stale_ttl: float = 0.0):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries: dict[Hashable, tuple[Any, float]] = {}
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self._generation = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]]):
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, loaded_at = entry
+            age = time.monotonic() - loaded_at
+            if age < self.ttl:
+                self.hits += 1
+                CACHE_REQUESTS.labels(cache=self.name, result="hit").inc()
+                return value
+            if age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                CACHE_REQUESTS.labels(cache=self.name, result="stale").inc()
+                self._refresh(key, loader)
+                return value
+
+        self.misses += 1
+        CACHE_REQUESTS.labels(cache=self.name, result="miss").inc()
+        # shield: отмена одного ожидающего не отменяет общую загрузку
+        return await asyncio.shield(self._refresh(key, loader))
+
+    def invalidate(self, key: Hashable | None = None):
+        self._generation += 1
+        if key is None:
+            self._entries.clear()
+            self._inflight.clear()
+        else:
+            self._entries.pop(key, None)
+            self._inflight.pop(key, None)
+        logger.debug(f"Cache '{self.name}' invalidated (key={key})")
+
+    def export(self) -> list[dict]:
+        """Неистёкшие значения с возрастом в секундах (для сохранения на диск)."""
+        now = time.monotonic()
+        return [
+            {"key": key, "value": value, "age": now - loaded_at}
+            for key, (value, loaded_at) in self._entries.items()
+            if now - loaded_at < self.ttl + self.stale_ttl
+        ]
+
+    def restore(self, entries: list[dict], elapsed: float = 0.0) -> int:
+        """
+        Загружает значения, сохранённые export(), как устаревшие: первое же
+        обращение отдаст их сразу и запустит фоновое обновление.
+
+        :param elapsed: Сколько секунд прошло с момента сохранения.
+        :return: Число восстановленных значений.
+        """
+        now = time.monotonic()
+        restored = 0
+        for entry in entries:
+            key = entry["key"]
+            age = max(entry["age"] + elapsed, self.ttl)
+            if key in self._entries or age >= self.ttl + self.stale_ttl:
+                continue
+            self._entries[key] = (entry["value"], now - age)
+            restored += 1
+        return restored
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+        }
+
+    def _refresh(self, key, loader) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            task = spawn(self._load(key, loader, self._generation), "cache_refresh")
+            self._inflight[key] = task
+        return task
+
+    async def _load(self, key, loader, generation):
+        try:
+            value = await loader()
+            if value is not None and generation == self._generation:
+                self._entries[key] = (value, time.monotonic())
+            return value
+        finally:
+            if generation == self._generation:
+                self._inflight.pop(key, None)
@@ -0,0 +1,101 @@
+# utils/cmd_utils.py
+
+import asyncio
+import os
+import re
+import subprocess
+import time
+
+from core.config import settings
+from core.log import get_logger
+from core.metrics import SUBPROCESS_SECONDS
+
+logger = get_logger(__name__)
+
+_semaphore: asyncio.Semaphore | None = None
+_SUBCOMMAND = re.compile(r"[a-z]+")
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    """Общий лимит одновременно запущенных внешних команд в воркере."""
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(settings.cmd_concurrency)
+    return _semaphore
+
+
+def command_label(args: list[str]) -> str:
+    """
+    Метка команды для метрик: программа и подкоманда ("nmcli device",
+    "netplan apply") без sudo, опций, списков полей и прочих аргументов.
+    """
+    args = [arg for arg in args if arg != "sudo"]
+    if not args:
+        return ""
+    words = [os.path.basename(args[0])]
+    subcommand = next((arg for arg in args[1:] if _SUBCOMMAND.fullmatch(arg)), None)
+    if subcommand:
+        words.append(subcommand)
+    return " ".join(words)
+
+
+async def _terminate(proc: asyncio.subprocess.Process):
+    if proc.returncode is not None:
+        return
+    try:
+        proc.kill()
+    except ProcessLookupError:
+        return
+    await proc.wait()
+
+
+async def run_cmd(
+    args: list[str], timeout: float | None = None
+) -> subprocess.CompletedProcess:
+    """
+    Асинхронный аналог subprocess.run(args, stdout=PIPE, stderr=PIPE, text=True).
+
+    Не блокирует event loop, ограничивает число одновременных процессов
+    (settings.cmd_concurrency) и убивает процесс по таймауту или при отмене задачи.
+
+    :param args: Команда и её аргументы.
+    :param timeout: Таймаут в секундах (по умолчанию settings.cmd_timeout).
+    :return: subprocess.CompletedProcess с декодированными stdout/stderr.
+    :raises subprocess.TimeoutExpired: если команда не завершилась за timeout.
+    """
+    if timeout is None:
+        timeout = settings.cmd_timeout
+
+    async with _get_semaphore():
+        started = time.perf_counter()
+        result = "error"
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *args,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+            except asyncio.TimeoutError:
+                await _terminate(proc)
+                result = "timeout"
+                logger.error(f"Command timed out after {timeout}s: {' '.join(args)}")
+                raise subprocess.TimeoutExpired(args, timeout)
+            except asyncio.CancelledError:
+                await _terminate(proc)
+                result = "cancelled"
+                raise
+            if proc.returncode == 0:
+                result = "ok"
+        finally:
+            SUBPROCESS_SECONDS.labels(command=command_label(args), result=result).observe(
+                time.perf_counter() - started
+            )
+
+    return subprocess.CompletedProcess(
+        args,
+        proc.returncode,
+        stdout.decode(errors="replace"),
+        stderr.decode(errors="replace"),
+    )
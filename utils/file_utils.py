@@ -0,0 +1,60 @@
+# utils/file_utils.py
+
+import os
+import tempfile
+
+# netplan предупреждает о конфигурациях, доступных на чтение другим
+NETPLAN_FILE_MODE = 0o600
+
+
+def fsync_dir(directory: str):
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path: str, data: str | bytes, mode: int = NETPLAN_FILE_MODE):
+    """
+    Атомарно заменяет содержимое файла.
+
+    Данные пишутся во временный файл в том же каталоге, который
+    синхронизируется (fsync) и переименовывается поверх path; затем
+    синхронизируется сам каталог. Сбой на любом шаге оставляет на диске
+    либо старую, либо новую версию файла, но не обрезанную.
+
+    Владелец существующего файла сохраняется (если позволяют права).
+    """
+    path = os.path.abspath(path)
+    directory = os.path.dirname(path)
+    if isinstance(data, str):
+        data = data.encode("utf8")
+
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        st = None
+
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory
+    )
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(data)
+            tmp_file.flush()
+            os.fchmod(tmp_file.fileno(), mode)
+            if st is not None:
+                try:
+                    os.fchown(tmp_file.fileno(), st.st_uid, st.st_gid)
+                except PermissionError:
+                    pass
+            os.fsync(tmp_file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    fsync_dir(directory)
@@ -5,7 +5,32 @@ import subprocess
 
 import netifaces  # netifaces2
 
-from core.config import logger
+from core.config import settings
+from core.log import get_logger
+from utils.cache_utils import AsyncTTLCache
+from utils.nm_backend import (
+    NMCLI_DEVICE_STATUS,
+    NMCLI_WIFI_LIST,
+    NmcliBackend,
+    get_nm_backend,
+)
+from utils.sysfs_utils import list_ifaces
+
+logger = get_logger(__name__)
+
+NMCLI_WIFI_IN_USE = ["nmcli", "-t", "-f", "in-use,ssid", "dev", "wifi"]
+NMCLI_WIFI_SSIDS = ["nmcli", "-t", "-f", "SSID", "device", "wifi", "list"]
+
+# Кэш результатов сканирования Wi-Fi и состояния устройств (общий для всех
+# запросов воркера)
+wifi_scan_cache = AsyncTTLCache(
+    "wifi_scan", ttl=settings.wifi_scan_ttl, stale_ttl=settings.wifi_scan_stale_ttl
+)
+
+
+def invalidate_wifi_scan():
+    """Сбрасывает кэш сканирования после изменения состояния Wi-Fi."""
+    wifi_scan_cache.invalidate()
 
 
 def is_wifi_connected() -> bool:
@@ -13,18 +38,26 @@ def is_wifi_connected() -> bool:
     try:
         result = subprocess.run(
             # ["nmcli", "-t", "-f", "in-use,ssid", "dev", "wifi",  "|",  "grep", "^*"],
-            ["nmcli", "-t", "-f", "in-use,ssid", "dev", "wifi"],
+            NMCLI_WIFI_IN_USE,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
         )
-        if result.returncode == 0 and "*:" in result.stdout:
-            return True  # Если Wi-Fi подключен
-        return False
+        return _parse_wifi_connected(result)
     except Exception as e:
         return False
 
 
+async def is_wifi_connected_async(cached: bool = False) -> bool:
+    """Асинхронный вариант is_wifi_connected (через драйвер NetworkManager)."""
+    networks = await get_available_wifi_async(cached)
+    return any(network["in_use"] for network in networks or [])
+
+
+def _parse_wifi_connected(result: subprocess.CompletedProcess) -> bool:
+    return result.returncode == 0 and "*:" in result.stdout
+
+
 def is_wifi_connected_iwgetid(iwface: str) -> bool:
     """Проверяет, подключен ли интерфейс Wi-Fi."""
     try:
@@ -91,9 +124,11 @@ def get_ip_addresses():
 
 
 def get_net_iface():
+    # Список интерфейсов из settings.sys_class_net (как и остальная работа с
+    # состоянием ссылок), а не через netifaces
     interfaces = {}
     try:
-        for interface in netifaces.interfaces():
+        for interface in list_ifaces():
             if interface != "lo":  # Исключаем loopback-интерфейс
                 if interface.startswith("e"):  # Ethernet интерфейс
                     connection_type = "ethernet"
@@ -113,52 +148,75 @@ def get_wifi_ssids():
     try:
         # Выполняем команду nmcli и получаем результат
         result = subprocess.run(
-            ["nmcli", "-t", "-f", "SSID", "device", "wifi", "list"],
+            NMCLI_WIFI_SSIDS,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
         )
-
-        # Проверяем наличие ошибок
-        if result.returncode != 0:
-            logger.error(f"Error executing nmcli: {result.stderr}")
-            return []
-
-        # Разбиваем результат на строки и убираем пустые SSID
-        ssid_list = [line for line in result.stdout.splitlines() if line.strip()]
-        ssid_list.sort()
-        return ssid_list
+        return _parse_wifi_ssids(result)
     except Exception as e:
         logger.error(f"Failed to retrieve Wi-Fi SSIDs: {e}")
         return []
 
 
+async def get_wifi_ssids_async(cached: bool = False):
+    """
+    Асинхронный вариант get_wifi_ssids (через драйвер NetworkManager).
+
+    :param cached: Использовать кэш сканирования (wifi_scan_cache).
+    """
+    networks = await get_available_wifi_async(cached)
+    if networks is None:
+        return []
+    return sorted(network["ssid"] for network in networks if network["ssid"].strip())
+
+
+def _parse_wifi_ssids(result: subprocess.CompletedProcess):
+    # Проверяем наличие ошибок
+    if result.returncode != 0:
+        logger.error(f"Error executing nmcli: {result.stderr}")
+        return []
+
+    # Разбиваем результат на строки и убираем пустые SSID
+    ssid_list = [line for line in result.stdout.splitlines() if line.strip()]
+    ssid_list.sort()
+    return ssid_list
+
+
 def get_available_wifi():
     """
-    Возвращает информацию о текущем Wi-Fi соединении.
+    Возвращает список видимых сетей Wi-Fi (записи nm_backend).
     nmcli -t -f IN-USE,SSID,MODE,FREQ,SIGNAL,SECURITY device wifi
-    nmcli -t -f ACTIVE,SSID,MODE,FREQ,SIGNAL,SECURITY device wifi
     """
     try:
         # Выполняем команду nmcli и получаем результат
         result = subprocess.run(
-            [
-                "nmcli",
-                "-t",
-                "-f",
-                "IN-USE,SSID,MODE,FREQ,SIGNAL,SECURITY",
-                "device",
-                "wifi",
-            ],
+            NMCLI_WIFI_LIST,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
         )
-        # Проверяем наличие ошибок
-        if result.returncode != 0:
-            logger.error(f"Error executing nmcli: {result.stderr}")
-            return None
-        return result.stdout.splitlines()
+        return NmcliBackend.parse_wifi_networks(result)
+    except Exception as e:
+        logger.error(f"Failed to retrieve current Wi-Fi connection info: {e}")
+        return None
+
+
+async def get_available_wifi_async(cached: bool = False):
+    """
+    Асинхронный вариант get_available_wifi (через драйвер NetworkManager).
+
+    :param cached: Использовать кэш сканирования (wifi_scan_cache).
+    """
+    if cached:
+        networks = await wifi_scan_cache.get("networks", _load_available_wifi)
+        return [dict(network) for network in networks] if networks is not None else None
+    return await _load_available_wifi()
+
+
+async def _load_available_wifi():
+    try:
+        return await get_nm_backend().wifi_networks()
     except Exception as e:
         logger.error(f"Failed to retrieve current Wi-Fi connection info: {e}")
         return None
@@ -166,21 +224,37 @@ def get_available_wifi():
 
 def get_device_status():
     """
-    nmcli -t -f DEVICE,CONNECTION,STATE device status
+    Состояние устройств (записи nm_backend).
+    nmcli -t -f DEVICE,TYPE,STATE,CONNECTION device status
     """
     try:
-        # Получаем интерфейс
-        # ["nmcli", "-t", "device", "status"]
         result = subprocess.run(
-            ["nmcli", "-t", "-f", "DEVICE,TYPE,STATE,CONNECTION", "device", "status"],
+            NMCLI_DEVICE_STATUS,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
         )
-        if result.returncode != 0:
-            logger.error(f"Error executing nmcli: {result.stderr}")
-            return None
-        return result.stdout.splitlines()
+        return NmcliBackend.parse_device_status(result)
+    except Exception as e:
+        logger.error(f"Failed to retrieve current Wi-Fi connection info: {e}")
+        return None
+
+
+async def get_device_status_async(cached: bool = False):
+    """
+    Асинхронный вариант get_device_status (через драйвер NetworkManager).
+
+    :param cached: Использовать кэш (wifi_scan_cache, ключ "devices").
+    """
+    if cached:
+        devices = await wifi_scan_cache.get("devices", _load_device_status)
+        return [dict(device) for device in devices] if devices is not None else None
+    return await _load_device_status()
+
+
+async def _load_device_status():
+    try:
+        return await get_nm_backend().device_status()
     except Exception as e:
         logger.error(f"Failed to retrieve current Wi-Fi connection info: {e}")
         return None
@@ -212,49 +286,10 @@ def get_current_wifi_info():
     :return: Словарь с информацией о текущем соединении или None, если соединение отсутствует.
     """
     try:
-        available_net = get_available_wifi()
-        # Ищем активную сеть (ACTIVE == "yes")
-        for line in available_net:
-            fields = line.split(":")
-            if "*" in fields[0].strip().lower():
-                ssid = fields[1]
-                wifi_info = {
-                    "ssid": ssid,
-                    "mode": fields[2],
-                    "frequency": fields[3],
-                    "signal_strength": fields[4],
-                    "security": fields[5],
-                }
-
-                iface_result = get_device_status()
-                for iface_line in iface_result:
-                    # if ssid in iface_line:  # Ищем SSID в статусе интерфейса
-                    if "wifi" in iface_line:  # Ищем wifi в статусе интерфейса
-                        wifi_info["iwface"] = iface_line.split(":")[0]
-                        break
-
-                # Используем netifaces для получения IP-адреса и шлюза
-                if "iwface" in wifi_info:
-                    iwface = wifi_info["iwface"]
-                    if netifaces.AF_INET in netifaces.ifaddresses(iwface):
-                        # addr_info = netifaces.ifaddresses(iwface)[netifaces.AF_INET][0]
-                        addr_infos = netifaces.ifaddresses(iwface)[netifaces.AF_INET]
-                        ip_addresses = [
-                            addr_info.get("addr") for addr_info in addr_infos
-                        ]
-                        if ip_addresses:
-                            wifi_info["ip_addresses"] = ip_addresses
-                            wifi_info["ip_addr"] = ip_addresses
-                            ip_addr = ip_addresses[0]
-
-                            ip_addr_static = ".".join(ip_addr.split(".")[:-1]) + ".21"
-                            wifi_info["ip_addr_static"] = ip_addr_static
-
-                    gw_wifi = get_iface_gateway(iwface)
-                    if gw_wifi:
-                        logger.debug(f"Gateway for Wi-Fi: {gw_wifi}")
-                        wifi_info["gw"] = gw_wifi
-                return wifi_info
+        wifi_info = _find_active_wifi(get_available_wifi())
+        if wifi_info:
+            _fill_wifi_iface_info(wifi_info, get_device_status())
+            return wifi_info
         logger.warning("No active Wi-Fi connection found.")
         return None
     except Exception as e:
@@ -262,67 +297,151 @@ def get_current_wifi_info():
         return None
 
 
+async def get_current_wifi_info_async(cached: bool = False):
+    """
+    Асинхронный вариант get_current_wifi_info.
+
+    :param cached: Брать список сетей и состояние устройств из кэша
+        сканирования (wifi_scan_cache).
+    """
+    try:
+        wifi_info = _find_active_wifi(await get_available_wifi_async(cached))
+        if wifi_info:
+            _fill_wifi_iface_info(wifi_info, await get_device_status_async(cached))
+            return wifi_info
+        logger.warning("No active Wi-Fi connection found.")
+        return None
+    except Exception as e:
+        logger.error(f"Failed to retrieve current Wi-Fi connection info: {e}")
+        return None
+
+
+def _find_active_wifi(networks):
+    # Ищем активную сеть (IN-USE == "*")
+    for network in networks or []:
+        if network["in_use"]:
+            return {
+                "ssid": network["ssid"],
+                "mode": network["mode"],
+                "frequency": network["frequency"],
+                "signal_strength": network["signal"],
+                "security": network["security"],
+            }
+    return None
+
+
+def _fill_wifi_iface_info(wifi_info, devices):
+    for device in devices or []:
+        if device["type"] == "wifi":  # Ищем wifi в статусе интерфейса
+            wifi_info["iwface"] = device["device"]
+            break
+
+    # Используем netifaces для получения IP-адреса и шлюза
+    if "iwface" in wifi_info:
+        iwface = wifi_info["iwface"]
+        if netifaces.AF_INET in netifaces.ifaddresses(iwface):
+            # addr_info = netifaces.ifaddresses(iwface)[netifaces.AF_INET][0]
+            addr_infos = netifaces.ifaddresses(iwface)[netifaces.AF_INET]
+            ip_addresses = [addr_info.get("addr") for addr_info in addr_infos]
+            if ip_addresses:
+                wifi_info["ip_addresses"] = ip_addresses
+                wifi_info["ip_addr"] = ip_addresses
+                ip_addr = ip_addresses[0]
+
+                ip_addr_static = ".".join(ip_addr.split(".")[:-1]) + ".21"
+                wifi_info["ip_addr_static"] = ip_addr_static
+
+        gw_wifi = get_iface_gateway(iwface)
+        if gw_wifi:
+            logger.debug(f"Gateway for Wi-Fi: {gw_wifi}")
+            wifi_info["gw"] = gw_wifi
+
+
 def connection_wifi_up(device, ap):
     try:
-        connection = f"netplan-{device}-{ap}"
-        device_status = get_device_status()
-        if device_status:
-            for line in device_status:
-                fields = line.split(":")
-                type_iface = fields[1]
-                if "wifi" not in type_iface:
-                    continue
-                device_cli = fields[0]
-                # state = fields[2]
-                if device == device_cli:
-                    if "disconnected" in line:
-                        subprocess.run(
-                            ["nmcli", "connection", "up", connection],
-                            stdout=subprocess.PIPE,
-                            stderr=subprocess.PIPE,
-                            text=True,
-                        )
-                        logger.info(f"Connected to Wi-Fi connection: {connection}")
-                    else:
-                        logger.info(f'The device "{device}" is already connected')
-                    return True
-                else:
-                    logger.error(
-                        f"The device name {device} does not match with {device_cli}"
-                    )
+        found, connection = _connection_to_up(device, ap, get_device_status())
+        if connection:
+            subprocess.run(
+                ["nmcli", "connection", "up", connection],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+            )
+            logger.info(f"Connected to Wi-Fi connection: {connection}")
+        return found
     except Exception as e:
         logger.error(f"Failed to connect Wi-Fi: {e}")
     return False
 
 
+async def connection_wifi_up_async(device, ap):
+    """Асинхронный вариант connection_wifi_up (через драйвер NetworkManager)."""
+    try:
+        found, connection = _connection_to_up(
+            device, ap, await get_device_status_async()
+        )
+        if connection:
+            await get_nm_backend().connection_up(device, connection)
+            logger.info(f"Connected to Wi-Fi connection: {connection}")
+        return found
+    except Exception as e:
+        logger.error(f"Failed to connect Wi-Fi: {e}")
+    return False
+
+
+def _connection_to_up(device, ap, devices):
+    """
+    Ищет Wi-Fi устройство в состоянии устройств.
+
+    :return: (устройство найдено, имя соединения для подключения или None,
+        если уже подключено).
+    """
+    for entry in devices or []:
+        if entry["type"] != "wifi":
+            continue
+        if device == entry["device"]:
+            if entry["state"] == "disconnected":
+                return True, f"netplan-{device}-{ap}"
+            logger.info(f'The device "{device}" is already connected')
+            return True, None
+        else:
+            logger.error(
+                f"The device name {device} does not match with {entry['device']}"
+            )
+    return False, None
+
+
 def disconnect_wifi():
     """Отключает текущее Wi-Fi соединение, используя nmcli."""
     try:
         # Получаем список всех активных устройств и их соединений
-        device_status = get_device_status()
-        if device_status:
-            for line in device_status:
-                fields = line.split(":")
-                type_iface = fields[1]
-                if "wifi" not in type_iface:
-                    continue
+        active = _find_connected_wifi(get_device_status())
+        if active:
+            device, connection = active
+            subprocess.run(
+                ["nmcli", "device", "disconnect", device],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+            )
+            logger.info(f"Disconnected from Wi-Fi connection: {connection}")
+            return True
+        logger.warning("No active Wi-Fi connection found to disconnect.")
+        return False
+    except Exception as e:
+        logger.error(f"Failed to disconnect Wi-Fi: {e}")
+        return False
 
-                device = fields[0]
-                state = fields[2]
-                connection = fields[3]
-
-                # Если состояние устройства - подключено (connected)
-                # ["nmcli", "connection", "down", connection]
-                if "connected" in state.lower():
-                    # Отключаем Wi-Fi
-                    subprocess.run(
-                        ["nmcli", "device", "disconnect", device],
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        text=True,
-                    )
-                    logger.info(f"Disconnected from Wi-Fi connection: {connection}")
-                    return True
+
+async def disconnect_wifi_async():
+    """Асинхронный вариант disconnect_wifi (через драйвер NetworkManager)."""
+    try:
+        active = _find_connected_wifi(await get_device_status_async())
+        if active:
+            device, connection = active
+            await get_nm_backend().device_disconnect(device)
+            logger.info(f"Disconnected from Wi-Fi connection: {connection}")
+            return True
         logger.warning("No active Wi-Fi connection found to disconnect.")
         return False
     except Exception as e:
@@ -330,6 +449,15 @@ def disconnect_wifi():
         return False
 
 
+def _find_connected_wifi(devices):
+    """Возвращает (device, connection) первого подключенного Wi-Fi устройства."""
+    for entry in devices or []:
+        # ["nmcli", "connection", "down", connection]
+        if entry["type"] == "wifi" and entry["state"] == "connected":
+            return entry["device"], entry["connection"]
+    return None
+
+
 if __name__ == "__main__":
     interfaces = get_net_iface()
 
@@ -0,0 +1,279 @@
+# utils/netlink.py
+# Минимальный клиент rtnetlink: дамп интерфейсов, адресов и маршрутов
+# через сокет AF_NETLINK без запуска `ip`.
+
+import os
+import socket
+import struct
+
+NETLINK_ROUTE = 0
+
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+
+RTM_NEWLINK = 16
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_GETADDR = 22
+RTM_NEWROUTE = 24
+RTM_GETROUTE = 26
+
+IFLA_ADDRESS = 1
+IFLA_BROADCAST = 2
+IFLA_IFNAME = 3
+IFLA_MTU = 4
+IFLA_QDISC = 6
+IFLA_MASTER = 10
+IFLA_OPERSTATE = 16
+
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+IFA_LABEL = 3
+IFA_BROADCAST = 4
+
+RTA_DST = 1
+RTA_OIF = 4
+RTA_GATEWAY = 5
+RTA_PRIORITY = 6
+RTA_PREFSRC = 7
+RTA_TABLE = 15
+
+RT_TABLE_MAIN = 254
+
+_NLMSGHDR = struct.Struct("=IHHII")
+_IFINFOMSG = struct.Struct("=BxHiII")
+_IFADDRMSG = struct.Struct("=BBBBI")
+_RTMSG = struct.Struct("=BBBBBBBBI")
+_RTATTR = struct.Struct("=HH")
+
+# Порядок как в выводе `ip link`
+IFF_FLAGS = (
+    (0x8, "LOOPBACK"),
+    (0x2, "BROADCAST"),
+    (0x10, "POINTOPOINT"),
+    (0x1000, "MULTICAST"),
+    (0x80, "NOARP"),
+    (0x100, "PROMISC"),
+    (0x1, "UP"),
+    (0x10000, "LOWER_UP"),
+    (0x20000, "DORMANT"),
+)
+OPERSTATES = {
+    0: "UNKNOWN",
+    1: "NOTPRESENT",
+    2: "DOWN",
+    3: "LOWERLAYERDOWN",
+    4: "TESTING",
+    5: "DORMANT",
+    6: "UP",
+}
+LINK_TYPES = {1: "ether", 772: "loopback", 776: "sit", 65534: "none"}
+SCOPES = {0: "global", 200: "site", 253: "link", 254: "host", 255: "nowhere"}
+FAMILIES = {socket.AF_INET: "inet", socket.AF_INET6: "inet6"}
+RT_PROTOCOLS = {2: "kernel", 3: "boot", 4: "static", 16: "dhcp", 186: "bgp"}
+
+
+def _align(length: int) -> int:
+    return (length + 3) & ~3
+
+
+def _parse_attrs(data: bytes, offset: int) -> dict[int, bytes]:
+    attrs = {}
+    while offset + _RTATTR.size <= len(data):
+        length, attr_type = _RTATTR.unpack_from(data, offset)
+        if length < _RTATTR.size:
+            break
+        attrs[attr_type] = data[offset + _RTATTR.size : offset + length]
+        offset += _align(length)
+    return attrs
+
+
+def _dump(msg_type: int, payload: bytes) -> list[tuple[int, bytes]]:
+    """Отправляет dump-запрос и возвращает список (тип, тело сообщения)."""
+    with socket.socket(
+        socket.AF_NETLINK, socket.SOCK_RAW | socket.SOCK_CLOEXEC, NETLINK_ROUTE
+    ) as sock:
+        sock.bind((0, 0))
+        seq = 1
+        header = _NLMSGHDR.pack(
+            _NLMSGHDR.size + len(payload), msg_type, NLM_F_REQUEST | NLM_F_DUMP, seq, 0
+        )
+        sock.sendall(header + payload)
+
+        messages = []
+        while True:
+            data = sock.recv(65536)
+            offset = 0
+            while offset + _NLMSGHDR.size <= len(data):
+                length, nl_type, _flags, nl_seq, _pid = _NLMSGHDR.unpack_from(
+                    data, offset
+                )
+                body = data[offset + _NLMSGHDR.size : offset + length]
+                offset += _align(length)
+                if nl_seq != seq:
+                    continue
+                if nl_type == NLMSG_DONE:
+                    return messages
+                if nl_type == NLMSG_ERROR:
+                    (error,) = struct.unpack_from("=i", body)
+                    if error:
+                        raise OSError(-error, os.strerror(-error))
+                    continue
+                messages.append((nl_type, body))
+
+
+def _mac(raw: bytes | None) -> str | None:
+    return ":".join(f"{b:02x}" for b in raw) if raw else None
+
+
+def _ip(family: int, raw: bytes | None) -> str | None:
+    return socket.inet_ntop(family, raw) if raw else None
+
+
+def get_links() -> dict[int, dict]:
+    links = {}
+    payload = _IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+    for nl_type, body in _dump(RTM_GETLINK, payload):
+        if nl_type != RTM_NEWLINK:
+            continue
+        _family, link_type, index, flags, _change = _IFINFOMSG.unpack_from(body)
+        attrs = _parse_attrs(body, _IFINFOMSG.size)
+        link = {
+            "index": index,
+            "name": attrs.get(IFLA_IFNAME, b"").rstrip(b"\0").decode(),
+            "flags": [name for bit, name in IFF_FLAGS if flags & bit],
+            "mtu": struct.unpack("=I", attrs[IFLA_MTU])[0] if IFLA_MTU in attrs else None,
+            "qdisc": attrs.get(IFLA_QDISC, b"").rstrip(b"\0").decode() or None,
+            "state": OPERSTATES.get(attrs.get(IFLA_OPERSTATE, b"\0")[0], "UNKNOWN"),
+            "link_type": LINK_TYPES.get(link_type, str(link_type)),
+            "mac": _mac(attrs.get(IFLA_ADDRESS)),
+            "broadcast": _mac(attrs.get(IFLA_BROADCAST)),
+            "master": None,
+            "addresses": [],
+        }
+        if IFLA_MASTER in attrs:
+            link["master"] = struct.unpack("=I", attrs[IFLA_MASTER])[0]
+        links[index] = link
+    return links
+
+
+def get_addresses() -> list[dict]:
+    addresses = []
+    payload = _IFADDRMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+    for nl_type, body in _dump(RTM_GETADDR, payload):
+        if nl_type != RTM_NEWADDR:
+            continue
+        family, prefixlen, _flags, scope, index = _IFADDRMSG.unpack_from(body)
+        if family not in FAMILIES:
+            continue
+        attrs = _parse_attrs(body, _IFADDRMSG.size)
+        # Для point-to-point IFA_ADDRESS - адрес пира, локальный - IFA_LOCAL
+        address = _ip(family, attrs.get(IFA_LOCAL) or attrs.get(IFA_ADDRESS))
+        addresses.append(
+            {
+                "index": index,
+                "family": FAMILIES[family],
+                "address": address,
+                "prefixlen": prefixlen,
+                "cidr": f"{address}/{prefixlen}",
+                "scope": SCOPES.get(scope, str(scope)),
+                "broadcast": _ip(family, attrs.get(IFA_BROADCAST)),
+                "label": attrs.get(IFA_LABEL, b"").rstrip(b"\0").decode() or None,
+            }
+        )
+    return addresses
+
+
+def get_routes() -> list[dict]:
+    routes = []
+    payload = _RTMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0, 0, 0, 0, 0)
+    for nl_type, body in _dump(RTM_GETROUTE, payload):
+        if nl_type != RTM_NEWROUTE:
+            continue
+        family, dst_len, _src_len, _tos, table, protocol, scope, _type, _flags = (
+            _RTMSG.unpack_from(body)
+        )
+        if family not in FAMILIES:
+            continue
+        attrs = _parse_attrs(body, _RTMSG.size)
+        if RTA_TABLE in attrs:
+            table = struct.unpack("=I", attrs[RTA_TABLE])[0]
+        if table != RT_TABLE_MAIN:
+            continue
+        dst = _ip(family, attrs.get(RTA_DST))
+        routes.append(
+            {
+                "family": FAMILIES[family],
+                "dst": f"{dst}/{dst_len}" if dst else "default",
+                "gateway": _ip(family, attrs.get(RTA_GATEWAY)),
+                "oif": struct.unpack("=I", attrs[RTA_OIF])[0] if RTA_OIF in attrs else None,
+                "metric": (
+                    struct.unpack("=I", attrs[RTA_PRIORITY])[0]
+                    if RTA_PRIORITY in attrs
+                    else None
+                ),
+                "prefsrc": _ip(family, attrs.get(RTA_PREFSRC)),
+                "protocol": RT_PROTOCOLS.get(protocol, str(protocol)),
+                "scope": SCOPES.get(scope, str(scope)),
+            }
+        )
+    return routes
+
+
+def get_network_snapshot() -> dict:
+    """
+    Структурированный аналог `ip a` + `ip route`: интерфейсы (флаги, MTU, MAC,
+    состояние, адреса IPv4/IPv6 с префиксами) и маршруты основной таблицы.
+    """
+    links = get_links()
+    for addr in get_addresses():
+        link = links.get(addr.pop("index"))
+        if link is not None:
+            link["addresses"].append(addr)
+
+    names = {index: link["name"] for index, link in links.items()}
+    for link in links.values():
+        if link["master"] is not None:
+            link["master"] = names.get(link["master"])
+
+    routes = get_routes()
+    for route in routes:
+        route["dev"] = names.get(route.pop("oif"))
+
+    return {
+        "interfaces": {link["name"]: link for link in links.values()},
+        "routes": routes,
+    }
+
+
+def format_ip_a(snapshot: dict) -> str:
+    """Текстовое представление снимка в формате, близком к `ip a`."""
+    lines = []
+    interfaces = sorted(snapshot["interfaces"].values(), key=lambda i: i["index"])
+    for link in interfaces:
+        header = (
+            f"{link['index']}: {link['name']}: <{','.join(link['flags'])}> "
+            f"mtu {link['mtu']}"
+        )
+        if link["qdisc"]:
+            header += f" qdisc {link['qdisc']}"
+        if link["master"]:
+            header += f" master {link['master']}"
+        lines.append(f"{header} state {link['state']}")
+        link_line = f"    link/{link['link_type']}"
+        if link["mac"]:
+            link_line += f" {link['mac']}"
+        if link["broadcast"]:
+            link_line += f" brd {link['broadcast']}"
+        lines.append(link_line)
+        for addr in link["addresses"]:
+            addr_line = f"    {addr['family']} {addr['cidr']}"
+            if addr["broadcast"]:
+                addr_line += f" brd {addr['broadcast']}"
+            addr_line += f" scope {addr['scope']}"
+            if addr["family"] == "inet":
+                addr_line += f" {addr['label'] or link['name']}"
+            lines.append(addr_line)
+    return "\n".join(lines)
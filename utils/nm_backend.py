@@ -0,0 +1,471 @@
+# utils/nm_backend.py
+# Драйверы доступа к NetworkManager для utils.ip_utils.
+#
+# Все драйверы возвращают одинаковые записи:
+#   устройство: {"device", "type", "state", "connection"}
+#   сеть Wi-Fi: {"in_use", "ssid", "mode", "frequency", "signal", "security"}
+# (значения в тех же строковых форматах, что печатает nmcli).
+#
+# - nmcli: запуск `nmcli -t ...` и разбор вывода;
+# - dbus: одно постоянное соединение с системной шиной (jeepney), свойства
+#   устройств и точек доступа читаются напрямую, без fork+exec на запрос;
+# - simulated: состояние в памяти, для бенчмарков и отладки без NetworkManager.
+
+import asyncio
+import subprocess
+from abc import ABC, abstractmethod
+from contextlib import AsyncExitStack
+from functools import lru_cache
+
+from core.config import settings
+from core.log import get_logger
+from utils.cmd_utils import run_cmd
+
+logger = get_logger(__name__)
+
+try:
+    from jeepney import DBusAddress, Properties, new_method_call, unwrap_msg
+    from jeepney.io.asyncio import open_dbus_router
+except ImportError:  # jeepney - необязательная зависимость (requirements-dbus.txt)
+    open_dbus_router = None
+
+NMCLI_WIFI_LIST = [
+    "nmcli",
+    "-t",
+    "-f",
+    "IN-USE,SSID,MODE,FREQ,SIGNAL,SECURITY",
+    "device",
+    "wifi",
+]
+NMCLI_DEVICE_STATUS = [
+    "nmcli",
+    "-t",
+    "-f",
+    "DEVICE,TYPE,STATE,CONNECTION",
+    "device",
+    "status",
+]
+
+
+def split_terse(line: str) -> list[str]:
+    """Разбивает строку `nmcli -t` по ':' с учётом экранирования (\\: и \\\\)."""
+    fields, current, escaped = [], [], False
+    for char in line:
+        if escaped:
+            current.append(char)
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == ":":
+            fields.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    fields.append("".join(current))
+    return fields
+
+
+class NMBackend(ABC):
+    """Интерфейс драйвера NetworkManager."""
+
+    name = ""
+
+    @abstractmethod
+    async def device_status(self) -> list[dict] | None:
+        """Устройства; None - если состояние получить не удалось."""
+
+    @abstractmethod
+    async def wifi_networks(self) -> list[dict] | None:
+        """Видимые сети Wi-Fi; None - если список получить не удалось."""
+
+    @abstractmethod
+    async def connection_up(self, device: str, connection: str) -> bool:
+        pass
+
+    @abstractmethod
+    async def device_disconnect(self, device: str) -> bool:
+        pass
+
+    async def close(self):
+        pass
+
+
+class NmcliBackend(NMBackend):
+    name = "nmcli"
+
+    @staticmethod
+    def parse_device_status(result: subprocess.CompletedProcess) -> list[dict] | None:
+        if result.returncode != 0:
+            logger.error(f"Error executing nmcli: {result.stderr}")
+            return None
+        devices = []
+        for line in result.stdout.splitlines():
+            fields = split_terse(line)
+            if len(fields) < 4:
+                continue
+            devices.append(
+                {
+                    "device": fields[0],
+                    "type": fields[1],
+                    "state": fields[2],
+                    "connection": fields[3] or None,
+                }
+            )
+        return devices
+
+    @staticmethod
+    def parse_wifi_networks(result: subprocess.CompletedProcess) -> list[dict] | None:
+        if result.returncode != 0:
+            logger.error(f"Error executing nmcli: {result.stderr}")
+            return None
+        networks = []
+        for line in result.stdout.splitlines():
+            fields = split_terse(line)
+            if len(fields) < 6:
+                continue
+            networks.append(
+                {
+                    "in_use": fields[0].strip() == "*",
+                    "ssid": fields[1],
+                    "mode": fields[2],
+                    "frequency": fields[3],
+                    "signal": fields[4],
+                    "security": fields[5],
+                }
+            )
+        return networks
+
+    async def device_status(self):
+        return self.parse_device_status(await run_cmd(NMCLI_DEVICE_STATUS))
+
+    async def wifi_networks(self):
+        return self.parse_wifi_networks(await run_cmd(NMCLI_WIFI_LIST))
+
+    async def connection_up(self, device, connection):
+        result = await run_cmd(["nmcli", "connection", "up", connection])
+        if result.returncode != 0:
+            logger.error(f"Error executing nmcli: {result.stderr}")
+        return result.returncode == 0
+
+    async def device_disconnect(self, device):
+        result = await run_cmd(["nmcli", "device", "disconnect", device])
+        if result.returncode != 0:
+            logger.error(f"Error executing nmcli: {result.stderr}")
+        return result.returncode == 0
+
+
+NM_BUS = "org.freedesktop.NetworkManager"
+NM_PATH = "/org/freedesktop/NetworkManager"
+NM_SETTINGS_PATH = "/org/freedesktop/NetworkManager/Settings"
+NM_IFACE = "org.freedesktop.NetworkManager"
+NM_DEVICE_IFACE = "org.freedesktop.NetworkManager.Device"
+NM_WIRELESS_IFACE = "org.freedesktop.NetworkManager.Device.Wireless"
+NM_AP_IFACE = "org.freedesktop.NetworkManager.AccessPoint"
+NM_ACTIVE_IFACE = "org.freedesktop.NetworkManager.Connection.Active"
+NM_SETTINGS_IFACE = "org.freedesktop.NetworkManager.Settings"
+NM_CONNECTION_IFACE = "org.freedesktop.NetworkManager.Settings.Connection"
+
+# NMDeviceType / NMDeviceState / NM80211Mode в терминах вывода nmcli
+NM_DEVICE_TYPES = {
+    1: "ethernet",
+    2: "wifi",
+    5: "bt",
+    8: "gsm",
+    13: "bridge",
+    14: "generic",
+    16: "tun",
+    29: "wireguard",
+    30: "wifi-p2p",
+    32: "loopback",
+}
+NM_DEVICE_STATES = {
+    10: "unmanaged",
+    20: "unavailable",
+    30: "disconnected",
+    40: "connecting (prepare)",
+    50: "connecting (configuring)",
+    60: "connecting (need authentication)",
+    70: "connecting (getting IP configuration)",
+    80: "connecting (checking IP connectivity)",
+    90: "connecting (starting secondary connections)",
+    100: "connected",
+    110: "deactivating",
+    120: "failed",
+}
+NM_80211_MODES = {1: "Ad-Hoc", 2: "Infra", 3: "AP", 4: "Mesh"}
+NM_AP_FLAGS_PRIVACY = 0x1
+NM_AP_SEC_KEY_MGMT_SAE = 0x400
+
+
+def _ap_security(flags: int, wpa_flags: int, rsn_flags: int) -> str:
+    security = []
+    if flags & NM_AP_FLAGS_PRIVACY and not wpa_flags and not rsn_flags:
+        security.append("WEP")
+    if wpa_flags:
+        security.append("WPA1")
+    if rsn_flags & ~NM_AP_SEC_KEY_MGMT_SAE:
+        security.append("WPA2")
+    if rsn_flags & NM_AP_SEC_KEY_MGMT_SAE:
+        security.append("WPA3")
+    return " ".join(security)
+
+
+class DBusBackend(NMBackend):
+    """
+    Драйвер NetworkManager D-Bus API. Соединение с системной шиной
+    открывается при первом запросе и переиспользуется; после ошибки
+    транспорта оно переоткрывается при следующем запросе.
+    """
+
+    name = "dbus"
+
+    def __init__(self):
+        self._stack: AsyncExitStack | None = None
+        self._router = None
+        self._lock = asyncio.Lock()
+        self._connections: dict[str, str] = {}
+
+    async def _get_router(self):
+        async with self._lock:
+            if self._router is None:
+                stack = AsyncExitStack()
+                self._router = await stack.enter_async_context(
+                    open_dbus_router(bus="SYSTEM")
+                )
+                self._stack = stack
+                logger.info("Connected to NetworkManager over D-Bus")
+            return self._router
+
+    async def _send(self, msg):
+        router = await self._get_router()
+        try:
+            reply = await router.send_and_get_reply(msg)
+        except (OSError, EOFError):
+            await self.close()
+            raise
+        return unwrap_msg(reply)
+
+    async def _call(self, path, interface, method, signature=None, body=()):
+        address = DBusAddress(path, bus_name=NM_BUS, interface=interface)
+        return await self._send(new_method_call(address, method, signature, body))
+
+    async def _get_all(self, path: str, interface: str) -> dict:
+        address = DBusAddress(path, bus_name=NM_BUS, interface=interface)
+        (props,) = await self._send(Properties(address).get_all())
+        return {name: value for name, (_signature, value) in props.items()}
+
+    async def _get(self, path: str, interface: str, name: str):
+        address = DBusAddress(path, bus_name=NM_BUS, interface=interface)
+        ((_signature, value),) = await self._send(Properties(address).get(name))
+        return value
+
+    async def _devices(self) -> list[tuple[str, dict]]:
+        (paths,) = await self._call(NM_PATH, NM_IFACE, "GetDevices")
+        props = await asyncio.gather(
+            *(self._get_all(path, NM_DEVICE_IFACE) for path in paths)
+        )
+        return list(zip(paths, props))
+
+    async def _active_connection_id(self, path: str) -> str | None:
+        if path == "/":
+            return None
+        return await self._get(path, NM_ACTIVE_IFACE, "Id")
+
+    async def device_status(self):
+        devices = await self._devices()
+        connections = await asyncio.gather(
+            *(self._active_connection_id(p["ActiveConnection"]) for _, p in devices)
+        )
+        return [
+            {
+                "device": props["Interface"],
+                "type": NM_DEVICE_TYPES.get(props["DeviceType"], "unknown"),
+                "state": NM_DEVICE_STATES.get(props["State"], "unknown"),
+                "connection": connection,
+            }
+            for (_, props), connection in zip(devices, connections)
+        ]
+
+    async def _access_points(self, device_path: str) -> list[dict]:
+        wireless = await self._get_all(device_path, NM_WIRELESS_IFACE)
+        active = wireless.get("ActiveAccessPoint", "/")
+        aps = wireless.get("AccessPoints", [])
+        props = await asyncio.gather(*(self._get_all(ap, NM_AP_IFACE) for ap in aps))
+        return [
+            {
+                "in_use": ap == active,
+                "ssid": bytes(p["Ssid"]).decode(errors="replace"),
+                "mode": NM_80211_MODES.get(p["Mode"], "Unknown"),
+                "frequency": f"{p['Frequency']} MHz",
+                "signal": str(p["Strength"]),
+                "security": _ap_security(p["Flags"], p["WpaFlags"], p["RsnFlags"]),
+            }
+            for ap, p in zip(aps, props)
+        ]
+
+    async def wifi_networks(self):
+        wifi_devices = [
+            path
+            for path, props in await self._devices()
+            if NM_DEVICE_TYPES.get(props["DeviceType"]) == "wifi"
+        ]
+        per_device = await asyncio.gather(
+            *(self._access_points(path) for path in wifi_devices)
+        )
+        return [network for networks in per_device for network in networks]
+
+    async def _connection_path(self, connection: str) -> str | None:
+        path = self._connections.get(connection)
+        if path is not None:
+            return path
+        (paths,) = await self._call(
+            NM_SETTINGS_PATH, NM_SETTINGS_IFACE, "ListConnections"
+        )
+        self._connections.clear()
+        for path in paths:
+            (conn_settings,) = await self._call(
+                path, NM_CONNECTION_IFACE, "GetSettings"
+            )
+            _signature, conn_id = conn_settings["connection"]["id"]
+            self._connections[conn_id] = path
+        return self._connections.get(connection)
+
+    async def _device_path(self, device: str) -> str:
+        (path,) = await self._call(
+            NM_PATH, NM_IFACE, "GetDeviceByIpIface", "s", (device,)
+        )
+        return path
+
+    async def connection_up(self, device, connection):
+        conn_path = await self._connection_path(connection)
+        if conn_path is None:
+            logger.error(f"NetworkManager connection not found: {connection}")
+            return False
+        device_path = await self._device_path(device)
+        try:
+            await self._call(
+                NM_PATH,
+                NM_IFACE,
+                "ActivateConnection",
+                "ooo",
+                (conn_path, device_path, "/"),
+            )
+        except Exception:
+            # Соединение могло быть пересоздано netplan - путь устарел
+            self._connections.pop(connection, None)
+            raise
+        return True
+
+    async def device_disconnect(self, device):
+        device_path = await self._device_path(device)
+        await self._call(device_path, NM_DEVICE_IFACE, "Disconnect")
+        return True
+
+    async def close(self):
+        stack, self._stack, self._router = self._stack, None, None
+        if stack is not None:
+            await stack.aclose()
+
+
+def _network(ssid, frequency, signal, security, in_use=False) -> dict:
+    return {
+        "in_use": in_use,
+        "ssid": ssid,
+        "mode": "Infra",
+        "frequency": frequency,
+        "signal": signal,
+        "security": security,
+    }
+
+
+class SimulatedBackend(NMBackend):
+    """Состояние NetworkManager в памяти: подключения меняют его без реальной сети."""
+
+    name = "simulated"
+
+    def __init__(self, devices=None, networks=None, latency: float = 0.0):
+        self.latency = latency
+        self.devices = devices or [
+            {
+                "device": "eth0",
+                "type": "ethernet",
+                "state": "connected",
+                "connection": "netplan-eth0",
+            },
+            {
+                "device": "wlan0",
+                "type": "wifi",
+                "state": "connected",
+                "connection": "netplan-wlan0-Home",
+            },
+            {"device": "lo", "type": "loopback", "state": "unmanaged", "connection": None},
+        ]
+        self.networks = networks or [
+            _network("Home", "2437 MHz", "70", "WPA2", in_use=True),
+            _network("Office", "5180 MHz", "55", "WPA2"),
+            _network("Guest", "2412 MHz", "40", ""),
+        ]
+
+    async def _delay(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def _device(self, device: str) -> dict | None:
+        return next((d for d in self.devices if d["device"] == device), None)
+
+    async def device_status(self):
+        await self._delay()
+        return [dict(d) for d in self.devices]
+
+    async def wifi_networks(self):
+        await self._delay()
+        return [dict(n) for n in self.networks]
+
+    async def connection_up(self, device, connection):
+        await self._delay()
+        entry = self._device(device)
+        if entry is None:
+            return False
+        entry.update(state="connected", connection=connection)
+        if entry["type"] == "wifi":
+            ssid = connection.removeprefix(f"netplan-{device}-")
+            for network in self.networks:
+                network["in_use"] = network["ssid"] == ssid
+        return True
+
+    async def device_disconnect(self, device):
+        await self._delay()
+        entry = self._device(device)
+        if entry is None:
+            return False
+        entry.update(state="disconnected", connection=None)
+        if entry["type"] == "wifi":
+            for network in self.networks:
+                network["in_use"] = False
+        return True
+
+
+NM_BACKENDS = {
+    NmcliBackend.name: NmcliBackend,
+    DBusBackend.name: DBusBackend,
+    SimulatedBackend.name: SimulatedBackend,
+}
+
+
+@lru_cache()
+def get_nm_backend() -> NMBackend:
+    """
+    Драйвер по settings.nm_backend (вызывается при старте приложения).
+
+    :raises RuntimeError: NM_BACKEND=dbus, но jeepney не установлен.
+    """
+    name = settings.nm_backend
+    if name not in NM_BACKENDS:
+        logger.error(f"Unknown NM_BACKEND '{name}', using nmcli")
+        name = NmcliBackend.name
+    if name == DBusBackend.name and open_dbus_router is None:
+        raise RuntimeError(
+            "NM_BACKEND=dbus requires jeepney: pip install -r requirements-dbus.txt"
+        )
+    logger.info(f"NetworkManager backend: {name}")
+    return NM_BACKENDS[name]()
@@ -1,8 +1,14 @@
 import os
 import subprocess
 import time
+from typing import Callable, NamedTuple
 
-from core.log import logger
+from core.config import settings
+from core.log import get_logger
+from core.metrics import APPLY_PHASE_SECONDS
+from utils.sysfs_utils import iface_exists, iface_is_up, iface_master
+
+logger = get_logger(__name__)
 
 
 def delayed_reboot():
@@ -23,30 +29,164 @@ def delayed_shutdown():
         logger.error(f"error = {str(e)}")
 
 
-def delayed_netplan_change():
-    try:
-        subprocess.run(["sync"], check=True)
-        time.sleep(1)
-        subprocess.run(["sudo", "netplan", "generate"], check=True)
-        time.sleep(1)
-        subprocess.run(["sudo", "netplan", "apply"], check=True)
-        logger.info("Netplan configuration applied successfully.")
+NETPLAN_GENERATE = ["sudo", "netplan", "generate"]
+NETPLAN_APPLY = ["sudo", "netplan", "apply"]
 
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Error applying netplan configuration: {str(e)}")
+VPN_TAP = "tap0"
+VPN_BRIDGE = "br0"
 
 
-def delayed_vpn_server_change():
-    try:
-        os.system("sync")  # Synchronize cached writes to persistent storage
+class Stage(NamedTuple):
+    """
+    Шаг конвейера: команда и/или условие готовности.
 
-        time.sleep(1)
-        os.system("service openvpn@server restart")
+    Шаг завершается, когда команда вышла и ready() вернул True; на всё
+    вместе отводится timeout секунд (None - settings.apply_phase_timeout).
+    """
 
-        time.sleep(3)
-        os.system("brctl addif br0 tap0")
+    name: str
+    cmd: list[str] | None = None
+    ready: Callable[[], bool] | None = None
+    timeout: float | None = None
+
+
+class StageFailed(subprocess.CalledProcessError):
+    """Команда шага завершилась с ошибкой; stderr команды - в тексте ошибки."""
+
+    def __str__(self):
+        stderr = (self.stderr or "").strip()
+        return f"{super().__str__()} {stderr}" if stderr else super().__str__()
+
+
+class StageTimeout(subprocess.SubprocessError):
+    def __init__(self, stage: str, timeout: float):
+        super().__init__(f"Stage {stage} not ready after {timeout}s")
+        self.stage = stage
+        self.timeout = timeout
+
+
+def wait_until(ready: Callable[[], bool], deadline: float, stage: str, timeout: float):
+    """
+    Опрашивает ready() до True (с нарастающим интервалом, от 10 мс).
+
+    :raises StageTimeout: если deadline (time.monotonic) прошёл.
+    """
+    interval = 0.01
+    while not ready():
+        left = deadline - time.monotonic()
+        if left <= 0:
+            raise StageTimeout(stage, timeout)
+        time.sleep(min(interval, left))
+        interval = min(interval * 2, settings.readiness_poll_interval)
+
+
+def run_phases(phases, timings: dict | None = None):
+    """
+    Выполняет шаги по очереди: следующий начинается, как только готов
+    предыдущий, без фиксированных пауз.
 
-        time.sleep(1)
-        os.system("ifconfig tap0 0.0.0.0 promisc up")
+    :param phases: Список Stage или кортежей (phase, cmd); для шагов вида
+        "nm_up:wlan0" метрика пишется по части до двоеточия.
+    :param timings: Словарь, в который записывается длительность каждого шага (сек).
+    :raises StageFailed: если одна из команд завершилась с ошибкой.
+    :raises subprocess.TimeoutExpired, StageTimeout: если шаг не уложился в timeout.
+    """
+    for phase in phases:
+        stage = Stage(*phase)
+        timeout = stage.timeout or settings.apply_phase_timeout
+        started = time.monotonic()
+        try:
+            if stage.cmd:
+                # Вывод команд (nmcli, netplan) - в лог, а не в stdout воркера
+                result = subprocess.run(
+                    stage.cmd, capture_output=True, text=True, timeout=timeout
+                )
+                if result.returncode != 0:
+                    logger.error(
+                        f"Stage {stage.name} failed with exit status "
+                        f"{result.returncode}: {result.stderr.strip()}"
+                    )
+                    raise StageFailed(
+                        result.returncode, stage.cmd, result.stdout, result.stderr
+                    )
+                if result.stdout.strip():
+                    logger.debug(f"Stage {stage.name}: {result.stdout.strip()}")
+            if stage.ready is not None:
+                wait_until(stage.ready, started + timeout, stage.name, timeout)
+        finally:
+            elapsed = time.monotonic() - started
+            APPLY_PHASE_SECONDS.labels(phase=stage.name.split(":")[0]).observe(elapsed)
+            if timings is not None:
+                timings[stage.name] = round(elapsed, 3)
+            logger.debug(f"Stage {stage.name} finished in {elapsed:.3f}s")
+
+
+def links_ready(links) -> bool:
+    """Все интерфейсы links есть в системе и подняты (IFF_UP)."""
+    return all(iface_exists(link) and iface_is_up(link) for link in links)
+
+
+def netplan_apply_stages(links=()) -> list[Stage]:
+    """
+    netplan generate и netplan apply. Конфигурации пишутся через
+    utils.file_utils.atomic_write (fsync файла и каталога), поэтому
+    общесистемный sync перед generate не нужен. apply завершается, когда
+    интерфейсы links (изменённые) появились и подняты.
+    """
+    return [
+        Stage("generate", NETPLAN_GENERATE),
+        Stage("apply", NETPLAN_APPLY, (lambda: links_ready(links)) if links else None),
+    ]
+
+
+def run_netplan_apply(timings: dict | None = None, links=()):
+    """
+    Выполняет netplan generate и netplan apply.
+
+    :param timings: Словарь, в который записывается длительность каждой фазы (сек).
+    :param links: Интерфейсы, готовности которых ждёт шаг apply.
+    :raises subprocess.SubprocessError: если одна из команд завершилась с
+        ошибкой или не уложилась в timeout.
+    """
+    run_phases(netplan_apply_stages(links), timings)
+
+
+def vpn_server_stages() -> list[Stage]:
+    """
+    Перезапуск OpenVPN и включение tap-интерфейса в мост: каждый шаг ждёт
+    наблюдаемого результата предыдущего (tap создан, включён в br0, поднят).
+    """
+    timeout = settings.vpn_tap_timeout
+    return [
+        # Запись кэшированных данных на диск; sync выходит, когда они записаны
+        Stage("sync", ["sync"]),
+        # service ... restart возвращается после перезапуска юнита, а tap0
+        # OpenVPN создаёт чуть позже
+        Stage(
+            "openvpn_restart",
+            ["service", "openvpn@server", "restart"],
+            lambda: iface_exists(VPN_TAP),
+            timeout,
+        ),
+        Stage(
+            "bridge_addif",
+            ["brctl", "addif", VPN_BRIDGE, VPN_TAP],
+            lambda: iface_master(VPN_TAP) == VPN_BRIDGE,
+            timeout,
+        ),
+        Stage(
+            "tap_up",
+            ["ifconfig", VPN_TAP, "0.0.0.0", "promisc", "up"],
+            lambda: iface_is_up(VPN_TAP),
+            timeout,
+        ),
+    ]
+
+
+def delayed_vpn_server_change():
+    timings = {}
+    try:
+        run_phases(vpn_server_stages(), timings)
+        logger.info(f"VPN server restarted: {timings}")
     except Exception as e:
-        logger.error(f"error = {str(e)}")
+        logger.error(f"error = {str(e)}, stages = {timings}")
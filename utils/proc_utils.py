@@ -0,0 +1,25 @@
+# utils/proc_utils.py
+
+import os
+
+# Поля /proc/<pid>/status в килобайтах
+MEMORY_FIELDS = ("VmRSS", "VmHWM", "VmSize", "RssAnon", "RssFile")
+
+
+def read_memory_status(pid: int | str = "self") -> dict | None:
+    """
+    Память процесса из /proc/<pid>/status в байтах (VmRSS, VmHWM - пиковый RSS...).
+
+    :return: Словарь полей или None, если процесса нет.
+    """
+    try:
+        with open(os.path.join("/proc", str(pid), "status"), "r") as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+    memory = {}
+    for line in lines:
+        name, _, value = line.partition(":")
+        if name in MEMORY_FIELDS:
+            memory[name] = int(value.split()[0]) * 1024
+    return memory
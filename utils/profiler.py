@@ -0,0 +1,158 @@
+# utils/profiler.py
+# Семплирующий профилировщик: отдельный поток периодически снимает стеки
+# всех потоков процесса через sys._current_frames(). Накладные расходы
+# определяются только частотой семплирования, код приложения не трогается.
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+
+# 10 мс: и для профиля по времени, и для отдельных запросов
+DEFAULT_INTERVAL = 0.01
+
+
+@lru_cache(maxsize=4096)
+def _short_filename(filename: str) -> str:
+    # Пути относительно проекта/site-packages короче и не раскрывают структуру ФС
+    for prefix in sys.path:
+        if prefix and filename.startswith(prefix + os.sep):
+            return filename[len(prefix) + 1 :]
+    return filename
+
+
+class SamplingProfiler:
+    """
+    Собирает свёрнутые стеки (от корня к листу) с подсчётом числа семплов.
+
+    :param interval: Период семплирования в секундах.
+    :param thread_ids: Потоки, которые нужно семплировать (None - все).
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, thread_ids=None):
+        self.interval = interval
+        self.thread_ids = set(thread_ids) if thread_ids else None
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at: float | None = None
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._exclude: set[int] = set()
+        # Подписи кадров и имена потоков считаются один раз за профиль
+        self._labels: dict = {}
+        self._names: dict[int, str] = {}
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = (
+                f"{code.co_qualname} "
+                f"({_short_filename(code.co_filename)}:{code.co_firstlineno})"
+            )
+        return label
+
+    def _thread_name(self, thread_id: int) -> str:
+        name = self._names.get(thread_id)
+        if name is None:
+            # threading.enumerate() - только когда появился новый поток
+            self._names = {t.ident: t.name for t in threading.enumerate()}
+            name = self._names.setdefault(thread_id, str(thread_id))
+        return name
+
+    def sample(self):
+        own = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own or thread_id in self._exclude:
+                continue
+            if self.thread_ids is not None and thread_id not in self.thread_ids:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.append(f"thread {self._thread_name(thread_id)}")
+            self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(
+            target=self._run, name="sampling-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self._started
+
+    def run_for(self, seconds: float):
+        """Блокирующее профилирование текущего процесса в течение seconds."""
+        # Поток, который просто ждёт окончания профилирования, не интересен
+        self._exclude.add(threading.get_ident())
+        self.start()
+        time.sleep(seconds)
+        self.stop()
+
+    def result(self, name: str) -> dict:
+        return {
+            "name": name,
+            "started_at": self.started_at,
+            "duration": round(self.duration, 3),
+            "interval": self.interval,
+            "samples": self.samples,
+            "stacks": dict(self.stacks),
+        }
+
+
+def to_collapsed(result: dict) -> str:
+    """Формат collapsed stacks (flamegraph.pl, speedscope, inferno)."""
+    lines = [
+        f"{stack} {count}"
+        for stack, count in sorted(result["stacks"].items(), key=lambda i: -i[1])
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def to_speedscope(result: dict) -> dict:
+    """Формат speedscope (https://www.speedscope.app), профиль типа sampled."""
+    frames = []
+    frame_index = {}
+    samples = []
+    weights = []
+    for stack, count in result["stacks"].items():
+        indexes = []
+        for label in stack.split(";"):
+            if label not in frame_index:
+                frame_index[label] = len(frames)
+                frames.append({"name": label})
+            indexes.append(frame_index[label])
+        samples.append(indexes)
+        weights.append(count * result["interval"])
+
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": [
+            {
+                "type": "sampled",
+                "name": result["name"],
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }
+        ],
+        "name": result["name"],
+        "exporter": "netplan_api",
+    }
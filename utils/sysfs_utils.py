@@ -0,0 +1,107 @@
+# utils/sysfs_utils.py
+
+import os
+
+from core.config import settings
+
+STAT_COUNTERS = (
+    "rx_bytes",
+    "tx_bytes",
+    "rx_packets",
+    "tx_packets",
+    "rx_errors",
+    "tx_errors",
+    "rx_dropped",
+    "tx_dropped",
+)
+IFF_UP = 0x1
+
+
+def _read(path: str) -> str | None:
+    """Читает значение sysfs; None, если атрибут недоступен (например, speed у down-интерфейса)."""
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _read_int(path: str) -> int | None:
+    value = _read(path)
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def list_ifaces() -> list[str]:
+    try:
+        return sorted(os.listdir(settings.sys_class_net))
+    except OSError:
+        return []
+
+
+def read_operstate(iface: str) -> str:
+    """
+    Возвращает operstate интерфейса (up, down, dormant, unknown...).
+
+    :raises FileNotFoundError: если интерфейса нет.
+    """
+    with open(os.path.join(settings.sys_class_net, iface, "operstate"), "r") as f:
+        return f.read().strip()
+
+
+def iface_exists(iface: str) -> bool:
+    return os.path.exists(os.path.join(settings.sys_class_net, iface))
+
+
+def link_addresses() -> dict[str, str]:
+    """MAC-адреса интерфейсов: {mac (нижний регистр): iface}."""
+    result = {}
+    for iface in list_ifaces():
+        address = _read(os.path.join(settings.sys_class_net, iface, "address"))
+        if address:
+            result.setdefault(address.lower(), iface)
+    return result
+
+
+def iface_is_up(iface: str) -> bool:
+    """Интерфейс поднят административно (флаг IFF_UP), независимо от carrier."""
+    flags = _read(os.path.join(settings.sys_class_net, iface, "flags"))
+    try:
+        return flags is not None and bool(int(flags, 16) & IFF_UP)
+    except ValueError:
+        return False
+
+
+def iface_master(iface: str) -> str | None:
+    """Bridge/bond, в который включён интерфейс, или None."""
+    try:
+        return os.path.basename(
+            os.readlink(os.path.join(settings.sys_class_net, iface, "master"))
+        )
+    except OSError:
+        return None
+
+
+def read_iface_stats(iface: str) -> dict | None:
+    """
+    Состояние и счётчики интерфейса из /sys/class/net/<iface> без запуска процессов.
+
+    :return: Словарь со state/carrier/speed и счётчиками statistics/* или None,
+        если интерфейса нет.
+    """
+    base = os.path.join(settings.sys_class_net, iface)
+    operstate = _read(os.path.join(base, "operstate"))
+    if operstate is None:
+        return None
+    speed = _read_int(os.path.join(base, "speed"))
+    stats = {
+        "operstate": operstate,
+        "carrier": _read_int(os.path.join(base, "carrier")),
+        # -1 или отсутствие значения - скорость неизвестна
+        "speed": speed if speed is not None and speed >= 0 else None,
+    }
+    for counter in STAT_COUNTERS:
+        stats[counter] = _read_int(os.path.join(base, "statistics", counter))
+    return stats